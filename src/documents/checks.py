@@ -54,3 +54,42 @@ def parser_check(app_configs, **kwargs):
                       "able to consume any documents without parsers.")]
     else:
         return []
+
+
+@register()
+def thumbnail_format_check(app_configs, **kwargs):
+
+    from documents.models import Document
+
+    formats = [f for f, name in Document.THUMBNAIL_FORMATS]
+    if settings.THUMBNAIL_FORMAT not in formats:
+        return [Error(
+            f"PAPERLESS_THUMBNAIL_FORMAT {settings.THUMBNAIL_FORMAT} is not "
+            f"supported. Use one of {', '.join(formats)}."
+        )]
+
+    if settings.THUMBNAIL_FORMAT == Document.THUMBNAIL_FORMAT_WEBP:
+        from PIL import features
+        if not features.check("webp"):
+            return [Error(
+                "PAPERLESS_THUMBNAIL_FORMAT is webp, but Pillow was built "
+                "without WebP support."
+            )]
+
+    return []
+
+
+@register()
+def file_placement_check(app_configs, **kwargs):
+
+    from documents.file_handling import PLACEMENT_AUTO, PLACEMENT_COPY
+
+    modes = [PLACEMENT_AUTO, PLACEMENT_COPY]
+    if settings.CONSUMER_FILE_PLACEMENT not in modes:
+        return [Error(
+            f"PAPERLESS_CONSUMER_FILE_PLACEMENT "
+            f"{settings.CONSUMER_FILE_PLACEMENT} is not supported. Use one of "
+            f"{', '.join(modes)}."
+        )]
+
+    return []
@@ -4,6 +4,7 @@ import os
 import pickle
 import re
 import shutil
+import threading
 
 from django.conf import settings
 
@@ -27,7 +28,35 @@ def preprocess_content(content):
     return content
 
 
-def load_classifier():
+# The most recently loaded classifier of this process along with the state of
+# the model file it was loaded from. Loading the model is expensive, so it is
+# only reloaded once the model file changes, i.e., after training.
+_cached_classifier = None
+_cached_classifier_key = None
+_cached_classifier_lock = threading.Lock()
+
+
+def _get_model_file_key():
+    stat = os.stat(settings.MODEL_FILE)
+    return (settings.MODEL_FILE,
+            stat.st_mtime_ns,
+            stat.st_size,
+            DocumentClassifier.FORMAT_VERSION)
+
+
+def _set_cached_classifier(classifier, key):
+    global _cached_classifier, _cached_classifier_key
+    _cached_classifier = classifier
+    _cached_classifier_key = key if classifier else None
+
+
+def load_classifier(use_cache=True):
+    """
+    Returns the document classifier, or None if there is no usable model.
+
+    Unless use_cache is False, the classifier is shared by all callers in this
+    process and must not be modified.
+    """
     if not os.path.isfile(settings.MODEL_FILE):
         logger.debug(
             f"Document classification model does not exist (yet), not "
@@ -35,6 +64,25 @@ def load_classifier():
         )
         return None
 
+    if not use_cache:
+        return _load_classifier()
+
+    with _cached_classifier_lock:
+        try:
+            key = _get_model_file_key()
+        except OSError:
+            # Model file deleted in the meantime.
+            return None
+
+        if key == _cached_classifier_key:
+            return _cached_classifier
+
+        classifier = _load_classifier()
+        _set_cached_classifier(classifier, key)
+        return classifier
+
+
+def _load_classifier():
     classifier = DocumentClassifier()
     try:
         classifier.load()
@@ -115,6 +163,10 @@ class DocumentClassifier(object):
             os.unlink(target_file)
         shutil.move(target_file_temp, target_file)
 
+        # This is the most recent model, no need to load it again.
+        with _cached_classifier_lock:
+            _set_cached_classifier(self, _get_model_file_key())
+
     def train(self):
 
         data = list()
@@ -1,25 +1,27 @@
 import datetime
-import hashlib
 import os
 import uuid
 from subprocess import Popen
 
 import magic
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Q
 from django.utils import timezone
+from django_q.tasks import async_task
 from filelock import FileLock
 from rest_framework.reverse import reverse
 
 from .classifier import load_classifier
 from .file_handling import create_source_path_directory, \
-    generate_unique_filename
+    generate_unique_filename, calculate_checksum, place_file
+from .journal import get_enqueue_journal
 from .loggers import LoggingMixin
-from .models import Document, FileInfo, Correspondent, DocumentType, Tag
-from .parsers import ParseError, get_parser_class_for_mime_type, parse_date
+from .models import Document, FileInfo, Correspondent, DocumentType, Tag, \
+    ProcessingRecord
+from .parsers import ParseError, get_parser_class_for_mime_type, \
+    get_thumbnail_format, is_thumbnail_optimisation_deferred, parse_date
+from .profiling import StageProfiler
+from .progress import FINAL_STATES, get_progress_publisher
 from .signals import (
     document_consumption_finished,
     document_consumption_started
@@ -44,6 +46,14 @@ MESSAGE_PARSE_DATE = "parse_date"
 MESSAGE_SAVE_DOCUMENT = "save_document"
 MESSAGE_FINISHED = "finished"
 
+# Stages of consumption that are not reported to the user but recorded in the
+# processing record of the document.
+STAGE_PRE_CHECKS = "pre_checks"
+STAGE_LOAD_CLASSIFIER = "load_classifier"
+
+# Seconds to wait for the final progress update of a document to be sent.
+PROGRESS_FLUSH_TIMEOUT = 10
+
 
 class Consumer(LoggingMixin):
 
@@ -60,17 +70,24 @@ class Consumer(LoggingMixin):
             'message': message,
             'document_id': document_id
         }
-        async_to_sync(self.channel_layer.group_send)("status_updates",
-                                                     {'type': 'status_update',
-                                                      'data': payload})
+        self.progress_publisher.publish(payload)
+        if status in FINAL_STATES:
+            # Don't let the worker exit before the final state is delivered.
+            self.progress_publisher.flush(timeout=PROGRESS_FLUSH_TIMEOUT)
 
     def _fail(self, message, log_message=None, exc_info=None):
         self._send_progress(100, 100, 'FAILED', message)
         self.log("error", log_message or message, exc_info=exc_info)
         raise ConsumerError(f"{self.filename}: {log_message or message}")
 
-    def __init__(self):
+    def __init__(self, classifier=None, matching_snapshot=None,
+                 index_writer=None):
         super().__init__()
+        # These may be shared by several documents consumed in a row, see
+        # documents.tasks.consume_files.
+        self.classifier = classifier
+        self.matching_snapshot = matching_snapshot
+        self.index_writer = index_writer
         self.path = None
         self.filename = None
         self.override_title = None
@@ -78,8 +95,10 @@ class Consumer(LoggingMixin):
         self.override_tag_ids = None
         self.override_document_type_id = None
         self.task_id = None
+        self.checksum = None
+        self.profiler = None
 
-        self.channel_layer = get_channel_layer()
+        self.progress_publisher = get_progress_publisher()
 
     def pre_check_file_exists(self):
         if not os.path.isfile(self.path):
@@ -89,9 +108,10 @@ class Consumer(LoggingMixin):
             )
 
     def pre_check_duplicate(self):
-        with open(self.path, "rb") as f:
-            checksum = hashlib.md5(f.read()).hexdigest()
-        if Document.objects.filter(Q(checksum=checksum) | Q(archive_checksum=checksum)).exists():  # NOQA: E501
+        # The checksum is computed exactly once here and reused when the
+        # document is stored.
+        self.checksum = calculate_checksum(self.path)
+        if Document.objects.duplicates_of(self.checksum).exists():
             if settings.CONSUMER_DELETE_DUPLICATES:
                 os.unlink(self.path)
             self._fail(
@@ -127,6 +147,10 @@ class Consumer(LoggingMixin):
                 exc_info=True
             )
 
+        # The script may have modified the file.
+        if os.path.isfile(self.path):
+            self.checksum = calculate_checksum(self.path)
+
     def run_post_consume_script(self, document):
         if not settings.POST_CONSUME_SCRIPT:
             return
@@ -182,7 +206,17 @@ class Consumer(LoggingMixin):
         self.override_document_type_id = override_document_type_id
         self.override_tag_ids = override_tag_ids
         self.task_id = task_id or str(uuid.uuid4())
+        self.checksum = None
+        self.profiler = StageProfiler()
 
+        try:
+            return self._consume()
+        finally:
+            # Whatever happened, the file is not in the queue anymore. If it
+            # is still there, the consumer command may queue it again.
+            get_enqueue_journal().remove([path])
+
+    def _consume(self):
         self._send_progress(0, 100, 'STARTING', MESSAGE_NEW_FILE)
 
         # this is for grouping logging entries for this particular file
@@ -192,9 +226,10 @@ class Consumer(LoggingMixin):
 
         # Make sure that preconditions for consuming the file are met.
 
-        self.pre_check_file_exists()
-        self.pre_check_directories()
-        self.pre_check_duplicate()
+        with self.profiler.stage(STAGE_PRE_CHECKS):
+            self.pre_check_file_exists()
+            self.pre_check_directories()
+            self.pre_check_duplicate()
 
         self.log("info", f"Consuming {self.filename}")
 
@@ -229,6 +264,7 @@ class Consumer(LoggingMixin):
         # This doesn't parse the document yet, but gives us a parser.
 
         document_parser = parser_class(self.logging_group, progress_callback)
+        document_parser.checksum = self.checksum
 
         self.log("debug", f"Parser: {type(document_parser).__name__}")
 
@@ -241,25 +277,33 @@ class Consumer(LoggingMixin):
         date = None
         thumbnail = None
         archive_path = None
+        page_count = None
 
         try:
             self._send_progress(20, 100, 'WORKING', MESSAGE_PARSING_DOCUMENT)
             self.log("debug", "Parsing {}...".format(self.filename))
-            document_parser.parse(self.path, mime_type, self.filename)
+            with self.profiler.stage(MESSAGE_PARSING_DOCUMENT):
+                # If supported, the thumbnail is rendered while parsing.
+                document_parser.start_thumbnail(
+                    self.path, mime_type, self.filename)
+                document_parser.parse(self.path, mime_type, self.filename)
 
             self.log("debug", f"Generating thumbnail for {self.filename}...")
             self._send_progress(70, 100, 'WORKING',
                                 MESSAGE_GENERATING_THUMBNAIL)
-            thumbnail = document_parser.get_optimised_thumbnail(
-                self.path, mime_type, self.filename)
+            with self.profiler.stage(MESSAGE_GENERATING_THUMBNAIL):
+                thumbnail = document_parser.get_optimised_thumbnail(
+                    self.path, mime_type, self.filename)
 
             text = document_parser.get_text()
             date = document_parser.get_date()
             if not date:
                 self._send_progress(90, 100, 'WORKING',
                                     MESSAGE_PARSE_DATE)
-                date = parse_date(self.filename, text)
+                with self.profiler.stage(MESSAGE_PARSE_DATE):
+                    date = parse_date(self.filename, text)
             archive_path = document_parser.get_archive_path()
+            page_count = document_parser.get_page_count(self.path, mime_type)
 
         except ParseError as e:
             document_parser.cleanup()
@@ -275,13 +319,18 @@ class Consumer(LoggingMixin):
         #   reloading the classifier multiple times, since there are multiple
         #   post-consume hooks that all require the classifier.
 
-        classifier = load_classifier()
+        with self.profiler.stage(STAGE_LOAD_CLASSIFIER):
+            classifier = self.classifier or load_classifier()
+
+        original_size = os.stat(self.path).st_size
+        archive_size = None
 
         self._send_progress(95, 100, 'WORKING', MESSAGE_SAVE_DOCUMENT)
         # now that everything is done, we can start to store the document
         # in the system. This will be a transaction and reasonably fast.
         try:
-            with transaction.atomic():
+            with transaction.atomic(), \
+                    self.profiler.stage(MESSAGE_SAVE_DOCUMENT):
 
                 # store the document.
                 document = self._store(
@@ -297,7 +346,9 @@ class Consumer(LoggingMixin):
                     sender=self.__class__,
                     document=document,
                     logging_group=self.logging_group,
-                    classifier=classifier
+                    classifier=classifier,
+                    matching_snapshot=self.matching_snapshot,
+                    index_writer=self.index_writer
                 )
 
                 # After everything is in the database, copy the files into
@@ -307,10 +358,20 @@ class Consumer(LoggingMixin):
                     create_source_path_directory(document.source_path)
 
                     self._write(document.storage_type,
-                                self.path, document.source_path)
-
+                                self.path, document.source_path,
+                                allow_link=True)
+
+                    # Files that the parser created in its working
+                    # directory are deleted afterwards anyway, so we can
+                    # move them instead of copying.
+                    document.thumbnail_format = get_thumbnail_format(
+                        thumbnail)
+                    document.thumbnail_optimised = \
+                        not is_thumbnail_optimisation_deferred(thumbnail)
                     self._write(document.storage_type,
-                                thumbnail, document.thumbnail_path)
+                                thumbnail, document.thumbnail_path,
+                                allow_rename=self._is_in_directory(
+                                    thumbnail, document_parser.tempdir))
 
                     if archive_path and os.path.isfile(archive_path):
                         document.archive_filename = generate_unique_filename(
@@ -318,12 +379,15 @@ class Consumer(LoggingMixin):
                             archive_filename=True
                         )
                         create_source_path_directory(document.archive_path)
+                        # Hash before placing the file, since it might be
+                        # moved.
+                        document.archive_checksum = calculate_checksum(
+                            archive_path)
+                        archive_size = os.stat(archive_path).st_size
                         self._write(document.storage_type,
-                                    archive_path, document.archive_path)
-
-                        with open(archive_path, 'rb') as f:
-                            document.archive_checksum = hashlib.md5(
-                                f.read()).hexdigest()
+                                    archive_path, document.archive_path,
+                                    allow_rename=self._is_in_directory(
+                                        archive_path, document_parser.tempdir))
 
                 # Don't save with the lock active. Saving will cause the file
                 # renaming logic to aquire the lock as well.
@@ -352,6 +416,22 @@ class Consumer(LoggingMixin):
         finally:
             document_parser.cleanup()
 
+        if not document.thumbnail_optimised:
+            try:
+                async_task("documents.tasks.optimise_thumbnail", document.pk)
+            except Exception as e:
+                # document_thumbnail_optimizer picks it up later.
+                self.log("warning",
+                         f"Cannot queue thumbnail optimisation: {e}")
+
+        self._store_processing_record(
+            document,
+            parser=type(document_parser).__name__,
+            page_count=page_count,
+            original_size=original_size,
+            archive_size=archive_size
+        )
+
         self.run_post_consume_script(document)
 
         self.log(
@@ -378,16 +458,15 @@ class Consumer(LoggingMixin):
 
         storage_type = Document.STORAGE_TYPE_UNENCRYPTED
 
-        with open(self.path, "rb") as f:
-            document = Document.objects.create(
-                title=(self.override_title or file_info.title)[:127],
-                content=text,
-                mime_type=mime_type,
-                checksum=hashlib.md5(f.read()).hexdigest(),
-                created=created,
-                modified=created,
-                storage_type=storage_type
-            )
+        document = Document.objects.create(
+            title=(self.override_title or file_info.title)[:127],
+            content=text,
+            mime_type=mime_type,
+            checksum=self.checksum or calculate_checksum(self.path),
+            created=created,
+            modified=created,
+            storage_type=storage_type
+        )
 
         self.apply_overrides(document)
 
@@ -395,6 +474,24 @@ class Consumer(LoggingMixin):
 
         return document
 
+    def _store_processing_record(self, document, **kwargs):
+        self.log(
+            "debug",
+            f"Processing took {self.profiler.total_wall:.2f}s wall time, "
+            f"{self.profiler.total_cpu:.2f}s CPU time"
+        )
+        try:
+            ProcessingRecord.objects.create(
+                document=document,
+                stages=self.profiler.stages,
+                **kwargs
+            )
+        except Exception:
+            # This is purely informational and should never cause consumption
+            # to fail.
+            self.log("warning", "Unable to store processing record",
+                     exc_info=True)
+
     def apply_overrides(self, document):
         if self.override_correspondent_id:
             document.correspondent = Correspondent.objects.get(
@@ -408,7 +505,14 @@ class Consumer(LoggingMixin):
             for tag_id in self.override_tag_ids:
                 document.tags.add(Tag.objects.get(pk=tag_id))
 
-    def _write(self, storage_type, source, target):
-        with open(source, "rb") as read_file:
-            with open(target, "wb") as write_file:
-                write_file.write(read_file.read())
+    def _is_in_directory(self, path, directory):
+        path = os.path.abspath(path)
+        directory = os.path.abspath(directory)
+        return path.startswith(directory + os.path.sep)
+
+    def _write(self, storage_type, source, target, allow_rename=False,
+               allow_link=False):
+        method = place_file(source, target,
+                            allow_rename=allow_rename,
+                            allow_link=allow_link)
+        self.log("debug", f"Placed {source} at {target} ({method})")
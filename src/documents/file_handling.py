@@ -1,6 +1,10 @@
 import datetime
+import errno
+import hashlib
 import logging
 import os
+import shutil
+import stat
 from collections import defaultdict
 
 import pathvalidate
@@ -10,6 +14,10 @@ from django.template.defaultfilters import slugify
 
 logger = logging.getLogger("paperless.filehandling")
 
+# Files are hashed in chunks of this size so that consuming large scans does
+# not require the entire file in memory.
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
 
 class defaultdictNoStr(defaultdict):
 
@@ -17,6 +25,190 @@ class defaultdictNoStr(defaultdict):
         raise ValueError("Don't use {tags} directly.")
 
 
+def calculate_checksum(path, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """
+    Returns the MD5 checksum of the file at path, reading it in chunks of
+    chunk_size bytes.
+    """
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+PLACEMENT_AUTO = "auto"
+PLACEMENT_RENAME = "rename"
+PLACEMENT_LINK = "link"
+PLACEMENT_COPY = "copy"
+
+# Errors that indicate that a rename or hard link is not possible between
+# source and target, in which case we fall back to copying the file.
+_PLACEMENT_FALLBACK_ERRNOS = (
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EACCES,
+    errno.EEXIST,
+    errno.EMLINK,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+)
+
+
+def _fsync_directory(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _kernel_copy(source_fd, target_fd, size):
+    """
+    Copies size bytes from source_fd to target_fd without moving the data
+    through python, using copy_file_range or sendfile where available.
+    """
+    copy_file_range = getattr(os, "copy_file_range", None)
+    sendfile = getattr(os, "sendfile", None)
+    offset = 0
+
+    while offset < size:
+        if copy_file_range:
+            try:
+                copied = copy_file_range(source_fd, target_fd, size - offset)
+            except OSError:
+                # Not supported by this kernel or file system.
+                copy_file_range = None
+                continue
+        elif sendfile:
+            try:
+                copied = sendfile(target_fd, source_fd, offset, size - offset)
+            except OSError:
+                sendfile = None
+                continue
+        else:
+            os.lseek(source_fd, offset, os.SEEK_SET)
+            with open(source_fd, "rb", closefd=False) as fsrc, \
+                    open(target_fd, "wb", closefd=False) as fdst:
+                shutil.copyfileobj(fsrc, fdst, CHECKSUM_CHUNK_SIZE)
+            return
+
+        if copied == 0:
+            raise OSError(
+                f"Unexpected end of file after {offset} of {size} bytes, the "
+                f"file was truncated while copying")
+        offset += copied
+
+
+def copy_file(source, target, fsync=False):
+    """
+    Copies the contents of source to target in the kernel, so that the file
+    never has to be held in memory.
+    """
+    if os.path.exists(target) and os.path.samefile(source, target):
+        # Opening target for writing would truncate source as well.
+        raise shutil.SameFileError(
+            f"{source} and {target} are the same file")
+
+    with open(source, "rb") as fsrc:
+        try:
+            with open(target, "wb") as fdst:
+                _kernel_copy(fsrc.fileno(),
+                             fdst.fileno(),
+                             os.fstat(fsrc.fileno()).st_size)
+                if fsync:
+                    os.fsync(fdst.fileno())
+        except OSError:
+            # Don't leave an incomplete copy behind.
+            if os.path.isfile(target):
+                os.unlink(target)
+            raise
+
+
+def _can_link(source):
+    # The stored original must not share its inode with a file that others
+    # can still change, and its owner must be paperless.
+    try:
+        st = os.stat(source)
+    except OSError:
+        return False
+    return st.st_uid == os.geteuid() and st.st_nlink == 1
+
+
+def _link(source, target):
+    os.link(source, target)
+    # Files dropped into shares are often writable by everyone.
+    mode = stat.S_IMODE(os.stat(target).st_mode)
+    if mode & 0o022:
+        os.chmod(target, mode & ~0o022)
+
+
+def place_file(source, target, allow_rename=False, allow_link=False,
+               fsync=None):
+    """
+    Puts the file source at target using the cheapest method available and
+    returns the method that was used.
+
+    If allow_rename is True, source is moved to target. If allow_link is
+    True, source is left in place and a hard link to it is created at target,
+    if paperless owns source and nothing else links to it. Only consumed
+    originals may be linked, since they are deleted afterwards. If neither is
+    possible (i.e., source and target are on different file systems), or if
+    PAPERLESS_CONSUMER_FILE_PLACEMENT is set to copy, the file is copied.
+    """
+    if fsync is None:
+        fsync = settings.CONSUMER_FSYNC
+
+    method = None
+    if settings.CONSUMER_FILE_PLACEMENT != PLACEMENT_COPY:
+        if allow_rename:
+            method, place = PLACEMENT_RENAME, os.rename
+        elif allow_link and _can_link(source):
+            method, place = PLACEMENT_LINK, _link
+
+    if method:
+        try:
+            place(source, target)
+        except OSError as e:
+            if e.errno not in _PLACEMENT_FALLBACK_ERRNOS:
+                raise
+            logger.debug(
+                f"Cannot {method} {source} to {target}: {e}, copying instead")
+        else:
+            if fsync:
+                _fsync_directory(os.path.dirname(target))
+            return method
+
+    copy_file(source, target, fsync=fsync)
+    if fsync:
+        _fsync_directory(os.path.dirname(target))
+    return PLACEMENT_COPY
+
+
+def replace_thumbnail(doc, thumbnail):
+    """
+    Moves a new thumbnail of doc into place and sets doc.thumbnail_format to
+    its format. Since the file name of a thumbnail depends on its format, the
+    previous thumbnail is removed if it was stored in another format. The
+    caller saves the document.
+    """
+    from .parsers import get_thumbnail_format
+
+    old_path = doc.thumbnail_path
+    doc.thumbnail_format = get_thumbnail_format(thumbnail)
+    shutil.move(thumbnail, doc.thumbnail_path)
+    if os.path.normpath(old_path) != os.path.normpath(doc.thumbnail_path):
+        try:
+            os.unlink(old_path)
+        except FileNotFoundError:
+            pass
+
+
 def create_source_path_directory(source_path):
     os.makedirs(os.path.dirname(source_path), exist_ok=True)
 
@@ -81,6 +81,15 @@ class TitleContentFilter(Filter):
             return qs
 
 
+class ChecksumFilter(Filter):
+
+    def filter(self, qs, value):
+        if value:
+            return qs.duplicates_of(value.strip().lower())
+        else:
+            return qs
+
+
 class DocumentFilterSet(FilterSet):
 
     is_tagged = BooleanFilter(
@@ -98,6 +107,8 @@ class DocumentFilterSet(FilterSet):
 
     title_content = TitleContentFilter()
 
+    checksum = ChecksumFilter()
+
     class Meta:
         model = Document
         fields = {
@@ -0,0 +1,130 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from django.conf import settings
+
+logger = logging.getLogger("paperless.journal")
+
+# Entries older than this are ignored, in case their task got lost (i.e., when
+# the broker was reset) and the file would otherwise never be consumed.
+JOURNAL_EXPIRY = 24 * 60 * 60
+
+
+class EnqueueJournal:
+    """
+    Records which files of the consumption directory were added to the task
+    queue, along with their size and modification time. The consumer command
+    doesn't queue these files again, and the consumer removes them from the
+    journal once it is done with them, whether that succeeded or not.
+
+    This is an SQLite database, since it is shared by the consumer command and
+    the workers, which run in different processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        # The journal is only an optimisation, so losing the most recent
+        # changes on power loss is fine.
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS queued ("
+                "path TEXT PRIMARY KEY, "
+                "size INTEGER NOT NULL, "
+                "mtime REAL NOT NULL, "
+                "task_id TEXT, "
+                "created REAL NOT NULL)"
+            )
+            self._initialized = True
+        return connection
+
+    def _run(self, func, default=None):
+        # Consuming documents must not depend on the journal, so errors are
+        # only logged.
+        try:
+            with closing(self._connect()) as connection, connection:
+                return func(connection)
+        except sqlite3.Error as e:
+            logger.warning(
+                f"Error while accessing the enqueue journal {self.path}: {e}")
+            return default
+
+    def _stat(self, paths):
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+    def filter_queued(self, paths):
+        """
+        Return the paths that are not in the queue already. A file is in the
+        queue if it is in the journal and hasn't changed since.
+        """
+        paths = list(paths)
+        if not paths:
+            return paths
+
+        def queued_paths(connection):
+            now = time.time()
+            queued = set()
+            for path, size, mtime in self._stat(paths):
+                row = connection.execute(
+                    "SELECT size, mtime, created FROM queued WHERE path = ?",
+                    (path,)
+                ).fetchone()
+                if row and row[0] == size and row[1] == mtime and \
+                        now - row[2] < JOURNAL_EXPIRY:
+                    queued.add(path)
+            return queued
+
+        queued = self._run(queued_paths, default=set())
+
+        for path in queued:
+            logger.debug(f"Not consuming file {path}: It is queued already.")
+
+        return [path for path in paths if path not in queued]
+
+    def add(self, paths):
+        now = time.time()
+        self._run(lambda connection: connection.executemany(
+            "INSERT OR REPLACE INTO queued "
+            "(path, size, mtime, task_id, created) "
+            "VALUES (?, ?, ?, NULL, ?)",
+            [(path, size, mtime, now)
+             for path, size, mtime in self._stat(paths)]
+        ))
+
+    def set_task_id(self, paths, task_id):
+        self._run(lambda connection: connection.executemany(
+            "UPDATE queued SET task_id = ? WHERE path = ?",
+            [(task_id, path) for path in paths]
+        ))
+
+    def remove(self, paths):
+        self._run(lambda connection: connection.executemany(
+            "DELETE FROM queued WHERE path = ?",
+            [(path,) for path in paths]
+        ))
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_enqueue_journal():
+    with _journals_lock:
+        path = settings.CONSUMER_JOURNAL_FILE
+        if path not in _journals:
+            _journals[path] = EnqueueJournal(path)
+        return _journals[path]
@@ -1,4 +1,3 @@
-import hashlib
 import multiprocessing
 
 import logging
@@ -11,14 +10,16 @@ from django import db
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django_q.tasks import async_task
 from filelock import FileLock
 from whoosh.writing import AsyncWriter
 
 from documents.models import Document
 from ... import index
 from ...file_handling import create_source_path_directory, \
-    generate_unique_filename
-from ...parsers import get_parser_class_for_mime_type
+    generate_unique_filename, calculate_checksum, replace_thumbnail
+from ...parsers import get_parser_class_for_mime_type, \
+    get_thumbnail_format, is_thumbnail_optimisation_deferred
 
 
 logger = logging.getLogger("paperless.management.archiver")
@@ -37,6 +38,7 @@ def handle_document(document_id):
         return
 
     parser = parser_class(logging_group=uuid.uuid4())
+    parser.checksum = document.checksum
 
     try:
         parser.parse(
@@ -51,9 +53,9 @@ def handle_document(document_id):
         )
 
         if parser.get_archive_path():
+            optimised = not is_thumbnail_optimisation_deferred(thumbnail)
             with transaction.atomic():
-                with open(parser.get_archive_path(), 'rb') as f:
-                    checksum = hashlib.md5(f.read()).hexdigest()
+                checksum = calculate_checksum(parser.get_archive_path())
                 # I'm going to save first so that in case the file move
                 # fails, the database is rolled back.
                 # We also don't use save() since that triggers the filehandling
@@ -63,13 +65,24 @@ def handle_document(document_id):
                 Document.objects.filter(pk=document.pk).update(
                     archive_checksum=checksum,
                     content=parser.get_text(),
-                    archive_filename=document.archive_filename
+                    archive_filename=document.archive_filename,
+                    thumbnail_format=get_thumbnail_format(thumbnail),
+                    thumbnail_optimised=optimised
                 )
                 with FileLock(settings.MEDIA_LOCK):
                     create_source_path_directory(document.archive_path)
                     shutil.move(parser.get_archive_path(),
                                 document.archive_path)
-                    shutil.move(thumbnail, document.thumbnail_path)
+                    replace_thumbnail(document, thumbnail)
+
+            if not optimised:
+                try:
+                    async_task("documents.tasks.optimise_thumbnail",
+                               document.pk)
+                except Exception as e:
+                    # document_thumbnail_optimizer picks it up later.
+                    logger.warning(f"Cannot queue thumbnail optimisation "
+                                   f"for document {document}: {e}")
 
             with index.open_index_writer() as writer:
                 index.update_document(writer, document)
@@ -1,17 +1,23 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path, PurePath
-from threading import Thread
-from time import sleep
+from threading import Condition, Lock, Thread
+from time import monotonic
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django_q.brokers import get_broker
 from django_q.tasks import async_task
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers.polling import PollingObserver
 
-from documents.models import Tag
-from documents.parsers import is_file_ext_supported
+from documents.file_handling import calculate_checksum
+from documents.journal import get_enqueue_journal
+from documents.models import Document, Tag
+from documents.parsers import is_file_ext_supported, \
+    get_supported_file_extensions
 
 try:
     from inotifyrecursive import INotify, flags
@@ -20,20 +26,59 @@ except ImportError:
 
 logger = logging.getLogger("paperless.management.consumer")
 
+# Hashing is mostly bound by disk I/O, so a few threads are enough to keep the
+# disk busy without competing with the workers too much.
+_checksum_pool = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="paperless-checksum")
+
+# Number of threads that check whether files reported by the polling observer
+# remain unmodified.
+POLLING_WORKERS = 4
+
+# Files found in the consumption directory on startup are added to the task
+# queue in chunks of this size, with one round trip to the broker per chunk.
+ENQUEUE_CHUNK_SIZE = 500
+
+
+# Directory relative to CONSUMPTION_DIR, as a tuple of its parts -> tag ids of
+# that directory, mapped to the lower case names of the tags.
+_tag_cache = {}
+_tag_cache_lock = Lock()
+
 
 def _tags_from_path(filepath):
     """Walk up the directory tree from filepath to CONSUMPTION_DIR
        and get or create Tag IDs for every directory.
     """
-    tag_ids = set()
     path_parts = Path(filepath).relative_to(
                 settings.CONSUMPTION_DIR).parent.parts
+    if not path_parts:
+        return set()
+
+    with _tag_cache_lock:
+        cached = _tag_cache.get(path_parts)
+
+    if cached is not None:
+        # Tags may have been renamed or deleted since, possibly by another
+        # process. Checking that is a single query by primary key.
+        current = {
+            pk: name.lower() for pk, name in
+            Tag.objects.filter(pk__in=cached).values_list("pk", "name")
+        }
+        if current == cached:
+            return set(cached)
+
+    tags = {}
     for part in path_parts:
-        tag_ids.add(Tag.objects.get_or_create(name__iexact=part, defaults={
+        tag = Tag.objects.get_or_create(name__iexact=part, defaults={
             "name": part
-        })[0].pk)
+        })[0]
+        tags[tag.pk] = tag.name.lower()
+
+    with _tag_cache_lock:
+        _tag_cache[path_parts] = tags
 
-    return tag_ids
+    return set(tags)
 
 
 def _is_ignored(filepath: str) -> bool:
@@ -43,20 +88,60 @@ def _is_ignored(filepath: str) -> bool:
         filepath_relative.match(p) for p in settings.CONSUMER_IGNORE_PATTERNS)
 
 
-def _consume(filepath):
+def _is_consumable(filepath):
     if os.path.isdir(filepath) or _is_ignored(filepath):
-        return
+        return False
 
     if not os.path.isfile(filepath):
         logger.debug(
             f"Not consuming file {filepath}: File has moved.")
-        return
+        return False
 
     if not is_file_ext_supported(os.path.splitext(filepath)[1]):
         logger.warning(
             f"Not consuming file {filepath}: Unknown file extension.")
-        return
+        return False
+
+    return True
+
+
+def _checksum(filepath):
+    try:
+        return calculate_checksum(filepath)
+    except OSError as e:
+        # The consumer will deal with this file.
+        logger.debug(f"Could not calculate checksum of {filepath}: {e}")
+        return None
+
 
+def _reject_duplicates(filepaths):
+    """Return the files that are not already in paperless. Files are hashed
+       in a bounded thread pool, and duplicates are skipped or deleted before
+       any task is created for them.
+    """
+    if not settings.CONSUMER_PRECHECK_DUPLICATES:
+        return filepaths
+
+    result = []
+    for filepath, checksum in zip(filepaths,
+                                  _checksum_pool.map(_checksum, filepaths)):
+        if not checksum or \
+                not Document.objects.duplicates_of(checksum).exists():
+            result.append(filepath)
+        elif settings.CONSUMER_DELETE_DUPLICATES:
+            logger.info(f"Deleting file {filepath}: It is a duplicate.")
+            try:
+                os.unlink(filepath)
+            except OSError as e:
+                logger.warning(f"Could not delete {filepath}: {e}")
+        else:
+            logger.info(f"Not consuming file {filepath}: It is a duplicate.")
+
+    return result
+
+
+def _consume_args(filepath):
+    """Return the arguments of the consume_file task for filepath."""
     tag_ids = None
     try:
         if settings.CONSUMER_SUBDIRS_AS_TAGS:
@@ -64,12 +149,38 @@ def _consume(filepath):
     except Exception as e:
         logger.exception("Error creating tags from path")
 
+    return {
+        'path': filepath,
+        'override_tag_ids': tag_ids if tag_ids else None
+    }
+
+
+def _queue(paths, func, *args, **kwargs):
+    """Add a task for the files to the queue and record them in the enqueue
+       journal, so that they are not queued again.
+    """
+    journal = get_enqueue_journal()
+    journal.add(paths)
+    try:
+        task_id = async_task(func, *args, **kwargs)
+    except Exception:
+        journal.remove(paths)
+        raise
+    journal.set_task_id(paths, str(task_id))
+
+
+def _enqueue(args, broker=None):
+    filepath = args['path']
+    # async_task connects to the broker itself unless we give it one.
+    options = {'broker': broker} if broker else {}
     try:
         logger.info(f"Adding {filepath} to the task queue.")
-        async_task("documents.tasks.consume_file",
-                   filepath,
-                   override_tag_ids=tag_ids if tag_ids else None,
-                   task_name=os.path.basename(filepath)[:100])
+        _queue([filepath],
+               "documents.tasks.consume_file",
+               filepath,
+               override_tag_ids=args['override_tag_ids'],
+               task_name=os.path.basename(filepath)[:100],
+               **options)
     except Exception as e:
         # Catch all so that the consumer won't crash.
         # This is also what the test case is listening for to check for
@@ -77,41 +188,264 @@ def _consume(filepath):
         logger.exception("Error while consuming document")
 
 
-def _consume_wait_unmodified(file):
-    if _is_ignored(file):
+def _enqueue_batch(batch, broker=None):
+    if len(batch) == 1:
+        _enqueue(batch[0], broker)
         return
 
-    logger.debug(f"Waiting for file {file} to remain unmodified")
-    mtime = -1
-    current_try = 0
-    while current_try < settings.CONSUMER_POLLING_RETRY_COUNT:
+    options = {'broker': broker} if broker else {}
+    try:
+        logger.info(
+            f"Adding a batch of {len(batch)} files to the task queue.")
+        _queue([args['path'] for args in batch],
+               "documents.tasks.consume_files",
+               batch,
+               task_name=f"{len(batch)} files",
+               **options)
+    except Exception as e:
+        logger.exception("Error while consuming documents")
+
+
+def _consume(filepath):
+    if _is_consumable(filepath) and \
+            get_enqueue_journal().filter_queued([filepath]) and \
+            _reject_duplicates([filepath]):
+        _enqueue(_consume_args(filepath))
+
+
+def _scan(directory, recursive, stats):
+    """Yield the files in directory that can be consumed. Uses the file type
+       information of os.scandir, so that file systems which report it don't
+       need a stat call for every file.
+    """
+    extensions = get_supported_file_extensions()
+    directories = [directory]
+    while directories:
         try:
-            new_mtime = os.stat(file).st_mtime
-        except FileNotFoundError:
-            logger.debug(f"File {file} moved while waiting for it to remain "
-                         f"unmodified.")
-            return
-        if new_mtime == mtime:
-            _consume(file)
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if recursive and not entry.is_symlink():
+                            directories.append(entry.path)
+                        continue
+                    stats['scanned'] += 1
+                    if not entry.is_file() or _is_ignored(entry.path):
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() \
+                            not in extensions:
+                        logger.warning(
+                            f"Not consuming file {entry.path}: "
+                            f"Unknown file extension.")
+                        continue
+                    yield entry.path
+        except OSError as e:
+            logger.warning(f"Error while scanning directory: {e}")
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@contextmanager
+def _pipelined_broker():
+    """Yield a django-q broker that sends tasks to redis in a single round
+       trip when its execute() is called.
+    """
+    broker = get_broker()
+    connection = getattr(broker, "connection", None)
+    if not hasattr(connection, "pipeline"):
+        # Not a redis broker. Tasks are sent right away.
+        yield broker, lambda: None
+        return
+
+    broker.connection = connection.pipeline(transaction=False)
+    try:
+        yield broker, broker.connection.execute
+    finally:
+        broker.connection = connection
+
+
+def _consume_existing(directory, recursive):
+    """Add the files that are already in the consumption directory to the
+       task queue, in batches of CONSUMER_BATCH_SIZE.
+    """
+    journal = get_enqueue_journal()
+    stats = {'scanned': 0}
+    queued = 0
+    enqueue_time = 0.0
+    start = monotonic()
+
+    with _pipelined_broker() as (broker, execute):
+        for chunk in _chunked(_scan(directory, recursive, stats),
+                              ENQUEUE_CHUNK_SIZE):
+            chunk_start = monotonic()
+            files = [
+                _consume_args(f) for f in
+                _reject_duplicates(journal.filter_queued(chunk))
+            ]
+            for batch in _chunked(files, settings.CONSUMER_BATCH_SIZE):
+                _enqueue_batch(batch, broker)
+            try:
+                execute()
+            except Exception as e:
+                logger.exception("Error while adding files to the task queue")
+                journal.remove([args['path'] for args in files])
+            queued += len(files)
+            enqueue_time += monotonic() - chunk_start
+
+    total_time = monotonic() - start
+    scan_time = total_time - enqueue_time
+    if stats['scanned']:
+        logger.info(
+            f"Scanned {stats['scanned']} files in {scan_time:.2f}s "
+            f"({stats['scanned'] / max(scan_time, 0.001):.0f} files/s), "
+            f"added {queued} files to the task queue in {enqueue_time:.2f}s "
+            f"({queued / max(enqueue_time, 0.001):.0f} files/s).")
+
+
+class _PendingFile:
+
+    def __init__(self, due):
+        self.stat = None
+        self.tries = 0
+        self.due = due
+        self.checking = False
+        # Set if another event for the file arrived during a check.
+        self.renewed = False
+
+
+class PendingFiles:
+    """
+    Files that were reported by the polling observer and are waiting to
+    remain unmodified before they are consumed. A single scheduler thread
+    hands files that are due for a check to a bounded pool of workers, which
+    compare the current mtime and size of the file with the last ones seen.
+    """
+
+    def __init__(self, workers=POLLING_WORKERS):
+        self._condition = Condition()
+        self._files = {}
+        self._in_flight = 0
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="paperless-polling")
+        self._scheduler = Thread(
+            target=self._run, name="paperless-polling-scheduler", daemon=True)
+        self._scheduler.start()
+
+    @property
+    def pending(self):
+        with self._condition:
+            return len(self._files)
+
+    @property
+    def in_flight(self):
+        with self._condition:
+            return self._in_flight
+
+    def add(self, filepath):
+        if _is_ignored(filepath):
             return
-        mtime = new_mtime
-        sleep(settings.CONSUMER_POLLING_DELAY)
-        current_try += 1
 
-    logger.error(f"Timeout while waiting on file {file} to remain unmodified.")
+        with self._condition:
+            if filepath in self._files:
+                self._files[filepath].renewed = True
+                return
+            logger.debug(f"Waiting for file {filepath} to remain unmodified")
+            self._files[filepath] = _PendingFile(monotonic())
+            self._condition.notify_all()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._scheduler.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                now = monotonic()
+                due = [
+                    (filepath, f) for filepath, f in self._files.items()
+                    if not f.checking and f.due <= now
+                ]
+                for filepath, f in due:
+                    f.checking = True
+                    self._in_flight += 1
+                if not due:
+                    waiting = [
+                        f.due for f in self._files.values() if not f.checking]
+                    self._condition.wait(
+                        min(waiting) - now if waiting else None)
+                    continue
+
+            for filepath, f in due:
+                self._executor.submit(self._check, filepath, f)
+
+    def _check(self, filepath, f):
+        consume = False
+        try:
+            try:
+                st = os.stat(filepath)
+                stat = (st.st_mtime, st.st_size)
+            except FileNotFoundError:
+                logger.debug(f"File {filepath} moved while waiting for it to "
+                             f"remain unmodified.")
+                stat = None
+
+            with self._condition:
+                f.tries += 1
+                if stat is None:
+                    done = True
+                elif stat == f.stat:
+                    done = consume = True
+                elif f.tries >= settings.CONSUMER_POLLING_RETRY_COUNT:
+                    logger.error(f"Timeout while waiting on file {filepath} "
+                                 f"to remain unmodified.")
+                    done = True
+                else:
+                    done = False
+                    f.stat = stat
+                    f.due = monotonic() + settings.CONSUMER_POLLING_DELAY
+
+            if consume:
+                _consume(filepath)
+        except Exception:
+            logger.exception(f"Error while checking file {filepath}")
+            done = True
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                f.checking = False
+                if done:
+                    del self._files[filepath]
+                    if f.renewed and consume:
+                        # The file was replaced while it was consumed.
+                        self._files[filepath] = _PendingFile(monotonic())
+                f.renewed = False
+                self._condition.notify_all()
 
 
 class Handler(FileSystemEventHandler):
 
+    def __init__(self, pending_files):
+        self.pending_files = pending_files
+
     def on_created(self, event):
-        Thread(
-            target=_consume_wait_unmodified, args=(event.src_path,)
-        ).start()
+        self.pending_files.add(event.src_path)
 
     def on_moved(self, event):
-        Thread(
-            target=_consume_wait_unmodified, args=(event.dest_path,)
-        ).start()
+        self.pending_files.add(event.dest_path)
 
 
 class Command(BaseCommand):
@@ -151,14 +485,7 @@ class Command(BaseCommand):
             raise CommandError(
                 f"Consumption directory {directory} does not exist")
 
-        if recursive:
-            for dirpath, _, filenames in os.walk(directory):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    _consume(filepath)
-        else:
-            for entry in os.scandir(directory):
-                _consume(entry.path)
+        _consume_existing(directory, recursive)
 
         if options["oneshot"]:
             return
@@ -173,17 +500,27 @@ class Command(BaseCommand):
     def handle_polling(self, directory, recursive):
         logger.info(
             f"Polling directory for changes: {directory}")
+        pending_files = PendingFiles()
         self.observer = PollingObserver(timeout=settings.CONSUMER_POLLING)
-        self.observer.schedule(Handler(), directory, recursive=recursive)
+        self.observer.schedule(
+            Handler(pending_files), directory, recursive=recursive)
         self.observer.start()
+        last_report = None
         try:
             while self.observer.is_alive():
                 self.observer.join(1)
+                report = (pending_files.pending, pending_files.in_flight)
+                if report != last_report and report != (0, 0):
+                    logger.debug(
+                        f"{report[0]} file(s) waiting to remain unmodified, "
+                        f"{report[1]} check(s) in progress.")
+                last_report = report
                 if self.stop_flag:
                     self.observer.stop()
         except KeyboardInterrupt:
             self.observer.stop()
         self.observer.join()
+        pending_files.stop()
 
     def handle_inotify(self, directory, recursive):
         logger.info(
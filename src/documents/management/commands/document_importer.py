@@ -15,6 +15,7 @@ from documents.models import Document
 from documents.settings import EXPORTER_FILE_NAME, EXPORTER_THUMBNAIL_NAME, \
     EXPORTER_ARCHIVE_NAME
 from ...file_handling import create_source_path_directory
+from ...parsers import get_thumbnail_format
 from ...signals.handlers import update_filename_and_move_files
 
 
@@ -149,6 +150,8 @@ class Command(BaseCommand):
                 archive_path = None
 
             document.storage_type = Document.STORAGE_TYPE_UNENCRYPTED
+            # Exports of older versions don't record the thumbnail format.
+            document.thumbnail_format = get_thumbnail_format(thumbnail_path)
 
             with FileLock(settings.MEDIA_LOCK):
                 if os.path.isfile(document.source_path):
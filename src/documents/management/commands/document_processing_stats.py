@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from documents.models import ProcessingRecord
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    index = min(int(round(percentile / 100 * (len(values) - 1))),
+                len(values) - 1)
+    return values[index]
+
+
+class Command(BaseCommand):
+
+    help = """
+        Summarizes the time and resources that were spent on the individual
+        stages of consuming documents.
+    """.replace("    ", "")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            default=None,
+            type=int,
+            required=False,
+            help="Only include documents that were consumed within the "
+                 "specified number of days."
+        )
+
+    def handle(self, *args, **options):
+        records = ProcessingRecord.objects.all()
+        if options['days']:
+            records = records.filter(
+                created__gte=timezone.now() - timedelta(days=options['days']))
+
+        stages = {}
+        documents = 0
+        pages = 0
+        original_bytes = 0
+        archive_bytes = 0
+        wall_total = 0.0
+        cpu_total = 0.0
+
+        for record in records.iterator():
+            documents += 1
+            pages += record.page_count or 0
+            original_bytes += record.original_size or 0
+            archive_bytes += record.archive_size or 0
+            for name, stage in record.stages.items():
+                s = stages.setdefault(
+                    name, {"wall": [], "cpu": [], "rss": 0, "child_rss": 0})
+                s["wall"].append(stage["wall"])
+                s["cpu"].append(stage["cpu"])
+                s["rss"] = max(s["rss"], stage["rss"])
+                s["child_rss"] = max(
+                    s["child_rss"], stage.get("child_rss", 0))
+                wall_total += stage["wall"]
+                cpu_total += stage["cpu"]
+
+        if not documents:
+            self.stdout.write("No processing records found.")
+            return
+
+        self.stdout.write(
+            f"{'stage':<24}{'count':>8}{'wall mean':>12}{'wall p95':>12}"
+            f"{'wall total':>14}{'cpu mean':>12}{'rss':>12}"
+            f"{'child rss':>12}")
+        for name, s in sorted(stages.items(),
+                              key=lambda i: sum(i[1]["wall"]),
+                              reverse=True):
+            count = len(s["wall"])
+            self.stdout.write(
+                f"{name:<24}{count:>8}"
+                f"{sum(s['wall']) / count:>11.2f}s"
+                f"{_percentile(s['wall'], 95):>11.2f}s"
+                f"{sum(s['wall']):>13.1f}s"
+                f"{sum(s['cpu']) / count:>11.2f}s"
+                f"{s['rss'] / 1024 / 1024:>9.0f} MB"
+                f"{s['child_rss'] / 1024 / 1024:>9.0f} MB")
+
+        self.stdout.write("")
+        self.stdout.write(f"Documents: {documents}")
+        self.stdout.write(f"Pages: {pages}")
+        self.stdout.write(
+            f"Original size: {original_bytes / 1024 / 1024:.1f} MB, "
+            f"archive size: {archive_bytes / 1024 / 1024:.1f} MB")
+        self.stdout.write(
+            f"Wall time: {wall_total:.1f}s "
+            f"({wall_total / documents:.2f}s per document"
+            f"{f', {wall_total / pages:.2f}s per page' if pages else ''})")
+        self.stdout.write(
+            f"CPU time: {cpu_total:.1f}s "
+            f"({cpu_total / documents:.2f}s per document"
+            f"{f', {cpu_total / pages:.2f}s per page' if pages else ''})")
@@ -0,0 +1,106 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+
+import tqdm
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from filelock import FileLock
+
+from documents.models import Document
+from ...file_handling import replace_thumbnail
+from ...parsers import convert_thumbnail, is_thumbnail_optimisation_deferred
+
+
+def _convert_thumbnail(args):
+    document_id, thumbnail_format = args
+    document = Document.objects.get(id=document_id)
+
+    try:
+        with tempfile.TemporaryDirectory(dir=settings.SCRATCH_DIR) as tempdir:
+            thumbnail = os.path.join(tempdir, f"thumbnail.{thumbnail_format}")
+            convert_thumbnail(
+                document.thumbnail_path, thumbnail, thumbnail_format)
+
+            # documents.tasks.optimise_thumbnail swaps thumbnails under the
+            # same lock.
+            with FileLock(settings.MEDIA_LOCK), transaction.atomic():
+                # If moving the file fails, the database is rolled back.
+                Document.objects.filter(pk=document.pk).update(
+                    thumbnail_format=thumbnail_format,
+                    thumbnail_optimised=not is_thumbnail_optimisation_deferred(
+                        thumbnail))
+                replace_thumbnail(document, thumbnail)
+    except Exception as e:
+        return f"{document} (ID: {document_id}): {e}"
+
+    return None
+
+
+class Command(BaseCommand):
+
+    help = """
+        Converts the thumbnails of all documents to another format, using all
+        cores. Documents with thumbnails in that format already are skipped.
+        Encrypted documents are not supported, use decrypt_documents first.
+    """.replace("    ", "")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            default=None,
+            choices=[f for f, name in Document.THUMBNAIL_FORMATS],
+            help="The format to convert the thumbnails to. Defaults to "
+                 "PAPERLESS_THUMBNAIL_FORMAT."
+        )
+        parser.add_argument(
+            "--no-progress-bar",
+            default=False,
+            action="store_true",
+            help="If set, the progress bar will not be shown"
+        )
+
+    def handle(self, *args, **options):
+        logging.getLogger().handlers[0].level = logging.ERROR
+
+        thumbnail_format = options['format'] or settings.THUMBNAIL_FORMAT
+        if thumbnail_format not in dict(Document.THUMBNAIL_FORMATS):
+            raise CommandError(f"Unknown thumbnail format {thumbnail_format}")
+
+        documents = Document.objects.exclude(
+            thumbnail_format=thumbnail_format)
+        encrypted = documents.filter(
+            storage_type=Document.STORAGE_TYPE_GPG).count()
+        if encrypted:
+            self.stdout.write(self.style.WARNING(
+                f"Skipping {encrypted} encrypted documents"))
+
+        os.makedirs(settings.SCRATCH_DIR, exist_ok=True)
+
+        ids = list(documents.filter(
+            storage_type=Document.STORAGE_TYPE_UNENCRYPTED
+        ).values_list("id", flat=True))
+
+        # Note to future self: this prevents django from reusing database
+        # conncetions between processes, which is bad and does not work
+        # with postgres.
+        db.connections.close_all()
+
+        with multiprocessing.Pool() as pool:
+            errors = [e for e in tqdm.tqdm(
+                pool.imap_unordered(
+                    _convert_thumbnail,
+                    [(i, thumbnail_format) for i in ids]),
+                total=len(ids),
+                disable=options['no_progress_bar']
+            ) if e]
+
+        for error in errors:
+            self.stderr.write(f"Cannot convert thumbnail of {error}")
+
+        self.stdout.write(
+            f"Converted {len(ids) - len(errors)} of {len(ids)} thumbnails to "
+            f"{thumbnail_format}")
@@ -0,0 +1,60 @@
+import logging
+import multiprocessing
+
+import tqdm
+from django import db
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from ...tasks import optimise_thumbnail
+
+
+def _optimise_thumbnail(document_id):
+    try:
+        optimise_thumbnail(document_id)
+    except Exception as e:
+        return f"document {document_id}: {e}"
+    return None
+
+
+class Command(BaseCommand):
+
+    help = """
+        Optimizes all thumbnails that were stored without optimization while
+        PAPERLESS_OPTIMIZE_THUMBNAILS_DEFERRED is enabled, using all cores.
+        The background tasks of the consumer do this as well, so this is only
+        required if these didn't run.
+    """.replace("    ", "")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--no-progress-bar",
+            default=False,
+            action="store_true",
+            help="If set, the progress bar will not be shown"
+        )
+
+    def handle(self, *args, **options):
+        logging.getLogger().handlers[0].level = logging.ERROR
+
+        ids = list(Document.objects.filter(
+            thumbnail_optimised=False
+        ).values_list("id", flat=True))
+
+        # Note to future self: this prevents django from reusing database
+        # conncetions between processes, which is bad and does not work
+        # with postgres.
+        db.connections.close_all()
+
+        with multiprocessing.Pool() as pool:
+            errors = [e for e in tqdm.tqdm(
+                pool.imap_unordered(_optimise_thumbnail, ids),
+                total=len(ids),
+                disable=options['no_progress_bar']
+            ) if e]
+
+        for error in errors:
+            self.stderr.write(f"Cannot optimize thumbnail of {error}")
+
+        self.stdout.write(
+            f"Optimized {len(ids) - len(errors)} of {len(ids)} thumbnails")
@@ -1,13 +1,18 @@
 import logging
 import multiprocessing
-import shutil
 
 import tqdm
 from django import db
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django_q.tasks import async_task
+from filelock import FileLock
 
 from documents.models import Document
-from ...parsers import get_parser_class_for_mime_type
+from ...file_handling import replace_thumbnail
+from ...parsers import get_parser_class_for_mime_type, \
+    get_thumbnail_format, is_thumbnail_optimisation_deferred
 
 
 def _process_document(doc_in):
@@ -27,7 +32,23 @@ def _process_document(doc_in):
             document.get_public_filename()
         )
 
-        shutil.move(thumb, document.thumbnail_path)
+        optimised = not is_thumbnail_optimisation_deferred(thumb)
+
+        # documents.tasks.optimise_thumbnail swaps thumbnails under the same
+        # lock.
+        with FileLock(settings.MEDIA_LOCK), transaction.atomic():
+            # If moving the file fails, the database is rolled back.
+            Document.objects.filter(pk=document.pk).update(
+                thumbnail_format=get_thumbnail_format(thumb),
+                thumbnail_optimised=optimised)
+            replace_thumbnail(document, thumb)
+
+        if not optimised:
+            try:
+                async_task("documents.tasks.optimise_thumbnail", document.pk)
+            except Exception as e:
+                # document_thumbnail_optimizer picks it up later.
+                print(f"{document} Cannot queue thumbnail optimisation: {e}")
     finally:
         parser.cleanup()
 
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageChops, ImageStat
+
+import documents
+from documents.parsers import THUMBNAIL_ENGINES
+
+
+def _find_pdf_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    yield os.path.join(root, name)
+
+
+def _similarity(image_a, image_b):
+    # 1 minus the mean difference of all pixels, at the size of image_b.
+    with Image.open(image_a) as a, Image.open(image_b) as b:
+        a = a.convert("RGB").resize(b.size, Image.LANCZOS)
+        diff = ImageChops.difference(a, b.convert("RGB"))
+        return 1 - sum(ImageStat.Stat(diff).mean) / 3 / 255
+
+
+class Command(BaseCommand):
+
+    help = """
+        Compares the speed and output of the engines that render thumbnails
+        of PDF files. The thumbnails of every engine are compared to the
+        thumbnails of the first one.
+    """.replace("    ", "")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help="PDF files or directories with PDF files. Defaults to the "
+                 "sample documents of the test suite."
+        )
+        parser.add_argument(
+            "--engines",
+            default=",".join(THUMBNAIL_ENGINES),
+            help="Comma separated list of engines to compare."
+        )
+        parser.add_argument(
+            "--repeat",
+            default=1,
+            type=int,
+            help="Render the thumbnail of every file this many times."
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [os.path.join(
+            os.path.dirname(documents.__file__), "tests", "samples")]
+        files = list(_find_pdf_files(paths))
+        if not files:
+            raise CommandError("No PDF files found.")
+
+        names = [n.strip() for n in options['engines'].split(",")]
+        for name in names:
+            if name not in THUMBNAIL_ENGINES:
+                raise CommandError(f"Unknown engine {name}")
+
+        tempdir = tempfile.mkdtemp(prefix="paperless-thumbnails-")
+        try:
+            self._benchmark(files, names, options['repeat'], tempdir)
+        finally:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+    def _benchmark(self, files, names, repeat, tempdir):
+        results = {}
+        for name in names:
+            engine = THUMBNAIL_ENGINES[name]
+            thumbnails = {}
+            failed = 0
+            start = time.perf_counter()
+            for index, f in enumerate(files):
+                out_path = os.path.join(tempdir, f"{name}-{index:04d}.png")
+                try:
+                    for i in range(repeat):
+                        engine(f, out_path)
+                except Exception as e:
+                    self.stderr.write(f"{name}: {f}: {e}")
+                    failed += 1
+                    continue
+                thumbnails[f] = out_path
+            results[name] = {
+                'thumbnails': thumbnails,
+                'failed': failed,
+                'time': time.perf_counter() - start
+            }
+
+        reference = results[names[0]]['thumbnails']
+        self.stdout.write(f"{len(files)} files, repeated {repeat} times")
+        self.stdout.write(
+            f"{'engine':<14}{'failed':>8}{'time':>10}{'files/s':>10}"
+            f"{'KB/file':>10}{'similarity':>12}")
+        for name in names:
+            r = results[name]
+            thumbnails = r['thumbnails']
+            common = [f for f in thumbnails if f in reference]
+            similarity = sum(
+                _similarity(thumbnails[f], reference[f]) for f in common
+            ) / len(common) if common else 0.0
+            size = sum(
+                os.stat(t).st_size for t in thumbnails.values()
+            ) / len(thumbnails) if thumbnails else 0
+            elapsed = max(r['time'], 0.001)
+            self.stdout.write(
+                f"{name:<14}{r['failed']:>8}{r['time']:>9.2f}s"
+                f"{len(thumbnails) * repeat / elapsed:>10.1f}"
+                f"{size / 1024:>10.1f}{similarity:>12.3f}")
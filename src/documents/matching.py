@@ -15,39 +15,61 @@ def log_reason(matching_model, document, reason):
         f"{document} because {reason}")
 
 
-def match_correspondents(document, classifier):
+class MatchingSnapshot:
+    """
+    The matching models at a point in time. Consuming several documents in a
+    row can share a single snapshot instead of querying all correspondents,
+    document types and tags for every single document.
+    """
+
+    def __init__(self):
+        self.correspondents = list(Correspondent.objects.all())
+        self.document_types = list(DocumentType.objects.all())
+        self.tags = list(Tag.objects.all())
+
+
+def match_correspondents(document, classifier, snapshot=None):
     if classifier:
         pred_id = classifier.predict_correspondent(document.content)
     else:
         pred_id = None
 
-    correspondents = Correspondent.objects.all()
+    if snapshot is not None:
+        correspondents = snapshot.correspondents
+    else:
+        correspondents = Correspondent.objects.all()
 
     return list(filter(
         lambda o: matches(o, document) or o.pk == pred_id,
         correspondents))
 
 
-def match_document_types(document, classifier):
+def match_document_types(document, classifier, snapshot=None):
     if classifier:
         pred_id = classifier.predict_document_type(document.content)
     else:
         pred_id = None
 
-    document_types = DocumentType.objects.all()
+    if snapshot is not None:
+        document_types = snapshot.document_types
+    else:
+        document_types = DocumentType.objects.all()
 
     return list(filter(
         lambda o: matches(o, document) or o.pk == pred_id,
         document_types))
 
 
-def match_tags(document, classifier):
+def match_tags(document, classifier, snapshot=None):
     if classifier:
         predicted_tag_ids = classifier.predict_tags(document.content)
     else:
         predicted_tag_ids = []
 
-    tags = Tag.objects.all()
+    if snapshot is not None:
+        tags = snapshot.tags
+    else:
+        tags = Tag.objects.all()
 
     return list(filter(
         lambda o: matches(o, document) or o.pk in predicted_tag_ids,
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.4 on 2021-06-20 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '1016_auto_20210317_1351'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('parser', models.CharField(blank=True, max_length=256, verbose_name='parser')),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='page count')),
+                ('original_size', models.BigIntegerField(blank=True, help_text='Size of the original document in bytes.', null=True, verbose_name='original size')),
+                ('archive_size', models.BigIntegerField(blank=True, help_text='Size of the archived document in bytes.', null=True, verbose_name='archive size')),
+                ('stages', models.JSONField(default=dict, help_text='Wall time and CPU time in seconds and peak RSS in bytes of every processing stage.', verbose_name='stages')),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='processing_record', to='documents.document', verbose_name='document')),
+            ],
+            options={
+                'verbose_name': 'processing record',
+                'verbose_name_plural': 'processing records',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
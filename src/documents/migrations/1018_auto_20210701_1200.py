@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2021-07-01 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '1017_processingrecord'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='archive_checksum',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='The checksum of the archived document.', max_length=32, null=True, verbose_name='archive checksum'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2021-07-20 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '1018_auto_20210701_1200'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail_format',
+            field=models.CharField(choices=[('png', 'PNG'), ('webp', 'WebP')], default='png', editable=False, max_length=4, verbose_name='thumbnail format'),
+        ),
+    ]
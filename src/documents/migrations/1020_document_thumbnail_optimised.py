@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2021-07-24 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '1019_document_thumbnail_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail_optimised',
+            field=models.BooleanField(default=True, editable=False, help_text='False if the thumbnail is still to be optimised in the background.', verbose_name='thumbnail optimised'),
+        ),
+    ]
@@ -98,6 +98,21 @@ class DocumentType(MatchingModel):
         verbose_name_plural = _("document types")
 
 
+class DocumentQuerySet(models.QuerySet):
+
+    def duplicates_of(self, checksum):
+        """
+        Documents whose original or archived version has the given checksum.
+        Both columns are looked up on their own, so that each query uses its
+        index instead of the database scanning the table for the OR.
+        """
+        pks = set(self.model.objects.filter(
+            checksum=checksum).values_list("pk", flat=True))
+        pks.update(self.model.objects.filter(
+            archive_checksum=checksum).values_list("pk", flat=True))
+        return self.filter(pk__in=pks)
+
+
 class Document(models.Model):
 
     STORAGE_TYPE_UNENCRYPTED = "unencrypted"
@@ -107,6 +122,13 @@ class Document(models.Model):
         (STORAGE_TYPE_GPG, _("Encrypted with GNU Privacy Guard"))
     )
 
+    THUMBNAIL_FORMAT_PNG = "png"
+    THUMBNAIL_FORMAT_WEBP = "webp"
+    THUMBNAIL_FORMATS = (
+        (THUMBNAIL_FORMAT_PNG, _("PNG")),
+        (THUMBNAIL_FORMAT_WEBP, _("WebP"))
+    )
+
     correspondent = models.ForeignKey(
         Correspondent,
         blank=True,
@@ -161,6 +183,7 @@ class Document(models.Model):
         editable=False,
         blank=True,
         null=True,
+        db_index=True,
         help_text=_("The checksum of the archived document.")
     )
 
@@ -180,6 +203,22 @@ class Document(models.Model):
         editable=False
     )
 
+    thumbnail_format = models.CharField(
+        _("thumbnail format"),
+        max_length=4,
+        choices=THUMBNAIL_FORMATS,
+        default=THUMBNAIL_FORMAT_PNG,
+        editable=False
+    )
+
+    thumbnail_optimised = models.BooleanField(
+        _("thumbnail optimised"),
+        default=True,
+        editable=False,
+        help_text=_("False if the thumbnail is still to be optimised in the "
+                    "background.")
+    )
+
     added = models.DateTimeField(
         _("added"),
         default=timezone.now, editable=False, db_index=True)
@@ -214,6 +253,8 @@ class Document(models.Model):
                     "archive.")
     )
 
+    objects = DocumentQuerySet.as_manager()
+
     class Meta:
         ordering = ("-created",)
         verbose_name = _("document")
@@ -287,7 +328,7 @@ class Document(models.Model):
 
     @property
     def thumbnail_path(self):
-        file_name = "{:07}.png".format(self.pk)
+        file_name = "{:07}.{}".format(self.pk, self.thumbnail_format)
         if self.storage_type == self.STORAGE_TYPE_GPG:
             file_name += ".gpg"
 
@@ -301,6 +342,61 @@ class Document(models.Model):
         return open(self.thumbnail_path, "rb")
 
 
+class ProcessingRecord(models.Model):
+
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name="processing_record",
+        verbose_name=_("document")
+    )
+
+    created = models.DateTimeField(
+        _("created"),
+        default=timezone.now, editable=False, db_index=True)
+
+    parser = models.CharField(
+        _("parser"),
+        max_length=256,
+        blank=True
+    )
+
+    page_count = models.PositiveIntegerField(
+        _("page count"),
+        blank=True,
+        null=True
+    )
+
+    original_size = models.BigIntegerField(
+        _("original size"),
+        blank=True,
+        null=True,
+        help_text=_("Size of the original document in bytes.")
+    )
+
+    archive_size = models.BigIntegerField(
+        _("archive size"),
+        blank=True,
+        null=True,
+        help_text=_("Size of the archived document in bytes.")
+    )
+
+    stages = models.JSONField(
+        _("stages"),
+        default=dict,
+        help_text=_("Wall time and CPU time in seconds and peak RSS in bytes "
+                    "of every processing stage.")
+    )
+
+    class Meta:
+        ordering = ("-created",)
+        verbose_name = _("processing record")
+        verbose_name_plural = _("processing records")
+
+    def __str__(self):
+        return f"Processing record of document {self.document_id}"
+
+
 class Log(models.Model):
 
     LEVELS = (
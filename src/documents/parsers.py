@@ -5,8 +5,12 @@ import re
 import shutil
 import subprocess
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 import magic
+from django.apps import apps
 from django.conf import settings
 from django.utils import timezone
 
@@ -37,18 +41,93 @@ DATE_REGEX = re.compile(
 
 logger = logging.getLogger("paperless.parsing")
 
+# The time.monotonic() at which the task that is currently consuming
+# documents in this process times out, or None outside of tasks.
+_task_deadline = None
+
+
+def set_task_deadline(timeout):
+    """
+    Called by tasks that parse documents when they start, with the number of
+    seconds after which the task queue kills them.
+    """
+    global _task_deadline
+    _task_deadline = time.monotonic() + timeout
+
+
+def get_task_time_left():
+    """
+    Seconds until the current task times out, or None if not running in a
+    task.
+    """
+    if _task_deadline is None:
+        return None
+    return max(_task_deadline - time.monotonic(), 0)
+
+
+class ParserRegistry:
+    """
+    The parsers declared through document_consumer_declaration, indexed by
+    mime type. This is built once, since the helpers below are called for
+    every file, attachment and upload.
+    """
+
+    def __init__(self, declarations):
+        options = {}
+        default_extensions = {}
+        for declaration in declarations:
+            for mime_type, ext in declaration["mime_types"].items():
+                options.setdefault(mime_type, []).append(declaration)
+                default_extensions.setdefault(mime_type, ext)
+
+        # Parsers with the highest weight come first. Sorting is stable, so
+        # parsers with equal weight remain in the order they were declared.
+        self.parsers = MappingProxyType({
+            mime_type: tuple(o["parser"] for o in sorted(
+                candidates, key=lambda _: _["weight"], reverse=True))
+            for mime_type, candidates in options.items()
+        })
+        self.default_extensions = MappingProxyType(default_extensions)
+        self.extensions = frozenset(
+            ext
+            for mime_type in self.parsers
+            for ext in mimetypes.guess_all_extensions(mime_type)
+        )
+
+    def get_parser_class(self, mime_type):
+        parsers = self.parsers.get(mime_type)
+        return parsers[0] if parsers else None
+
+
+_parser_registry = None
+
+
+def get_parser_registry():
+    global _parser_registry
+
+    if _parser_registry is None:
+        # Sein letzter Befehl war: KOMMT! Und sie kamen. Alle. Sogar die
+        # Parser.
+        registry = ParserRegistry(
+            [response[1] for response in document_consumer_declaration.send(None)]  # NOQA: E501
+        )
+        if not apps.ready:
+            # The parser apps declare their parsers in their ready() method,
+            # which runs after ours. Don't hold on to an incomplete registry.
+            return registry
+        _parser_registry = registry
+
+    return _parser_registry
+
 
 def is_mime_type_supported(mime_type):
     return get_parser_class_for_mime_type(mime_type) is not None
 
 
 def get_default_file_extension(mime_type):
-    for response in document_consumer_declaration.send(None):
-        parser_declaration = response[1]
-        supported_mime_types = parser_declaration["mime_types"]
-
-        if mime_type in supported_mime_types:
-            return supported_mime_types[mime_type]
+    registry = get_parser_registry()
+    if mime_type in registry.default_extensions:
+        return registry.default_extensions[mime_type]
 
     ext = mimetypes.guess_extension(mime_type)
     if ext:
@@ -65,36 +144,11 @@ def is_file_ext_supported(ext):
 
 
 def get_supported_file_extensions():
-    extensions = set()
-    for response in document_consumer_declaration.send(None):
-        parser_declaration = response[1]
-        supported_mime_types = parser_declaration["mime_types"]
-
-        for mime_type in supported_mime_types:
-            extensions.update(mimetypes.guess_all_extensions(mime_type))
-
-    return extensions
+    return get_parser_registry().extensions
 
 
 def get_parser_class_for_mime_type(mime_type):
-
-    options = []
-
-    # Sein letzter Befehl war: KOMMT! Und sie kamen. Alle. Sogar die Parser.
-
-    for response in document_consumer_declaration.send(None):
-        parser_declaration = response[1]
-        supported_mime_types = parser_declaration["mime_types"]
-
-        if mime_type in supported_mime_types:
-            options.append(parser_declaration)
-
-    if not options:
-        return None
-
-    # Return the parser with the highest weight.
-    return sorted(
-        options, key=lambda _: _["weight"], reverse=True)[0]["parser"]
+    return get_parser_registry().get_parser_class(mime_type)
 
 
 def get_parser_class(path):
@@ -183,6 +237,168 @@ def make_thumbnail_from_pdf_gs_fallback(in_path, temp_dir, logging_group=None):
         return get_default_thumbnail()
 
 
+# Thumbnails are at most this wide and high.
+THUMBNAIL_WIDTH = 500
+THUMBNAIL_HEIGHT = 5000
+# The resolution at which convert renders PDF files before scaling them.
+THUMBNAIL_DENSITY = 300
+
+
+def _inherited(page, key):
+    # Newer versions of pikepdf wrap the page dictionary.
+    node = getattr(page, "obj", page)
+    while node is not None:
+        if key in node:
+            return node[key]
+        node = node.get("/Parent")
+    return None
+
+
+def get_thumbnail_dpi(pdf_path):
+    """
+    The resolution at which the first page of a PDF file is as wide as a
+    thumbnail, or as high, whichever is smaller. Like convert, this never
+    renders pages at a higher resolution than THUMBNAIL_DENSITY.
+    """
+    import pikepdf
+
+    with pikepdf.open(pdf_path) as pdf:
+        page = pdf.pages[0]
+        box = _inherited(page, "/CropBox") or _inherited(page, "/MediaBox")
+        x0, y0, x1, y1 = [float(v) for v in box]
+        rotate = int(_inherited(page, "/Rotate") or 0)
+
+    width, height = abs(x1 - x0), abs(y1 - y0)
+    if rotate % 180:
+        width, height = height, width
+
+    # PDF dimensions are in points, at 72 points per inch.
+    return min(THUMBNAIL_DENSITY,
+               THUMBNAIL_WIDTH * 72 / width,
+               THUMBNAIL_HEIGHT * 72 / height)
+
+
+def run_thumbnail_gs(in_path, out_path, logging_group=None):
+    """
+    Renders the first page of a PDF file with a single Ghostscript call, at
+    the resolution of the thumbnail. This is a lot faster than rendering it
+    at 300 dpi and scaling it down with convert.
+    """
+    try:
+        dpi = get_thumbnail_dpi(in_path)
+    except Exception as e:
+        # Not a PDF file, or one that pikepdf can't read.
+        raise ParseError(f"Cannot determine the page size of {in_path}: {e}")
+
+    args = [settings.GS_BINARY,
+            "-q",
+            "-dSAFER",
+            "-dFirstPage=1",
+            "-dLastPage=1",
+            "-dUseCropBox",
+            "-dTextAlphaBits=4",
+            "-dGraphicsAlphaBits=4",
+            f"-r{dpi:.2f}",
+            "-sDEVICE=png16m",
+            "-o", out_path,
+            in_path]
+
+    logger.debug("Execute: " + " ".join(args), extra={'group': logging_group})
+
+    if not subprocess.Popen(args).wait() == 0:
+        raise ParseError("Thumbnail (gs) failed at {}".format(args))
+
+
+def run_thumbnail_convert(in_path, out_path, logging_group=None):
+    run_convert(density=THUMBNAIL_DENSITY,
+                scale=f"{THUMBNAIL_WIDTH}x{THUMBNAIL_HEIGHT}>",
+                alpha="remove",
+                strip=True,
+                trim=False,
+                auto_orient=True,
+                input_file="{}[0]".format(in_path),
+                output_file=out_path,
+                logging_group=logging_group)
+
+
+THUMBNAIL_ENGINES = {
+    "convert": run_thumbnail_convert,
+    "ghostscript": run_thumbnail_gs,
+}
+
+
+def make_thumbnail_from_first_page(in_path, out_path, logging_group=None,
+                                   engine=None):
+    """
+    Renders the first page of a PDF or image file as a 500px wide image with
+    the configured thumbnail engine. Files that the engine can't render are
+    rendered with convert. Raises ParseError if that fails.
+    """
+    engine = engine or settings.THUMBNAIL_ENGINE
+    if engine != "convert":
+        try:
+            THUMBNAIL_ENGINES[engine](in_path, out_path, logging_group)
+            return
+        except ParseError as e:
+            logger.debug(
+                f"Thumbnail engine {engine} failed, using convert: {e}",
+                extra={'group': logging_group})
+
+    run_thumbnail_convert(in_path, out_path, logging_group)
+
+
+THUMBNAIL_MIME_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+
+def get_thumbnail_format(path):
+    """
+    The format of a thumbnail file, going by its extension.
+    """
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return ext if ext in THUMBNAIL_MIME_TYPES else "png"
+
+
+def convert_thumbnail(in_path, out_path, format):
+    """
+    Stores a thumbnail in another format. out_path may also be a file
+    object.
+    """
+    from PIL import Image
+
+    with Image.open(in_path) as im:
+        if format == "webp":
+            # Thumbnails are opaque, and this keeps text legible.
+            im.convert("RGB").save(out_path, "WEBP", quality=90)
+        else:
+            im.save(out_path, format.upper(), optimize=True)
+
+
+def run_optipng(in_path, out_path, logging_group=None, low_priority=False):
+    args = [settings.OPTIPNG_BINARY,
+            "-silent", "-o5", in_path, "-out", out_path]
+
+    logger.debug("Execute: " + " ".join(args), extra={'group': logging_group})
+
+    # Only optipng runs with a lower priority, not the worker itself.
+    preexec_fn = (lambda: os.nice(19)) if low_priority else None
+
+    if not subprocess.Popen(args, preexec_fn=preexec_fn).wait() == 0:
+        raise ParseError("Optipng failed at {}".format(args))
+
+
+def is_thumbnail_optimisation_deferred(thumbnail):
+    """
+    Whether optipng runs on the thumbnail in the background, after the
+    thumbnail was stored.
+    """
+    return settings.OPTIMIZE_THUMBNAILS and \
+        settings.OPTIMIZE_THUMBNAILS_DEFERRED and \
+        get_thumbnail_format(thumbnail) == "png"
+
+
 def make_thumbnail_from_pdf(in_path, temp_dir, logging_group=None):
     """
     The thumbnail of a PDF is just a 500px wide image of the first page.
@@ -191,15 +407,7 @@ def make_thumbnail_from_pdf(in_path, temp_dir, logging_group=None):
 
     # Run convert to get a decent thumbnail
     try:
-        run_convert(density=300,
-                    scale="500x5000>",
-                    alpha="remove",
-                    strip=True,
-                    trim=False,
-                    auto_orient=True,
-                    input_file="{}[0]".format(in_path),
-                    output_file=out_path,
-                    logging_group=logging_group)
+        make_thumbnail_from_first_page(in_path, out_path, logging_group)
     except ParseError:
         out_path = make_thumbnail_from_pdf_gs_fallback(
             in_path, temp_dir, logging_group)
@@ -292,6 +500,11 @@ class DocumentParser(LoggingMixin):
         self.text = None
         self.date = None
         self.progress_callback = progress_callback
+        # MD5 checksum of the document, if the caller knows it already.
+        self.checksum = None
+
+        self._thumbnail_executor = None
+        self._thumbnail_future = None
 
     def progress(self, current_progress, max_progress):
         if self.progress_callback:
@@ -306,32 +519,126 @@ class DocumentParser(LoggingMixin):
     def get_archive_path(self):
         return self.archive_path
 
+    def get_page_count(self, document_path, mime_type):
+        """
+        Returns the number of pages of the document, or None if unknown.
+        """
+        if self.archive_path:
+            pdf_file = self.archive_path
+        elif mime_type == "application/pdf":
+            pdf_file = document_path
+        else:
+            return None
+
+        import pikepdf
+        try:
+            with pikepdf.open(pdf_file) as pdf:
+                return len(pdf.pages)
+        except Exception as e:
+            self.log("warning", f"Unable to count pages of {pdf_file}: {e}")
+            return None
+
     def get_thumbnail(self, document_path, mime_type, file_name=None):
         """
         Returns the path to a file we can use as a thumbnail for this document.
         """
         raise NotImplementedError()
 
-    def get_optimised_thumbnail(self,
-                                document_path,
-                                mime_type,
-                                file_name=None):
-        thumbnail = self.get_thumbnail(document_path, mime_type, file_name)
-        if settings.OPTIMIZE_THUMBNAILS:
-            out_path = os.path.join(self.tempdir, "thumb_optipng.png")
+    def can_pipeline_thumbnail(self, mime_type):
+        """
+        Returns True if this parser can create thumbnails of documents of the
+        given type from the original document alone, without parsing it first.
+        """
+        return False
 
-            args = (settings.OPTIPNG_BINARY,
-                    "-silent", "-o5", thumbnail, "-out", out_path)
+    def get_thumbnail_from_original(self,
+                                    document_path,
+                                    mime_type,
+                                    file_name=None):
+        """
+        Returns the path to a thumbnail rendered from the original document,
+        without relying on anything that parse() produces. This is called in
+        a background thread, concurrently with parse().
 
-            self.log('debug', f"Execute: {' '.join(args)}")
+        Raise ParseError if the original cannot be rendered, in which case
+        get_thumbnail() is used after parsing.
+        """
+        raise NotImplementedError()
+
+    def start_thumbnail(self, document_path, mime_type, file_name=None):
+        """
+        Starts generating the optimised thumbnail in the background if
+        PAPERLESS_PIPELINE_THUMBNAILS is enabled and the parser supports it.
+        get_optimised_thumbnail() will then wait for and return the result.
+        """
+        if not settings.PIPELINE_THUMBNAILS or \
+                not self.can_pipeline_thumbnail(mime_type):
+            return
 
-            if not subprocess.Popen(args).wait() == 0:
-                raise ParseError("Optipng failed at {}".format(args))
+        self.log("debug", "Generating thumbnail in the background")
+        self._thumbnail_executor = ThreadPoolExecutor(max_workers=1)
+        self._thumbnail_future = self._thumbnail_executor.submit(
+            self._get_pipelined_thumbnail, document_path, mime_type, file_name)
 
+    def _get_pipelined_thumbnail(self, document_path, mime_type, file_name):
+        try:
+            thumbnail = self.get_thumbnail_from_original(
+                document_path, mime_type, file_name)
+            return self.optimise_thumbnail(thumbnail, "thumb_pipelined.png")
+        except ParseError as e:
+            self.log("debug", f"Unable to create thumbnail from original "
+                              f"document: {e}")
+            return None
+
+    def _finish_pipelined_thumbnail(self):
+        if not self._thumbnail_future:
+            return None
+
+        try:
+            return self._thumbnail_future.result()
+        except Exception:
+            self.log("warning", "Error while generating thumbnail",
+                     exc_info=True)
+            return None
+        finally:
+            self._thumbnail_executor.shutdown()
+            self._thumbnail_executor = None
+            self._thumbnail_future = None
+
+    def optimise_thumbnail(self, thumbnail, out_name="thumb_optipng.png"):
+        if settings.THUMBNAIL_FORMAT == "webp":
+            # WebP files are a lot smaller than optimised PNG files, and much
+            # faster to encode.
+            out_path = os.path.join(
+                self.tempdir, os.path.splitext(out_name)[0] + ".webp")
+            try:
+                convert_thumbnail(thumbnail, out_path, "webp")
+            except Exception as e:
+                raise ParseError(f"Cannot convert thumbnail to WebP: {e}")
+            return out_path
+        elif settings.OPTIMIZE_THUMBNAILS and \
+                not settings.OPTIMIZE_THUMBNAILS_DEFERRED:
+            out_path = os.path.join(self.tempdir, out_name)
+            run_optipng(thumbnail, out_path, self.logging_group)
             return out_path
         else:
+            # Deferred optimisation happens after the thumbnail is stored.
             return thumbnail
 
+    def get_optimised_thumbnail(self,
+                                document_path,
+                                mime_type,
+                                file_name=None):
+        if self._thumbnail_future:
+            thumbnail = self._finish_pipelined_thumbnail()
+            if thumbnail:
+                return thumbnail
+            self.log("debug", "Falling back to thumbnail generation after "
+                              "parsing")
+
+        return self.optimise_thumbnail(
+            self.get_thumbnail(document_path, mime_type, file_name))
+
     def get_text(self):
         return self.text
 
@@ -339,5 +646,8 @@ class DocumentParser(LoggingMixin):
         return self.date
 
     def cleanup(self):
+        # Don't pull the working directory from under a thumbnail that is
+        # still being rendered.
+        self._finish_pipelined_thumbnail()
         self.log("debug", f"Deleting directory {self.tempdir}")
         shutil.rmtree(self.tempdir)
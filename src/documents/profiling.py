@@ -0,0 +1,140 @@
+import glob
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Resident memory is sampled this often while a stage runs.
+SAMPLE_INTERVAL = 0.1
+
+
+def _cpu_time():
+    # OCRmyPDF, tesseract, ImageMagick and optipng run as child processes, so
+    # their CPU time is accounted for as well (once they have terminated).
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _rss(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak resident memory of this process that the kernel records,
+    if possible.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return 0
+
+
+def _children(pid="self"):
+    # Every thread has its own list of the processes it started.
+    pids = []
+    for path in glob.glob(f"/proc/{pid}/task/*/children"):
+        try:
+            with open(path) as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            pass
+    return pids
+
+
+def _descendants_rss():
+    total = 0
+    pending = _children()
+    while pending:
+        pid = pending.pop()
+        total += _rss(pid)
+        pending.extend(_children(pid))
+    return total
+
+
+class _RSSSampler(threading.Thread):
+    """
+    Records the peak resident memory of this process and the total resident
+    memory of its child processes until stopped.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self._stopped = threading.Event()
+        # The kernel's peak is exact, sampling misses short peaks.
+        self._exact = _reset_peak_rss()
+        self.rss = 0
+        self.child_rss = 0
+        self.sample()
+
+    def sample(self):
+        self.rss = max(self.rss, _rss())
+        if self._exact:
+            self.rss = max(self.rss, _peak_rss())
+        self.child_rss = max(self.child_rss, _descendants_rss())
+
+    def run(self):
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            self.sample()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.sample()
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time and peak resident memory of the individual
+    stages of processing a document.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        sampler = _RSSSampler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            record = self.stages.setdefault(
+                name, {"wall": 0.0, "cpu": 0.0, "rss": 0, "child_rss": 0})
+            record["wall"] += round(time.perf_counter() - wall_start, 4)
+            record["cpu"] += round(_cpu_time() - cpu_start, 4)
+            record["rss"] = max(record["rss"], sampler.rss)
+            record["child_rss"] = max(record["child_rss"], sampler.child_rss)
+
+    @property
+    def total_wall(self):
+        return sum(s["wall"] for s in self.stages.values())
+
+    @property
+    def total_cpu(self):
+        return sum(s["cpu"] for s in self.stages.values())
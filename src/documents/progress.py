@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger("paperless.progress")
+
+# Progress updates with these states are the last ones of a task.
+FINAL_STATES = ("SUCCESS", "FAILED")
+
+
+def send_status_update(payload):
+    async_to_sync(get_channel_layer().group_send)(
+        "status_updates", {'type': 'status_update', 'data': payload})
+
+
+class ProgressPublisher:
+    """
+    Sends consumer progress updates from a background thread, so that parsing
+    never waits for the channel layer.
+
+    Updates of the same task are sent at most max_rate times per second. If
+    more updates arrive in the meantime, only the most recent one is sent. The
+    final update of a task is never dropped.
+    """
+
+    def __init__(self, send=send_status_update, max_rate=None):
+        self._send = send
+        if max_rate is None:
+            max_rate = settings.CONSUMER_PROGRESS_RATE
+        self._interval = 1.0 / max_rate if max_rate > 0 else 0.0
+
+        self._condition = threading.Condition()
+        # task id -> most recent update that was not sent yet
+        self._pending = {}
+        # task id -> time the last update was sent
+        self._last_sent = {}
+        self._sending = False
+        self._flushing = False
+        self._thread = None
+
+    def publish(self, payload):
+        with self._condition:
+            self._pending[payload['task_id']] = payload
+            if not self._thread:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="paperless-progress",
+                    daemon=True
+                )
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Send all pending updates right away and wait until they are sent.
+        Returns False if that didn't happen within the timeout.
+        """
+        with self._condition:
+            self._flushing = True
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(
+                    lambda: not self._pending and not self._sending, timeout)
+            finally:
+                self._flushing = False
+
+    def _due(self, now):
+        return [
+            task_id for task_id in self._pending
+            if self._flushing or
+            task_id not in self._last_sent or
+            now - self._last_sent[task_id] >= self._interval
+        ]
+
+    def _next_due(self, now):
+        # Only called if nothing is due, so every pending task has been sent
+        # an update recently.
+        return min(
+            self._last_sent[task_id] + self._interval - now
+            for task_id in self._pending
+        )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = self._due(now)
+                    if due:
+                        break
+                    self._condition.wait(
+                        self._next_due(now) if self._pending else None)
+
+                payloads = [self._pending.pop(task_id) for task_id in due]
+                self._sending = True
+
+            for payload in payloads:
+                try:
+                    self._send(payload)
+                except Exception as e:
+                    logger.warning(f"Error while sending progress update: {e}")
+
+            with self._condition:
+                now = time.monotonic()
+                for payload in payloads:
+                    if payload['status'] in FINAL_STATES:
+                        self._last_sent.pop(payload['task_id'], None)
+                    else:
+                        self._last_sent[payload['task_id']] = now
+                self._sending = False
+                self._condition.notify_all()
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_progress_publisher():
+    global _publisher
+
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = ProgressPublisher()
+        return _publisher
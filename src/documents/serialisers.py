@@ -8,7 +8,7 @@ from rest_framework.fields import SerializerMethodField
 
 from . import bulk_edit
 from .models import Correspondent, Tag, Document, DocumentType, \
-    SavedView, SavedViewFilterRule, MatchingModel
+    SavedView, SavedViewFilterRule, MatchingModel, ProcessingRecord
 from .parsers import is_mime_type_supported
 
 from django.utils.translation import gettext as _
@@ -230,6 +230,21 @@ class DocumentSerializer(DynamicFieldsModelSerializer):
         )
 
 
+class ProcessingRecordSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ProcessingRecord
+        fields = (
+            "document",
+            "created",
+            "parser",
+            "page_count",
+            "original_size",
+            "archive_size",
+            "stages",
+        )
+
+
 class SavedViewFilterRuleSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -6,7 +6,7 @@ from django.conf import settings
 from django.contrib.admin.models import ADDITION, LogEntry
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
-from django.db import models, DatabaseError
+from django.db import models, DatabaseError, transaction
 from django.db.models import Q
 from django.dispatch import receiver
 from django.utils import termcolors, timezone
@@ -31,6 +31,7 @@ def set_correspondent(sender,
                       document=None,
                       logging_group=None,
                       classifier=None,
+                      matching_snapshot=None,
                       replace=False,
                       use_first=True,
                       suggest=False,
@@ -40,8 +41,8 @@ def set_correspondent(sender,
     if document.correspondent and not replace:
         return
 
-    potential_correspondents = matching.match_correspondents(document,
-                                                             classifier)
+    potential_correspondents = matching.match_correspondents(
+        document, classifier, matching_snapshot)
 
     potential_count = len(potential_correspondents)
     if potential_correspondents:
@@ -95,6 +96,7 @@ def set_document_type(sender,
                       document=None,
                       logging_group=None,
                       classifier=None,
+                      matching_snapshot=None,
                       replace=False,
                       use_first=True,
                       suggest=False,
@@ -104,8 +106,8 @@ def set_document_type(sender,
     if document.document_type and not replace:
         return
 
-    potential_document_type = matching.match_document_types(document,
-                                                            classifier)
+    potential_document_type = matching.match_document_types(
+        document, classifier, matching_snapshot)
 
     potential_count = len(potential_document_type)
     if potential_document_type:
@@ -160,6 +162,7 @@ def set_tags(sender,
              document=None,
              logging_group=None,
              classifier=None,
+             matching_snapshot=None,
              replace=False,
              suggest=False,
              base_url=None,
@@ -174,7 +177,7 @@ def set_tags(sender,
 
     current_tags = set(document.tags.all())
 
-    matched_tags = matching.match_tags(document, classifier)
+    matched_tags = matching.match_tags(document, classifier, matching_snapshot)
 
     relevant_tags = set(matched_tags) - current_tags
 
@@ -382,7 +385,14 @@ def set_log_entry(sender, document=None, logging_group=None, **kwargs):
     )
 
 
-def add_to_index(sender, document, **kwargs):
+def add_to_index(sender, document, index_writer=None, **kwargs):
     from documents import index
 
-    index.add_or_update_document(document)
+    if index_writer is not None:
+        # The writer is committed by the caller once the document is
+        # consumed. Only index the document if it actually ends up in the
+        # database.
+        transaction.on_commit(
+            lambda: index.update_document(index_writer, document))
+    else:
+        index.add_or_update_document(document)
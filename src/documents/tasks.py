@@ -1,18 +1,30 @@
 import logging
+import os
+import shutil
+import tempfile
+import time
 
 import tqdm
 from django.conf import settings
 from django.db.models.signals import post_save
+from django_q.tasks import async_task
+from filelock import FileLock
 from whoosh.writing import AsyncWriter
 
 from documents import index, sanity_checker
 from documents.classifier import DocumentClassifier, load_classifier
 from documents.consumer import Consumer, ConsumerError
+from documents.matching import MatchingSnapshot
 from documents.models import Document, Tag, DocumentType, Correspondent
+from documents.parsers import run_optipng, set_task_deadline
 from documents.sanity_checker import SanityCheckFailedException
 
 logger = logging.getLogger("paperless.tasks")
 
+# Share of the task timeout after which consume_files stops starting new
+# files and queues the remaining ones in a new task instead.
+BATCH_TIME_LIMIT = 0.5
+
 
 def index_optimize():
     ix = index.open_index()
@@ -40,7 +52,8 @@ def train_classifier():
 
         return
 
-    classifier = load_classifier()
+    # Training modifies the classifier, so don't use the shared instance.
+    classifier = load_classifier(use_cache=False)
 
     if not classifier:
         classifier = DocumentClassifier()
@@ -71,6 +84,8 @@ def consume_file(path,
                  override_tag_ids=None,
                  task_id=None):
 
+    set_task_deadline(settings.Q_CLUSTER['timeout'])
+
     document = Consumer().try_consume_file(
         path,
         override_filename=override_filename,
@@ -90,6 +105,80 @@ def consume_file(path,
                             "no error message was given.")
 
 
+def consume_files(files):
+    """
+    Consume several files in a row. Each entry is either a path or a dict
+    with the arguments of consume_file. The classifier and the matching
+    models are shared by all files, so that a backlog of files doesn't pay
+    for these for every single file. Files that are not started within the
+    time limit of the batch are queued as a new batch.
+    """
+
+    set_task_deadline(settings.Q_CLUSTER['timeout'])
+    deadline = time.monotonic() + \
+        settings.Q_CLUSTER['timeout'] * BATCH_TIME_LIMIT
+
+    classifier = load_classifier()
+    snapshot = MatchingSnapshot()
+    ix = index.open_index()
+
+    consumer = Consumer(
+        classifier=classifier,
+        matching_snapshot=snapshot
+    )
+
+    results = []
+    consumed = 0
+    requeued = []
+
+    for i, file in enumerate(files):
+        if i > 0 and time.monotonic() > deadline:
+            requeued = files[i:]
+            break
+
+        if isinstance(file, str):
+            file = {'path': file}
+        name = file.get('override_filename') or \
+            os.path.basename(file['path'])
+
+        # The index is written after every file, so that the search index
+        # doesn't miss any documents if the worker is killed, and so that
+        # the index isn't locked for the entire batch.
+        consumer.index_writer = AsyncWriter(ix)
+        try:
+            document = consumer.try_consume_file(**file)
+            results.append(
+                f"{name}: Success. New document id {document.pk} "
+                f"created")
+            consumed += 1
+        except ConsumerError as e:
+            results.append(f"Failed. {e}")
+        except Exception as e:
+            # Don't let a single file take down the rest of the batch.
+            logger.exception(f"Error while consuming {name}")
+            results.append(f"Failed. {name}: {e}")
+        finally:
+            consumer.index_writer.commit()
+
+    summary = "\n".join(
+        [f"Consumed {consumed} of {len(results)} files."] + results)
+
+    if requeued:
+        logger.info(
+            f"Time limit of the batch exceeded, adding the remaining "
+            f"{len(requeued)} files to the task queue")
+        async_task("documents.tasks.consume_files",
+                   requeued,
+                   task_name=f"{len(requeued)} files")
+        summary += f"\nQueued the remaining {len(requeued)} files in a " \
+                   f"new task."
+
+    if results and not consumed:
+        raise ConsumerError(summary)
+
+    return summary
+
+
 def sanity_check():
     messages = sanity_checker.check_sanity()
 
@@ -117,3 +206,53 @@ def bulk_update_documents(document_ids):
     with AsyncWriter(ix) as writer:
         for doc in documents:
             index.update_document(writer, doc)
+
+
+def optimise_thumbnail(document_id):
+    """
+    Optimise the thumbnail of a document that was stored unoptimised and
+    swap it in place.
+    """
+    try:
+        document = Document.objects.get(id=document_id)
+    except Document.DoesNotExist:
+        return f"Document {document_id} does not exist anymore."
+
+    if document.thumbnail_optimised:
+        return "Thumbnail is optimised already."
+
+    if document.storage_type != Document.STORAGE_TYPE_UNENCRYPTED or \
+            document.thumbnail_format != Document.THUMBNAIL_FORMAT_PNG:
+        Document.objects.filter(pk=document.pk).update(
+            thumbnail_optimised=True)
+        return "Thumbnail cannot be optimised."
+
+    thumbnail_path = document.thumbnail_path
+    stat = os.stat(thumbnail_path)
+    temp_path = f"{thumbnail_path}.optipng"
+
+    os.makedirs(settings.SCRATCH_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=settings.SCRATCH_DIR) as tempdir:
+        out_path = os.path.join(tempdir, "thumb_optipng.png")
+        run_optipng(thumbnail_path, out_path, low_priority=True)
+        # Copy first, so that the swap itself is a rename within the
+        # thumbnail directory.
+        shutil.copyfile(out_path, temp_path)
+
+    try:
+        with FileLock(settings.MEDIA_LOCK):
+            try:
+                current = os.stat(thumbnail_path)
+            except FileNotFoundError:
+                return "Thumbnail was removed in the meantime."
+            if (current.st_mtime_ns, current.st_size) != \
+                    (stat.st_mtime_ns, stat.st_size):
+                return "Thumbnail was replaced in the meantime."
+            os.replace(temp_path, thumbnail_path)
+            Document.objects.filter(pk=document.pk).update(
+                thumbnail_optimised=True)
+    finally:
+        if os.path.isfile(temp_path):
+            os.unlink(temp_path)
+
+    return f"Optimised thumbnail of document {document_id}."
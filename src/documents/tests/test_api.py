@@ -15,7 +15,8 @@ from rest_framework.test import APITestCase
 from whoosh.writing import AsyncWriter
 
 from documents import index, bulk_edit
-from documents.models import Document, Correspondent, DocumentType, Tag, SavedView, MatchingModel
+from documents.models import Document, Correspondent, DocumentType, Tag, SavedView, MatchingModel, \
+    ProcessingRecord
 from documents.tests.utils import DirectoriesMixin
 
 
@@ -186,6 +187,28 @@ class TestDocumentApi(DirectoriesMixin, APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, content)
 
+    def test_thumb_webp(self):
+        from PIL import Image
+
+        doc = Document.objects.create(title="none", filename="doc.pdf", mime_type="application/pdf", thumbnail_format="webp")
+        with Image.open(os.path.join(os.path.dirname(__file__), "samples", "simple.png")) as im:
+            im.convert("RGB").save(doc.thumbnail_path, "WEBP")
+
+        response = self.client.get(f'/api/documents/{doc.pk}/thumb/', HTTP_ACCEPT="image/avif,image/webp,*/*")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], "image/webp")
+        self.assertIn("Accept", response['Vary'])
+        with open(doc.thumbnail_path, "rb") as f:
+            self.assertEqual(response.content, f.read())
+
+        response = self.client.get(f'/api/documents/{doc.pk}/thumb/', HTTP_ACCEPT="image/png,*/*")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], "image/png")
+        with Image.open(io.BytesIO(response.content)) as im:
+            self.assertEqual(im.format, "PNG")
+
     def test_document_actions_not_existing_file(self):
 
         doc = Document.objects.create(title="none", filename=os.path.basename("asd"), mime_type="application/pdf")
@@ -271,6 +294,26 @@ class TestDocumentApi(DirectoriesMixin, APITestCase):
         results = response.data['results']
         self.assertEqual(len(results), 0)
 
+    def test_document_checksum_filter(self):
+        doc1 = Document.objects.create(title="none1", checksum="a" * 32, archive_checksum="b" * 32, mime_type="application/pdf")
+        doc2 = Document.objects.create(title="none2", checksum="c" * 32, mime_type="application/pdf")
+
+        response = self.client.get(f"/api/documents/?checksum={'a' * 32}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.data['results']], [doc1.id])
+
+        response = self.client.get(f"/api/documents/?checksum={'B' * 32}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.data['results']], [doc1.id])
+
+        response = self.client.get(f"/api/documents/?checksum={'c' * 32}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['id'] for r in response.data['results']], [doc2.id])
+
+        response = self.client.get(f"/api/documents/?checksum={'d' * 32}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+
     def test_documents_title_content_filter(self):
 
         doc1 = Document.objects.create(title="title A", content="content A", checksum="A", mime_type="application/pdf")
@@ -677,6 +720,27 @@ class TestDocumentApi(DirectoriesMixin, APITestCase):
         response = self.client.get(f"/api/documents/34576/metadata/")
         self.assertEqual(response.status_code, 404)
 
+    def test_get_processing_record(self):
+        doc = Document.objects.create(title="test", mime_type="application/pdf")
+        ProcessingRecord.objects.create(document=doc, parser="RasterisedDocumentParser", page_count=3, original_size=1234, stages={
+            "parsing_document": {"wall": 12.5, "cpu": 30.1, "rss": 104857600}
+        })
+
+        response = self.client.get(f"/api/documents/{doc.pk}/processing/")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(response.data['parser'], "RasterisedDocumentParser")
+        self.assertEqual(response.data['page_count'], 3)
+        self.assertEqual(response.data['original_size'], 1234)
+        self.assertIsNone(response.data['archive_size'])
+        self.assertEqual(response.data['stages']['parsing_document']['wall'], 12.5)
+
+    def test_get_processing_record_missing(self):
+        doc = Document.objects.create(title="test", mime_type="application/pdf")
+
+        response = self.client.get(f"/api/documents/{doc.pk}/processing/")
+        self.assertEqual(response.status_code, 404)
+
     def test_get_metadata_no_archive(self):
         doc = Document.objects.create(title="test", filename="file.pdf", mime_type="application/pdf")
 
@@ -2,11 +2,12 @@ import unittest
 from unittest import mock
 
 from django.core.checks import Error
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from .factories import DocumentFactory
 from .. import document_consumer_declaration
-from ..checks import changed_password_check, parser_check
+from ..checks import changed_password_check, parser_check, \
+    thumbnail_format_check, file_placement_check
 from ..models import Document
 
 
@@ -28,3 +29,25 @@ class ChecksTestCase(TestCase):
 
             self.assertEqual(parser_check(None), [Error("No parsers found. This is a bug. The consumer won't be "
                                                         "able to consume any documents without parsers.")])
+
+    def test_thumbnail_format_check(self):
+        self.assertEqual(thumbnail_format_check(None), [])
+
+        with override_settings(THUMBNAIL_FORMAT="webp"):
+            with mock.patch("PIL.features.check") as m:
+                m.return_value = True
+                self.assertEqual(thumbnail_format_check(None), [])
+                m.return_value = False
+                self.assertEqual(len(thumbnail_format_check(None)), 1)
+
+        with override_settings(THUMBNAIL_FORMAT="jpeg"):
+            self.assertEqual(len(thumbnail_format_check(None)), 1)
+
+    def test_file_placement_check(self):
+        self.assertEqual(file_placement_check(None), [])
+
+        with override_settings(CONSUMER_FILE_PLACEMENT="copy"):
+            self.assertEqual(file_placement_check(None), [])
+
+        with override_settings(CONSUMER_FILE_PLACEMENT="link"):
+            self.assertEqual(len(file_placement_check(None)), 1)
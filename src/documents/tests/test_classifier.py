@@ -3,7 +3,6 @@ import tempfile
 from pathlib import Path
 from unittest import mock
 
-import pytest
 from django.conf import settings
 from django.test import TestCase, override_settings
 
@@ -240,9 +239,7 @@ class TestClassifier(DirectoriesMixin, TestCase):
         self.assertIsNotNone(load_classifier())
         load.assert_called_once()
 
-    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
     @override_settings(MODEL_FILE=os.path.join(os.path.dirname(__file__), "data", "model.pickle"))
-    @pytest.mark.skip(reason="Disabled caching due to high memory usage - need to investigate.")
     def test_load_classifier_cached(self):
         classifier = load_classifier()
         self.assertIsNotNone(classifier)
@@ -251,6 +248,36 @@ class TestClassifier(DirectoriesMixin, TestCase):
             classifier2 = load_classifier()
             load.assert_not_called()
 
+        self.assertIs(classifier, classifier2)
+
+        with mock.patch("documents.classifier.DocumentClassifier.load") as load:
+            classifier3 = load_classifier(use_cache=False)
+            load.assert_called_once()
+
+        self.assertIsNot(classifier, classifier3)
+
+    @mock.patch("documents.classifier.DocumentClassifier.load")
+    def test_load_classifier_model_changed(self, load):
+        Path(settings.MODEL_FILE).touch()
+        classifier = load_classifier()
+        load.assert_called_once()
+
+        stat = os.stat(settings.MODEL_FILE)
+        os.utime(settings.MODEL_FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        classifier2 = load_classifier()
+        self.assertEqual(load.call_count, 2)
+        self.assertIsNot(classifier, classifier2)
+
+    def test_save_updates_cache(self):
+        self.generate_test_data()
+        self.classifier.train()
+        self.classifier.save()
+
+        with mock.patch("documents.classifier.DocumentClassifier.load") as load:
+            self.assertIs(load_classifier(), self.classifier)
+            load.assert_not_called()
+
     @mock.patch("documents.classifier.DocumentClassifier.load")
     def test_load_classifier_incompatible_version(self, load):
         Path(settings.MODEL_FILE).touch()
@@ -10,7 +10,8 @@ from django.test import TestCase, override_settings
 
 from .utils import DirectoriesMixin
 from ..consumer import Consumer, ConsumerError
-from ..models import FileInfo, Tag, Correspondent, DocumentType, Document
+from ..journal import get_enqueue_journal
+from ..models import FileInfo, Tag, Correspondent, DocumentType, Document, ProcessingRecord
 from ..parsers import DocumentParser, ParseError
 from ..tasks import sanity_check
 
@@ -257,6 +258,11 @@ class TestConsumer(DirectoriesMixin, TestCase):
     def setUp(self):
         super(TestConsumer, self).setUp()
 
+        # The parser registry is rebuilt from the mocked parser declarations.
+        patcher = mock.patch("documents.parsers._parser_registry", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         patcher = mock.patch("documents.parsers.document_consumer_declaration.send")
         m = patcher.start()
         m.return_value = [(None, {
@@ -317,6 +323,24 @@ class TestConsumer(DirectoriesMixin, TestCase):
 
         self._assert_first_last_send_progress()
 
+    def testProcessingRecord(self):
+        filename = self.get_test_file()
+        size = os.stat(filename).st_size
+
+        document = self.consumer.try_consume_file(filename)
+
+        record = ProcessingRecord.objects.get(document=document)
+        self.assertEqual(record.parser, "DummyParser")
+        self.assertEqual(record.original_size, size)
+        self.assertEqual(record.archive_size, os.stat(document.archive_path).st_size)
+        self.assertGreater(record.page_count, 0)
+        for stage in ["pre_checks", "parsing_document", "generating_thumbnail", "load_classifier", "save_document"]:
+            self.assertIn(stage, record.stages)
+            self.assertGreaterEqual(record.stages[stage]['wall'], 0)
+            self.assertGreaterEqual(record.stages[stage]['cpu'], 0)
+            self.assertGreater(record.stages[stage]['rss'], 0)
+            self.assertGreaterEqual(record.stages[stage]['child_rss'], 0)
+
     @override_settings(PAPERLESS_FILENAME_FORMAT=None)
     def testDeleteMacFiles(self):
         # https://github.com/jonaswinkler/paperless-ng/discussions/1037
@@ -546,6 +570,36 @@ class TestConsumer(DirectoriesMixin, TestCase):
         self.assertFalse(os.path.isfile(dst))
         self._assert_first_last_send_progress(last_status="FAILED")
 
+    @override_settings(OPTIMIZE_THUMBNAILS=True, OPTIMIZE_THUMBNAILS_DEFERRED=True)
+    @mock.patch("documents.consumer.async_task")
+    def test_deferred_thumbnail_optimisation(self, m):
+        document = self.consumer.try_consume_file(self.get_test_file())
+
+        self.assertFalse(document.thumbnail_optimised)
+        m.assert_called_once_with("documents.tasks.optimise_thumbnail", document.pk)
+
+    @mock.patch("documents.consumer.async_task")
+    def test_no_deferred_thumbnail_optimisation(self, m):
+        document = self.consumer.try_consume_file(self.get_test_file())
+
+        self.assertTrue(document.thumbnail_optimised)
+        m.assert_not_called()
+
+    def test_clears_enqueue_journal(self):
+        journal = get_enqueue_journal()
+
+        filename = self.get_test_file()
+        journal.add([filename])
+        self.consumer.try_consume_file(filename)
+        self.assertFalse(os.path.isfile(filename))
+
+        filename = self.get_test_file()
+        journal.add([filename])
+        self.assertRaises(ConsumerError, self.consumer.try_consume_file, filename)
+        # The file is still there, but not queued anymore.
+        self.assertTrue(os.path.isfile(filename))
+        self.assertEqual(journal.filter_queued([filename]), [filename])
+
     @override_settings(CONSUMER_DELETE_DUPLICATES=False)
     def test_no_delete_duplicate(self):
         dst = self.get_test_file()
@@ -64,3 +64,13 @@ class TestDocument(TestCase):
 
         doc = Document(mime_type="image/jpegasd", title="test", created=timezone.datetime(2020, 12, 25))
         self.assertEqual(doc.get_public_filename(), "2020-12-25 test")
+
+    def test_duplicates_of(self):
+        doc1 = Document.objects.create(title="doc1", checksum="A", archive_checksum="B", mime_type="application/pdf")
+        doc2 = Document.objects.create(title="doc2", checksum="B", mime_type="application/pdf")
+        Document.objects.create(title="doc3", checksum="C", mime_type="application/pdf")
+
+        self.assertCountEqual(Document.objects.duplicates_of("A"), [doc1])
+        self.assertCountEqual(Document.objects.duplicates_of("B"), [doc1, doc2])
+        self.assertFalse(Document.objects.duplicates_of("D").exists())
+        self.assertCountEqual(Document.objects.filter(title="doc2").duplicates_of("B"), [doc2])
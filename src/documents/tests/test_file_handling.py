@@ -1,7 +1,9 @@
 import datetime
+import errno
 import hashlib
 import os
 import random
+import stat
 import uuid
 from pathlib import Path
 from unittest import mock
@@ -13,7 +15,7 @@ from django.utils import timezone
 
 from .utils import DirectoriesMixin
 from ..file_handling import generate_filename, create_source_path_directory, delete_empty_directories, \
-    generate_unique_filename
+    generate_unique_filename, calculate_checksum, place_file, PLACEMENT_RENAME, PLACEMENT_LINK, PLACEMENT_COPY
 from ..models import Document, Correspondent, Tag, DocumentType
 
 
@@ -695,6 +697,85 @@ class TestFilenameGeneration(TestCase):
         self.assertEqual(generate_filename(doc), "2020-05-21.pdf")
 
 
+class TestChecksum(TestCase):
+
+    def test_calculate_checksum(self):
+        path = os.path.join(os.path.dirname(__file__), "samples", "documents", "originals", "0000001.pdf")
+
+        self.assertEqual(calculate_checksum(path), "42995833e01aea9b3edee44bbfdd7ce1")
+        # chunking must not change the result
+        self.assertEqual(calculate_checksum(path, chunk_size=7), "42995833e01aea9b3edee44bbfdd7ce1")
+
+
+class TestPlaceFile(DirectoriesMixin, TestCase):
+
+    def setUp(self):
+        super(TestPlaceFile, self).setUp()
+        self.source = os.path.join(self.dirs.scratch_dir, "source.pdf")
+        self.target = os.path.join(self.dirs.scratch_dir, "target.pdf")
+        with open(self.source, "wb") as f:
+            f.write(os.urandom(100000))
+        self.checksum = calculate_checksum(self.source)
+
+    def test_rename(self):
+        self.assertEqual(place_file(self.source, self.target, allow_rename=True), PLACEMENT_RENAME)
+        self.assertFalse(os.path.isfile(self.source))
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+    def test_link(self):
+        self.assertEqual(place_file(self.source, self.target, allow_link=True), PLACEMENT_LINK)
+        self.assertTrue(os.path.isfile(self.source))
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+    def test_no_link(self):
+        # Only consumed originals are linked.
+        self.assertEqual(place_file(self.source, self.target), PLACEMENT_COPY)
+        self.assertEqual(os.stat(self.source).st_nlink, 1)
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+    @mock.patch("documents.file_handling.os.fstat")
+    def test_copy_truncated(self, fstat):
+        # The source claims to be larger than it is.
+        fstat.return_value = mock.Mock(st_size=200000)
+        self.assertRaises(OSError, place_file, self.source, self.target)
+        self.assertFalse(os.path.exists(self.target))
+
+    def test_link_permissions(self):
+        os.chmod(self.source, 0o666)
+        self.assertEqual(place_file(self.source, self.target, allow_link=True), PLACEMENT_LINK)
+        self.assertEqual(stat.S_IMODE(os.stat(self.target).st_mode), 0o644)
+
+    def test_link_other_owner(self):
+        with mock.patch("documents.file_handling.os.geteuid", return_value=os.geteuid() + 1):
+            self.assertEqual(place_file(self.source, self.target, allow_link=True), PLACEMENT_COPY)
+        self.assertEqual(os.stat(self.source).st_nlink, 1)
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+    def test_link_already_linked(self):
+        os.link(self.source, os.path.join(self.dirs.scratch_dir, "other.pdf"))
+        self.assertEqual(place_file(self.source, self.target, allow_link=True), PLACEMENT_COPY)
+        self.assertEqual(os.stat(self.source).st_nlink, 2)
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+    @mock.patch("documents.file_handling.os.link")
+    def test_link_cross_device(self, m):
+        m.side_effect = OSError(errno.EXDEV, "Invalid cross-device link")
+        self.assertEqual(place_file(self.source, self.target, allow_link=True, fsync=True), PLACEMENT_COPY)
+        self.assertTrue(os.path.isfile(self.source))
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+    @mock.patch("documents.file_handling.os.rename")
+    def test_rename_error(self, m):
+        m.side_effect = OSError(errno.EIO, "I/O error")
+        self.assertRaises(OSError, place_file, self.source, self.target, allow_rename=True)
+
+    @override_settings(CONSUMER_FILE_PLACEMENT="copy")
+    def test_force_copy(self):
+        self.assertEqual(place_file(self.source, self.target, allow_rename=True), PLACEMENT_COPY)
+        self.assertTrue(os.path.isfile(self.source))
+        self.assertEqual(calculate_checksum(self.target), self.checksum)
+
+
 def run():
     doc = Document.objects.create(checksum=str(uuid.uuid4()), title=str(uuid.uuid4()), content="wow")
     doc.filename = generate_unique_filename(doc)
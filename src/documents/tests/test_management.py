@@ -1,4 +1,5 @@
 import hashlib
+import io
 import tempfile
 import filecmp
 import os
@@ -13,7 +14,7 @@ from django.core.management import call_command
 
 from documents.file_handling import generate_filename
 from documents.management.commands.document_archiver import handle_document
-from documents.models import Document
+from documents.models import Document, ProcessingRecord
 from documents.tests.utils import DirectoriesMixin
 
 
@@ -49,6 +50,29 @@ class TestArchiver(DirectoriesMixin, TestCase):
         self.assertTrue(filecmp.cmp(sample_file, doc.source_path))
         self.assertEqual(doc.archive_filename, "none/A.pdf")
 
+    @override_settings(OPTIMIZE_THUMBNAILS=True, OPTIMIZE_THUMBNAILS_DEFERRED=True)
+    @mock.patch("documents.management.commands.document_archiver.async_task")
+    def test_handle_document_deferred_optimisation(self, m):
+        doc = self.make_models()
+        shutil.copy(sample_file, os.path.join(self.dirs.originals_dir, f"{doc.id:07}.pdf"))
+
+        handle_document(doc.pk)
+
+        doc = Document.objects.get(id=doc.id)
+        self.assertFalse(doc.thumbnail_optimised)
+        m.assert_called_once_with("documents.tasks.optimise_thumbnail", doc.pk)
+
+    @mock.patch("documents.management.commands.document_archiver.async_task")
+    def test_handle_document_no_deferred_optimisation(self, m):
+        doc = self.make_models()
+        shutil.copy(sample_file, os.path.join(self.dirs.originals_dir, f"{doc.id:07}.pdf"))
+
+        handle_document(doc.pk)
+
+        doc = Document.objects.get(id=doc.id)
+        self.assertTrue(doc.thumbnail_optimised)
+        m.assert_not_called()
+
     def test_unknown_mime_type(self):
         doc = self.make_models()
         doc.mime_type = "sdgfh"
@@ -172,6 +196,32 @@ class TestCreateClassifier(TestCase):
         m.assert_called_once()
 
 
+class TestProcessingStats(TestCase):
+
+    def test_no_records(self):
+        out = io.StringIO()
+        call_command("document_processing_stats", stdout=out)
+        self.assertIn("No processing records found.", out.getvalue())
+
+    def test_summary(self):
+        for i in range(3):
+            doc = Document.objects.create(title=str(i), checksum=str(i), mime_type="application/pdf")
+            ProcessingRecord.objects.create(document=doc, page_count=2, original_size=1000, stages={
+                "parsing_document": {"wall": 10.0, "cpu": 20.0, "rss": 100 * 1024 * 1024},
+                "save_document": {"wall": 0.5, "cpu": 0.1, "rss": 100 * 1024 * 1024}
+            })
+
+        out = io.StringIO()
+        call_command("document_processing_stats", "--days", "1", stdout=out)
+        output = out.getvalue()
+
+        self.assertIn("parsing_document", output)
+        self.assertIn("save_document", output)
+        self.assertIn("Documents: 3", output)
+        self.assertIn("Pages: 6", output)
+        self.assertIn("Wall time: 31.5s (10.50s per document, 5.25s per page)", output)
+
+
 class TestSanityChecker(DirectoriesMixin, TestCase):
 
     def test_no_issues(self):
@@ -1,4 +1,5 @@
 import filecmp
+import hashlib
 import os
 import shutil
 from threading import Thread
@@ -9,8 +10,9 @@ from django.conf import settings
 from django.core.management import call_command, CommandError
 from django.test import override_settings, TransactionTestCase
 
-from documents.models import Tag
+from documents.models import Document, Tag
 from documents.consumer import ConsumerError
+from documents.journal import get_enqueue_journal
 from documents.management.commands import document_consumer
 from documents.tests.utils import DirectoriesMixin
 
@@ -96,6 +98,76 @@ class ConsumerMixin:
             print("file completed.")
 
 
+@override_settings(CONSUMER_POLLING_DELAY=0.2, CONSUMER_POLLING_RETRY_COUNT=5)
+class TestPendingFiles(DirectoriesMixin, TransactionTestCase):
+
+    def setUp(self) -> None:
+        super(TestPendingFiles, self).setUp()
+        patcher = mock.patch("documents.management.commands.document_consumer._consume")
+        self.consume = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pending_files = document_consumer.PendingFiles(workers=2)
+        self.addCleanup(self.pending_files.stop)
+
+    def wait_until_done(self):
+        n = 0
+        while (self.pending_files.pending or self.pending_files.in_flight) and n < 100:
+            sleep(0.1)
+            n += 1
+
+    def test_unmodified_files(self):
+        files = [os.path.join(self.dirs.consumption_dir, f"file_{i}.pdf") for i in range(20)]
+        for f in files:
+            shutil.copy(ConsumerMixin.sample_file, f)
+            self.pending_files.add(f)
+            # Events for files that are already pending are merged.
+            self.pending_files.add(f)
+
+        self.assertGreater(self.pending_files.pending, 0)
+        self.assertLessEqual(self.pending_files.in_flight, 2)
+
+        self.wait_until_done()
+
+        self.assertEqual(self.pending_files.pending, 0)
+        self.assertEqual(self.pending_files.in_flight, 0)
+        self.assertCountEqual([c[0][0] for c in self.consume.call_args_list], files)
+
+    def test_file_removed(self):
+        f = os.path.join(self.dirs.consumption_dir, "file.pdf")
+        shutil.copy(ConsumerMixin.sample_file, f)
+        self.pending_files.add(f)
+        os.unlink(f)
+
+        self.wait_until_done()
+
+        self.consume.assert_not_called()
+        self.assertEqual(self.pending_files.pending, 0)
+
+    @mock.patch("documents.management.commands.document_consumer.logger.error")
+    def test_file_keeps_changing(self, error_logger):
+        f = os.path.join(self.dirs.consumption_dir, "file.pdf")
+        with open(f, "w") as fh:
+            fh.write("a")
+        self.pending_files.add(f)
+
+        for i in range(15):
+            with open(f, "a") as fh:
+                fh.write("a")
+            sleep(0.1)
+
+        self.wait_until_done()
+
+        self.consume.assert_not_called()
+        error_logger.assert_called_once()
+
+    def test_ignored_file(self):
+        f = os.path.join(self.dirs.consumption_dir, "._file.pdf")
+        shutil.copy(ConsumerMixin.sample_file, f)
+        self.pending_files.add(f)
+
+        self.assertEqual(self.pending_files.pending, 0)
+
+
 class TestConsumer(DirectoriesMixin, ConsumerMixin, TransactionTestCase):
 
     def test_consume_file(self):
@@ -131,6 +203,56 @@ class TestConsumer(DirectoriesMixin, ConsumerMixin, TransactionTestCase):
         args, kwargs = self.task_mock.call_args
         self.assertEqual(args[1], f)
 
+    @override_settings(CONSUMER_PRECHECK_DUPLICATES=True)
+    def test_consume_existing_duplicate(self):
+        with open(self.sample_file, "rb") as f:
+            Document.objects.create(checksum=hashlib.md5(f.read()).hexdigest(), mime_type="application/pdf")
+        f = os.path.join(self.dirs.consumption_dir, "my_file.pdf")
+        shutil.copy(self.sample_file, f)
+        g = os.path.join(self.dirs.consumption_dir, "my_file.png")
+        shutil.copy(os.path.join(os.path.dirname(__file__), "samples", "simple.png"), g)
+
+        call_command('document_consumer', '--oneshot')
+
+        self.task_mock.assert_called_once()
+        args, kwargs = self.task_mock.call_args
+        self.assertEqual(args[1], g)
+        self.assertTrue(os.path.isfile(f))
+
+    @override_settings(CONSUMER_PRECHECK_DUPLICATES=True, CONSUMER_DELETE_DUPLICATES=True)
+    def test_consume_duplicate_delete(self):
+        with open(self.sample_file, "rb") as f:
+            Document.objects.create(checksum="A", archive_checksum=hashlib.md5(f.read()).hexdigest(), mime_type="application/pdf")
+        self.t_start()
+
+        f = os.path.join(self.dirs.consumption_dir, "my_file.pdf")
+        shutil.copy(self.sample_file, f)
+
+        self.wait_for_task_mock_call()
+
+        self.task_mock.assert_not_called()
+        self.assertFalse(os.path.isfile(f))
+
+    @override_settings(CONSUMER_BATCH_SIZE=2)
+    def test_consume_existing_files_batched(self):
+        for i in range(3):
+            shutil.copy(self.sample_file, os.path.join(self.dirs.consumption_dir, f"my_file_{i}.pdf"))
+        shutil.copy(self.sample_file, os.path.join(self.dirs.consumption_dir, "my_file.wow"))
+
+        call_command('document_consumer', '--oneshot')
+
+        self.assertEqual(self.task_mock.call_count, 2)
+
+        batch_calls = [c for c in self.task_mock.call_args_list if c[0][0] == "documents.tasks.consume_files"]
+        single_calls = [c for c in self.task_mock.call_args_list if c[0][0] == "documents.tasks.consume_file"]
+        self.assertEqual(len(batch_calls), 1)
+        self.assertEqual(len(single_calls), 1)
+
+        batch = batch_calls[0][0][1]
+        self.assertEqual(len(batch), 2)
+        paths = {f['path'] for f in batch} | {single_calls[0][0][1]}
+        self.assertSetEqual(paths, {os.path.join(self.dirs.consumption_dir, f"my_file_{i}.pdf") for i in range(3)})
+
     @mock.patch("documents.management.commands.document_consumer.logger.error")
     def test_slow_write_pdf(self, error_logger):
 
@@ -295,3 +417,131 @@ class TestConsumerTags(DirectoriesMixin, ConsumerMixin, TransactionTestCase):
     @override_settings(CONSUMER_POLLING=1, CONSUMER_POLLING_DELAY=1, CONSUMER_POLLING_RETRY_COUNT=20)
     def test_consume_file_with_path_tags_polling(self):
         self.test_consume_file_with_path_tags()
+
+    def test_tags_from_path_cached(self):
+        existing = Tag.objects.create(name="invoices")
+        f = os.path.join(self.dirs.consumption_dir, "Invoices", "2021", "my_file.pdf")
+
+        tag_ids = document_consumer._tags_from_path(f)
+        year = Tag.objects.get(name="2021")
+        self.assertSetEqual(tag_ids, {existing.pk, year.pk})
+
+        with self.assertNumQueries(1):
+            self.assertSetEqual(document_consumer._tags_from_path(f), {existing.pk, year.pk})
+
+    def test_tags_from_path_renamed_or_deleted(self):
+        f = os.path.join(self.dirs.consumption_dir, "invoices", "2021", "my_file.pdf")
+        document_consumer._tags_from_path(f)
+        invoices = Tag.objects.get(name="invoices")
+        year = Tag.objects.get(name="2021")
+
+        invoices.name = "bills"
+        invoices.save()
+
+        tag_ids = document_consumer._tags_from_path(f)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertSetEqual(tag_ids, {Tag.objects.get(name="invoices").pk, year.pk})
+
+        year.delete()
+
+        tag_ids = document_consumer._tags_from_path(f)
+        self.assertSetEqual(tag_ids, {Tag.objects.get(name="invoices").pk, Tag.objects.get(name="2021").pk})
+
+
+class TestConsumeExisting(DirectoriesMixin, ConsumerMixin, TransactionTestCase):
+
+    def setUp(self) -> None:
+        super(TestConsumeExisting, self).setUp()
+        patcher = mock.patch("documents.management.commands.document_consumer.get_broker")
+        self.broker = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.pipeline = self.broker.connection.pipeline.return_value
+
+    def make_files(self):
+        os.makedirs(os.path.join(self.dirs.consumption_dir, "a", "b"))
+        files = [
+            os.path.join(self.dirs.consumption_dir, "1.pdf"),
+            os.path.join(self.dirs.consumption_dir, "a", "2.PDF"),
+            os.path.join(self.dirs.consumption_dir, "a", "b", "3.pdf"),
+        ]
+        for f in files + [os.path.join(self.dirs.consumption_dir, "a", "4.wow"),
+                          os.path.join(self.dirs.consumption_dir, "a", "._5.pdf")]:
+            shutil.copy(self.sample_file, f)
+        return files
+
+    @override_settings(CONSUMER_RECURSIVE=True)
+    def test_scan_recursive(self):
+        files = self.make_files()
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+
+        self.assertCountEqual([c[0][1] for c in self.task_mock.call_args_list], files)
+        for args, kwargs in self.task_mock.call_args_list:
+            self.assertEqual(kwargs['broker'], self.broker)
+        self.pipeline.execute.assert_called_once()
+
+    def test_scan(self):
+        files = self.make_files()
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, False)
+
+        self.assertEqual([c[0][1] for c in self.task_mock.call_args_list], files[:1])
+
+    @mock.patch("documents.management.commands.document_consumer.ENQUEUE_CHUNK_SIZE", 2)
+    @mock.patch("documents.management.commands.document_consumer.logger.info")
+    def test_chunks(self, logger_info):
+        files = self.make_files()
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+
+        self.assertCountEqual([c[0][1] for c in self.task_mock.call_args_list], files)
+        self.assertEqual(self.pipeline.execute.call_count, 2)
+        # The broker gets its own connection back.
+        self.assertNotEqual(self.broker.connection, self.pipeline)
+        self.assertIn("Scanned 5 files", logger_info.call_args[0][0])
+        self.assertIn("added 3 files to the task queue", logger_info.call_args[0][0])
+
+    def test_no_pipeline(self):
+        self.broker.connection = None
+        files = self.make_files()
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+
+        self.assertCountEqual([c[0][1] for c in self.task_mock.call_args_list], files)
+
+    def test_journal(self):
+        files = self.make_files()
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+        self.assertEqual(self.task_mock.call_count, 3)
+
+        # The tasks are still in the queue, so a restart doesn't add them
+        # again.
+        self.task_mock.reset_mock()
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+        document_consumer._consume(files[0])
+        self.task_mock.assert_not_called()
+
+        # Unless the file changed in the meantime.
+        with open(files[0], "ab") as f:
+            f.write(b"more")
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+        self.assertEqual([c[0][1] for c in self.task_mock.call_args_list], files[:1])
+
+    @mock.patch("documents.management.commands.document_consumer.logger.exception")
+    def test_journal_enqueue_failed(self, logger_exception):
+        files = self.make_files()
+        self.pipeline.execute.side_effect = Exception("redis is gone")
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+        logger_exception.assert_called_once()
+
+        self.assertCountEqual(get_enqueue_journal().filter_queued(files), files)
+
+    def test_journal_expiry(self):
+        files = self.make_files()
+
+        document_consumer._consume_existing(self.dirs.consumption_dir, True)
+
+        with mock.patch("documents.journal.JOURNAL_EXPIRY", 0):
+            self.assertCountEqual(get_enqueue_journal().filter_queued(files), files)
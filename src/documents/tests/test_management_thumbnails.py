@@ -2,10 +2,15 @@ import os
 import shutil
 from unittest import mock
 
+from django.conf import settings
 from django.core.management import call_command
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from filelock import FileLock, Timeout
+from PIL import Image
 
+from documents.management.commands.document_thumbnail_converter import _convert_thumbnail
 from documents.management.commands.document_thumbnails import _process_document
+from documents.file_handling import replace_thumbnail as real_replace_thumbnail
 from documents.models import Document, Tag, Correspondent, DocumentType
 from documents.tests.utils import DirectoriesMixin
 
@@ -28,7 +33,24 @@ class TestMakeThumbnails(DirectoriesMixin, TestCase):
         _process_document(self.d1.id)
         self.assertTrue(os.path.isfile(self.d1.thumbnail_path))
 
-    @mock.patch("documents.management.commands.document_thumbnails.shutil.move")
+    @override_settings(OPTIMIZE_THUMBNAILS=True, OPTIMIZE_THUMBNAILS_DEFERRED=True)
+    @mock.patch("documents.management.commands.document_thumbnails.async_task")
+    def test_process_document_deferred_optimisation(self, m):
+        _process_document(self.d1.id)
+
+        self.d1.refresh_from_db()
+        self.assertFalse(self.d1.thumbnail_optimised)
+        m.assert_called_once_with("documents.tasks.optimise_thumbnail", self.d1.pk)
+
+    @mock.patch("documents.management.commands.document_thumbnails.async_task")
+    def test_process_document_no_deferred_optimisation(self, m):
+        _process_document(self.d1.id)
+
+        self.d1.refresh_from_db()
+        self.assertTrue(self.d1.thumbnail_optimised)
+        m.assert_not_called()
+
+    @mock.patch("documents.management.commands.document_thumbnails.replace_thumbnail")
     def test_process_document_invalid_mime_type(self, m):
         self.d1.mime_type = "asdasdasd"
         self.d1.save()
@@ -50,3 +72,70 @@ class TestMakeThumbnails(DirectoriesMixin, TestCase):
         call_command('document_thumbnails', '-d', f"{self.d1.id}")
         self.assertTrue(os.path.isfile(self.d1.thumbnail_path))
         self.assertFalse(os.path.isfile(self.d2.thumbnail_path))
+
+    @override_settings(THUMBNAIL_FORMAT="webp")
+    def test_process_document_webp(self):
+        with open(self.d1.thumbnail_path, "wb") as f:
+            f.write(b"png thumbnail")
+
+        _process_document(self.d1.id)
+
+        self.d1.refresh_from_db()
+        self.assertEqual(self.d1.thumbnail_format, "webp")
+        self.assertTrue(self.d1.thumbnail_path.endswith(".webp"))
+        self.assertTrue(os.path.isfile(self.d1.thumbnail_path))
+        self.assertEqual(len(os.listdir(self.dirs.thumbnail_dir)), 1)
+
+
+class TestConvertThumbnails(DirectoriesMixin, TestCase):
+
+    def setUp(self) -> None:
+        super(TestConvertThumbnails, self).setUp()
+        self.doc = Document.objects.create(checksum="A", title="A", content="first document", mime_type="application/pdf", filename="test.pdf")
+        shutil.copy(os.path.join(os.path.dirname(__file__), "samples", "simple.png"), self.doc.thumbnail_path)
+
+    def test_convert(self):
+        png_path = self.doc.thumbnail_path
+
+        self.assertIsNone(_convert_thumbnail((self.doc.id, "webp")))
+
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.thumbnail_format, "webp")
+        self.assertFalse(os.path.isfile(png_path))
+        with Image.open(self.doc.thumbnail_path) as im:
+            self.assertEqual(im.format, "WEBP")
+
+        self.assertIsNone(_convert_thumbnail((self.doc.id, "png")))
+
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.thumbnail_path, png_path)
+        with Image.open(png_path) as im:
+            self.assertEqual(im.format, "PNG")
+
+    def test_convert_media_lock(self):
+        def replace_thumbnail(document, thumbnail):
+            # The thumbnail optimiser can't swap the thumbnail now.
+            self.assertRaises(Timeout, FileLock(settings.MEDIA_LOCK).acquire, timeout=0)
+            return real_replace_thumbnail(document, thumbnail)
+
+        with mock.patch("documents.management.commands.document_thumbnail_converter.replace_thumbnail",
+                        side_effect=replace_thumbnail) as m:
+            self.assertIsNone(_convert_thumbnail((self.doc.id, "webp")))
+        m.assert_called_once()
+
+    def test_convert_error(self):
+        with open(self.doc.thumbnail_path, "wb") as f:
+            f.write(b"not an image")
+
+        self.assertIsNotNone(_convert_thumbnail((self.doc.id, "webp")))
+
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.thumbnail_format, "png")
+        self.assertTrue(os.path.isfile(self.doc.thumbnail_path))
+
+    def test_command_skips_converted(self):
+        Document.objects.filter(pk=self.doc.pk).update(thumbnail_format="webp")
+
+        call_command('document_thumbnail_converter', '--format', 'webp', '--no-progress-bar')
+
+        self.assertTrue(os.path.isfile(os.path.join(self.dirs.thumbnail_dir, "{:07}.png".format(self.doc.pk))))
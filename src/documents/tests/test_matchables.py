@@ -275,3 +275,18 @@ class TestDocumentConsumptionFinishedSignal(TestCase):
             sender=self.__class__, document=self.doc_contains)
 
         self.assertEqual(LogEntry.objects.count(), 1)
+
+    def test_matching_snapshot(self):
+        snapshot = matching.MatchingSnapshot()
+        t1 = Tag.objects.create(
+            name="test", match="keyword", matching_algorithm=Tag.MATCH_ANY)
+        document_consumption_finished.send(
+            sender=self.__class__, document=self.doc_contains,
+            matching_snapshot=snapshot)
+        # The tag did not exist when the snapshot was taken.
+        self.assertEqual(list(self.doc_contains.tags.all()), [])
+
+        document_consumption_finished.send(
+            sender=self.__class__, document=self.doc_contains,
+            matching_snapshot=matching.MatchingSnapshot())
+        self.assertEqual(list(self.doc_contains.tags.all()), [t1])
@@ -7,7 +7,8 @@ from unittest import mock
 from django.test import TestCase, override_settings
 
 from documents.parsers import get_parser_class, get_supported_file_extensions, get_default_file_extension, \
-    get_parser_class_for_mime_type, DocumentParser, is_file_ext_supported
+    get_parser_class_for_mime_type, DocumentParser, is_file_ext_supported, ParseError, get_parser_registry, \
+    get_thumbnail_dpi, make_thumbnail_from_first_page, get_thumbnail_format, is_thumbnail_optimisation_deferred
 from paperless_tesseract.parsers import RasterisedDocumentParser
 from paperless_text.parsers import TextDocumentParser
 
@@ -26,6 +27,7 @@ def fake_magic_from_file(file, mime=False):
 @mock.patch("documents.parsers.magic.from_file", fake_magic_from_file)
 class TestParserDiscovery(TestCase):
 
+    @mock.patch("documents.parsers._parser_registry", None)
     @mock.patch("documents.parsers.document_consumer_declaration.send")
     def test__get_parser_class_1_parser(self, m, *args):
         class DummyParser(object):
@@ -40,6 +42,7 @@ class TestParserDiscovery(TestCase):
             DummyParser
         )
 
+    @mock.patch("documents.parsers._parser_registry", None)
     @mock.patch("documents.parsers.document_consumer_declaration.send")
     def test__get_parser_class_n_parsers(self, m, *args):
 
@@ -59,6 +62,7 @@ class TestParserDiscovery(TestCase):
             DummyParser2
         )
 
+    @mock.patch("documents.parsers._parser_registry", None)
     @mock.patch("documents.parsers.document_consumer_declaration.send")
     def test__get_parser_class_0_parsers(self, m, *args):
         m.return_value = []
@@ -68,6 +72,41 @@ class TestParserDiscovery(TestCase):
             )
 
 
+class TestParserRegistry(TestCase):
+
+    @mock.patch("documents.parsers._parser_registry", None)
+    @mock.patch("documents.parsers.document_consumer_declaration.send")
+    def test_registry(self, m):
+        class DummyParser1(object):
+            pass
+
+        class DummyParser2(object):
+            pass
+
+        m.return_value = (
+            (None, {"weight": 0, "parser": DummyParser1, "mime_types": {"application/pdf": ".pdf", "image/jpeg": ".jpeg"}}),
+            (None, {"weight": 1, "parser": DummyParser2, "mime_types": {"image/jpeg": ".jpg"}}),
+        )
+
+        registry = get_parser_registry()
+
+        self.assertEqual(registry.parsers["application/pdf"], (DummyParser1,))
+        self.assertEqual(registry.parsers["image/jpeg"], (DummyParser2, DummyParser1))
+        self.assertEqual(get_parser_class_for_mime_type("image/jpeg"), DummyParser2)
+        self.assertEqual(get_default_file_extension("image/jpeg"), ".jpeg")
+        self.assertTrue(is_file_ext_supported(".JPG"))
+        self.assertFalse(is_file_ext_supported(".txt"))
+
+        # The registry is built only once.
+        get_parser_class_for_mime_type("application/pdf")
+        get_supported_file_extensions()
+        m.assert_called_once()
+        self.assertIs(get_parser_registry(), registry)
+
+        with self.assertRaises(TypeError):
+            registry.parsers["text/plain"] = (DummyParser1,)
+
+
 def fake_get_thumbnail(self, path, mimetype, file_name):
     return os.path.join(os.path.dirname(__file__), "examples", "no-text.png")
 
@@ -99,6 +138,139 @@ class TestBaseParser(TestCase):
         path = parser.get_optimised_thumbnail("any", "not important", "document.pdf")
         self.assertEqual(path, fake_get_thumbnail(None, None, None, None))
 
+    @mock.patch("documents.parsers.DocumentParser.get_thumbnail", fake_get_thumbnail)
+    @mock.patch("documents.parsers.subprocess.Popen")
+    @override_settings(OPTIMIZE_THUMBNAILS=True, OPTIMIZE_THUMBNAILS_DEFERRED=True)
+    def test_get_optimised_thumb_deferred(self, m):
+        parser = DocumentParser(None)
+
+        path = parser.get_optimised_thumbnail("any", "not important", "document.pdf")
+        self.assertEqual(path, fake_get_thumbnail(None, None, None, None))
+        self.assertTrue(is_thumbnail_optimisation_deferred(path))
+        m.assert_not_called()
+
+    @mock.patch("documents.parsers.DocumentParser.get_thumbnail", fake_get_thumbnail)
+    @mock.patch("documents.parsers.subprocess.Popen")
+    @override_settings(THUMBNAIL_FORMAT="webp", OPTIMIZE_THUMBNAILS=True)
+    def test_get_optimised_thumbnail_webp(self, m):
+        from PIL import Image
+
+        parser = DocumentParser(None)
+
+        path = parser.get_optimised_thumbnail("any", "not important", "document.pdf")
+        self.assertEqual(get_thumbnail_format(path), "webp")
+        with Image.open(path) as im:
+            self.assertEqual(im.format, "WEBP")
+        # optipng isn't used for WebP thumbnails.
+        m.assert_not_called()
+        parser.cleanup()
+
+
+class PipelinedParser(DocumentParser):
+
+    def __init__(self, logging_group, fail_original=False):
+        super(PipelinedParser, self).__init__(logging_group)
+        self.fail_original = fail_original
+
+    def can_pipeline_thumbnail(self, mime_type):
+        return True
+
+    def get_thumbnail_from_original(self, document_path, mime_type, file_name=None):
+        if self.fail_original:
+            raise ParseError("Cannot rasterise original.")
+        return os.path.join(os.path.dirname(__file__), "examples", "no-text.png")
+
+    def get_thumbnail(self, document_path, mime_type, file_name=None):
+        return os.path.join(os.path.dirname(__file__), "samples", "simple.png")
+
+
+@override_settings(OPTIMIZE_THUMBNAILS=False)
+class TestPipelinedThumbnail(TestCase):
+
+    def setUp(self) -> None:
+        self.scratch = tempfile.mkdtemp()
+        override_settings(
+            SCRATCH_DIR=self.scratch
+        ).enable()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.scratch)
+
+    @override_settings(PIPELINE_THUMBNAILS=True)
+    def test_pipelined(self):
+        parser = PipelinedParser(None)
+        parser.start_thumbnail("any", "not important")
+        self.assertIsNotNone(parser._thumbnail_future)
+
+        path = parser.get_optimised_thumbnail("any", "not important")
+        self.assertEqual(os.path.basename(path), "no-text.png")
+        self.assertIsNone(parser._thumbnail_future)
+        parser.cleanup()
+
+    @override_settings(PIPELINE_THUMBNAILS=True)
+    def test_pipelined_fallback(self):
+        parser = PipelinedParser(None, fail_original=True)
+        parser.start_thumbnail("any", "not important")
+
+        path = parser.get_optimised_thumbnail("any", "not important")
+        self.assertEqual(os.path.basename(path), "simple.png")
+        parser.cleanup()
+
+    @override_settings(PIPELINE_THUMBNAILS=False)
+    def test_pipelined_disabled(self):
+        parser = PipelinedParser(None)
+        parser.start_thumbnail("any", "not important")
+        self.assertIsNone(parser._thumbnail_future)
+
+        path = parser.get_optimised_thumbnail("any", "not important")
+        self.assertEqual(os.path.basename(path), "simple.png")
+        parser.cleanup()
+
+    @override_settings(PIPELINE_THUMBNAILS=True)
+    def test_not_supported(self):
+        parser = DocumentParser(None)
+        parser.start_thumbnail("any", "not important")
+        self.assertIsNone(parser._thumbnail_future)
+        parser.cleanup()
+
+
+class TestThumbnailEngine(TestCase):
+
+    SAMPLE_FILES = os.path.join(os.path.dirname(__file__), "samples")
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tempdir)
+
+    def test_thumbnail_dpi(self):
+        # simple.pdf is a letter page, 612 points wide.
+        dpi = get_thumbnail_dpi(os.path.join(self.SAMPLE_FILES, "simple.pdf"))
+        self.assertAlmostEqual(dpi, 500 * 72 / 612)
+
+    @override_settings(THUMBNAIL_ENGINE="ghostscript")
+    @mock.patch("documents.parsers.run_thumbnail_convert")
+    def test_ghostscript(self, m):
+        from PIL import Image
+
+        out_path = os.path.join(self.tempdir, "thumb.png")
+        make_thumbnail_from_first_page(
+            os.path.join(self.SAMPLE_FILES, "simple.pdf"), out_path)
+
+        m.assert_not_called()
+        with Image.open(out_path) as im:
+            self.assertAlmostEqual(im.width, 500, delta=1)
+
+    @override_settings(THUMBNAIL_ENGINE="ghostscript")
+    @mock.patch("documents.parsers.run_thumbnail_convert")
+    def test_ghostscript_image(self, m):
+        in_path = os.path.join(self.SAMPLE_FILES, "simple.png")
+        out_path = os.path.join(self.tempdir, "thumb.png")
+        make_thumbnail_from_first_page(in_path, out_path)
+
+        m.assert_called_once_with(in_path, out_path, None)
+
 
 class TestParserAvailability(TestCase):
 
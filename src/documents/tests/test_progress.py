@@ -0,0 +1,101 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from documents.progress import ProgressPublisher
+
+
+def payload(task_id, current_progress, status="WORKING"):
+    return {
+        'task_id': task_id,
+        'current_progress': current_progress,
+        'status': status
+    }
+
+
+class TestProgressPublisher(TestCase):
+
+    def test_send(self):
+        send = mock.Mock()
+        publisher = ProgressPublisher(send, max_rate=0)
+
+        publisher.publish(payload("a", 0, "STARTING"))
+        self.assertTrue(publisher.flush(timeout=5))
+
+        send.assert_called_once_with(payload("a", 0, "STARTING"))
+
+    def test_coalesce(self):
+        send = mock.Mock()
+        publisher = ProgressPublisher(send, max_rate=1)
+
+        for i in range(50):
+            publisher.publish(payload("a", i))
+        publisher.publish(payload("a", 100, "SUCCESS"))
+        self.assertTrue(publisher.flush(timeout=5))
+
+        sent = [c[0][0] for c in send.call_args_list]
+        self.assertLess(len(sent), 51)
+        self.assertEqual(sent[-1], payload("a", 100, "SUCCESS"))
+
+    def test_rate_per_task(self):
+        send = mock.Mock()
+        publisher = ProgressPublisher(send, max_rate=1)
+
+        publisher.publish(payload("a", 0))
+        publisher.publish(payload("b", 0))
+        time.sleep(0.2)
+        # The first update of every task is sent right away.
+        self.assertEqual(send.call_count, 2)
+
+        publisher.publish(payload("a", 50))
+        time.sleep(0.2)
+        # The next one waits for the interval to pass.
+        self.assertEqual(send.call_count, 2)
+        time.sleep(1)
+        self.assertEqual(send.call_count, 3)
+        send.assert_called_with(payload("a", 50))
+
+    def test_flush_nothing_pending(self):
+        send = mock.Mock()
+        publisher = ProgressPublisher(send, max_rate=1)
+
+        publisher.publish(payload("a", 0))
+        self.assertTrue(publisher.flush(timeout=5))
+        self.assertTrue(publisher.flush(timeout=5))
+
+        # The empty flush must not let the next update skip the rate limit.
+        publisher.publish(payload("a", 50))
+        time.sleep(0.2)
+        self.assertEqual(send.call_count, 1)
+
+    def test_publish_does_not_block(self):
+        event = threading.Event()
+        send = mock.Mock(side_effect=lambda p: event.wait(5))
+        publisher = ProgressPublisher(send, max_rate=0)
+
+        start = time.monotonic()
+        publisher.publish(payload("a", 0))
+        publisher.publish(payload("a", 10))
+        self.assertLess(time.monotonic() - start, 1)
+
+        event.set()
+        self.assertTrue(publisher.flush(timeout=5))
+        send.assert_called_with(payload("a", 10))
+
+    def test_send_error(self):
+        send = mock.Mock(side_effect=[Exception("redis is gone"), None])
+        publisher = ProgressPublisher(send, max_rate=0)
+
+        publisher.publish(payload("a", 0))
+        self.assertTrue(publisher.flush(timeout=5))
+        publisher.publish(payload("a", 100, "FAILED"))
+        self.assertTrue(publisher.flush(timeout=5))
+
+        self.assertEqual(send.call_count, 2)
+
+    @override_settings(CONSUMER_PROGRESS_RATE=4)
+    def test_rate_from_settings(self):
+        publisher = ProgressPublisher(mock.Mock())
+        self.assertEqual(publisher._interval, 0.25)
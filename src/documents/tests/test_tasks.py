@@ -6,6 +6,7 @@ from django.test import TestCase
 from django.utils import timezone
 
 from documents import tasks
+from documents.consumer import ConsumerError
 from documents.models import Document, Tag, Correspondent, DocumentType
 from documents.sanity_checker import SanityCheckMessages, SanityCheckFailedException
 from documents.tests.utils import DirectoriesMixin
@@ -103,8 +104,101 @@ class TestTasks(DirectoriesMixin, TestCase):
         self.assertEqual(tasks.sanity_check(), "Sanity check exited with infos. See log.")
         m.assert_called_once()
 
+    @mock.patch("documents.tasks.Consumer")
+    def test_consume_files(self, m):
+        doc = Document.objects.create(title="test", content="my document", checksum="wow", added=timezone.now(),
+                                      created=timezone.now(), modified=timezone.now())
+        consumer = m.return_value
+        consumer.try_consume_file.side_effect = [doc, ConsumerError("b.pdf: It is a duplicate.")]
+
+        result = tasks.consume_files(["/consume/a.pdf", {'path': "/consume/b", 'override_filename': "b.pdf", 'override_tag_ids': [1]}])
+
+        # classifier and matching models are set up only once.
+        m.assert_called_once()
+        self.assertIn("matching_snapshot", m.call_args[1])
+        self.assertIsNotNone(consumer.index_writer)
+
+        self.assertEqual(consumer.try_consume_file.call_count, 2)
+        consumer.try_consume_file.assert_any_call(path="/consume/a.pdf")
+        consumer.try_consume_file.assert_any_call(path="/consume/b", override_filename="b.pdf", override_tag_ids=[1])
+
+        self.assertEqual(result.splitlines(), [
+            "Consumed 1 of 2 files.",
+            f"a.pdf: Success. New document id {doc.pk} created",
+            "Failed. b.pdf: It is a duplicate."
+        ])
+
+    @mock.patch("documents.tasks.Consumer")
+    def test_consume_files_all_failed(self, m):
+        m.return_value.try_consume_file.side_effect = [ConsumerError("a.pdf: error"), Exception("unexpected")]
+
+        self.assertRaises(ConsumerError, tasks.consume_files, ["/consume/a.pdf", "/consume/b.pdf"])
+        self.assertEqual(m.return_value.try_consume_file.call_count, 2)
+
+    @mock.patch("documents.tasks.BATCH_TIME_LIMIT", 0)
+    @mock.patch("documents.tasks.async_task")
+    @mock.patch("documents.tasks.Consumer")
+    def test_consume_files_time_limit(self, m, async_task):
+        doc = Document.objects.create(title="test", content="my document", checksum="wow", added=timezone.now(),
+                                      created=timezone.now(), modified=timezone.now())
+        m.return_value.try_consume_file.return_value = doc
+
+        result = tasks.consume_files(["/consume/a.pdf", "/consume/b.pdf", "/consume/c.pdf"])
+
+        # At least one file is consumed, the others are queued again.
+        m.return_value.try_consume_file.assert_called_once_with(path="/consume/a.pdf")
+        async_task.assert_called_once()
+        args, kwargs = async_task.call_args
+        self.assertEqual(args, ("documents.tasks.consume_files", ["/consume/b.pdf", "/consume/c.pdf"]))
+        self.assertIn("Queued the remaining 2 files in a new task.", result)
+
     def test_bulk_update_documents(self):
         doc1 = Document.objects.create(title="test", content="my document", checksum="wow", added=timezone.now(),
                                 created=timezone.now(), modified=timezone.now())
 
         tasks.bulk_update_documents([doc1.pk])
+
+    def _make_unoptimised_thumbnail(self):
+        doc = Document.objects.create(title="test", checksum="A", mime_type="application/pdf", thumbnail_optimised=False)
+        with open(doc.thumbnail_path, "wb") as f:
+            f.write(b"unoptimised")
+        return doc
+
+    @mock.patch("documents.tasks.run_optipng")
+    def test_optimise_thumbnail(self, m):
+        def optipng(in_path, out_path, low_priority):
+            with open(out_path, "wb") as f:
+                f.write(b"optimised")
+        m.side_effect = optipng
+        doc = self._make_unoptimised_thumbnail()
+
+        tasks.optimise_thumbnail(doc.pk)
+
+        doc.refresh_from_db()
+        self.assertTrue(doc.thumbnail_optimised)
+        with open(doc.thumbnail_path, "rb") as f:
+            self.assertEqual(f.read(), b"optimised")
+        self.assertEqual(os.listdir(self.dirs.thumbnail_dir), [os.path.basename(doc.thumbnail_path)])
+
+        tasks.optimise_thumbnail(doc.pk)
+        m.assert_called_once()
+
+    @mock.patch("documents.tasks.run_optipng")
+    def test_optimise_thumbnail_replaced(self, m):
+        doc = self._make_unoptimised_thumbnail()
+
+        def optipng(in_path, out_path, low_priority):
+            with open(out_path, "wb") as f:
+                f.write(b"optimised")
+            # A new thumbnail is generated in the meantime.
+            with open(doc.thumbnail_path, "wb") as f:
+                f.write(b"new thumbnail")
+        m.side_effect = optipng
+
+        tasks.optimise_thumbnail(doc.pk)
+
+        doc.refresh_from_db()
+        self.assertFalse(doc.thumbnail_optimised)
+        with open(doc.thumbnail_path, "rb") as f:
+            self.assertEqual(f.read(), b"new thumbnail")
+        self.assertEqual(os.listdir(self.dirs.thumbnail_dir), [os.path.basename(doc.thumbnail_path)])
@@ -42,6 +42,9 @@ def setup_directories():
         LOGGING_DIR=dirs.logging_dir,
         INDEX_DIR=dirs.index_dir,
         MODEL_FILE=os.path.join(dirs.data_dir, "classification_model.pickle"),
+        CONSUMER_JOURNAL_FILE=os.path.join(dirs.data_dir, "consumer-journal.sqlite3"),
+        OCR_CACHE_DIR=os.path.join(dirs.data_dir, "ocr-cache"),
+        OCR_GOVERNOR_FILE=os.path.join(dirs.data_dir, "cpu-governor.json"),
         MEDIA_LOCK=os.path.join(dirs.media_dir, "media.lock")
 
     )
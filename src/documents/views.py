@@ -1,3 +1,4 @@
+import io
 import logging
 import os
 import tempfile
@@ -10,6 +11,7 @@ from django.conf import settings
 from django.db.models import Count, Max, Case, When, IntegerField
 from django.db.models.functions import Lower
 from django.http import HttpResponse, HttpResponseBadRequest, Http404
+from django.utils.cache import patch_vary_headers
 from django.utils.translation import get_language
 from django.views.decorators.cache import cache_control
 from django.views.generic import TemplateView
@@ -47,8 +49,10 @@ from .filters import (
     DocumentTypeFilterSet
 )
 from .matching import match_correspondents, match_tags, match_document_types
-from .models import Correspondent, Document, Tag, DocumentType, SavedView
-from .parsers import get_parser_class_for_mime_type
+from .models import Correspondent, Document, Tag, DocumentType, SavedView, \
+    ProcessingRecord
+from .parsers import get_parser_class_for_mime_type, convert_thumbnail, \
+    THUMBNAIL_MIME_TYPES
 from .serialisers import (
     CorrespondentSerializer,
     DocumentSerializer,
@@ -59,7 +63,8 @@ from .serialisers import (
     SavedViewSerializer,
     BulkEditSerializer,
     DocumentListSerializer,
-    BulkDownloadSerializer
+    BulkDownloadSerializer,
+    ProcessingRecordSerializer
 )
 
 
@@ -275,6 +280,15 @@ class DocumentViewSet(RetrieveModelMixin,
 
         return Response(meta)
 
+    @action(methods=['get'], detail=True)
+    def processing(self, request, pk=None):
+        try:
+            record = ProcessingRecord.objects.get(document__pk=pk)
+        except ProcessingRecord.DoesNotExist:
+            raise Http404()
+
+        return Response(ProcessingRecordSerializer(record).data)
+
     @action(methods=['get'], detail=True)
     def suggestions(self, request, pk=None):
         try:
@@ -312,10 +326,26 @@ class DocumentViewSet(RetrieveModelMixin,
                 handle = GnuPG.decrypted(doc.thumbnail_file)
             else:
                 handle = doc.thumbnail_file
+
+            thumbnail_format = doc.thumbnail_format
+            if thumbnail_format == Document.THUMBNAIL_FORMAT_WEBP and \
+                    "image/webp" not in request.META.get("HTTP_ACCEPT", ""):
+                # Clients that don't support WebP receive a PNG file.
+                if isinstance(handle, bytes):
+                    handle = io.BytesIO(handle)
+                with handle:
+                    png = io.BytesIO()
+                    convert_thumbnail(handle, png, "png")
+                handle = png.getvalue()
+                thumbnail_format = Document.THUMBNAIL_FORMAT_PNG
+
             # TODO: Send ETag information and use that to send new thumbnails
             #  if available
-            return HttpResponse(handle,
-                                content_type='image/png')
+            response = HttpResponse(
+                handle,
+                content_type=THUMBNAIL_MIME_TYPES[thumbnail_format])
+            patch_vary_headers(response, ["Accept"])
+            return response
         except (FileNotFoundError, Document.DoesNotExist):
             raise Http404()
 
@@ -62,6 +62,9 @@ DATA_DIR = os.getenv('PAPERLESS_DATA_DIR', os.path.join(BASE_DIR, "..", "data"))
 MEDIA_LOCK = os.path.join(MEDIA_ROOT, "media.lock")
 INDEX_DIR = os.path.join(DATA_DIR, "index")
 MODEL_FILE = os.path.join(DATA_DIR, "classification_model.pickle")
+CONSUMER_JOURNAL_FILE = os.path.join(DATA_DIR, "consumer-journal.sqlite3")
+OCR_CACHE_DIR = os.path.join(DATA_DIR, "ocr-cache")
+OCR_GOVERNOR_FILE = os.path.join(DATA_DIR, "cpu-governor.json")
 
 LOGGING_DIR = os.getenv('PAPERLESS_LOGGING_DIR', os.path.join(DATA_DIR, "log"))
 
@@ -457,6 +460,8 @@ CONSUMER_POLLING_RETRY_COUNT = int(
 
 CONSUMER_DELETE_DUPLICATES = __get_boolean("PAPERLESS_CONSUMER_DELETE_DUPLICATES")
 
+CONSUMER_PRECHECK_DUPLICATES = __get_boolean("PAPERLESS_CONSUMER_PRECHECK_DUPLICATES")
+
 CONSUMER_RECURSIVE = __get_boolean("PAPERLESS_CONSUMER_RECURSIVE")
 
 # Ignore glob patterns, relative to PAPERLESS_CONSUMPTION_DIR
@@ -467,8 +472,28 @@ CONSUMER_IGNORE_PATTERNS = list(
 
 CONSUMER_SUBDIRS_AS_TAGS = __get_boolean("PAPERLESS_CONSUMER_SUBDIRS_AS_TAGS")
 
+# auto, copy
+CONSUMER_FILE_PLACEMENT = os.getenv("PAPERLESS_CONSUMER_FILE_PLACEMENT", "auto")
+
+CONSUMER_FSYNC = __get_boolean("PAPERLESS_CONSUMER_FSYNC")
+
+CONSUMER_PROGRESS_RATE = float(os.getenv("PAPERLESS_CONSUMER_PROGRESS_RATE", 2))
+
+CONSUMER_BATCH_SIZE = max(int(os.getenv("PAPERLESS_CONSUMER_BATCH_SIZE", 1)), 1)
+
 OPTIMIZE_THUMBNAILS = __get_boolean("PAPERLESS_OPTIMIZE_THUMBNAILS", "true")
 
+OPTIMIZE_THUMBNAILS_DEFERRED = __get_boolean(
+    "PAPERLESS_OPTIMIZE_THUMBNAILS_DEFERRED")
+
+# png, webp
+THUMBNAIL_FORMAT = os.getenv("PAPERLESS_THUMBNAIL_FORMAT", "png")
+
+PIPELINE_THUMBNAILS = __get_boolean("PAPERLESS_PIPELINE_THUMBNAILS")
+
+# convert, ghostscript
+THUMBNAIL_ENGINE = os.getenv("PAPERLESS_THUMBNAIL_ENGINE", "convert")
+
 OCR_PAGES = int(os.getenv('PAPERLESS_OCR_PAGES', 0))
 
 # The default language that tesseract will attempt to use when parsing
@@ -485,6 +510,9 @@ OCR_MODE = os.getenv("PAPERLESS_OCR_MODE", "skip")
 
 OCR_IMAGE_DPI = os.getenv("PAPERLESS_OCR_IMAGE_DPI")
 
+# Images with a higher resolution are downsampled before OCR. 0 disables this.
+OCR_MAX_IMAGE_DPI = int(os.getenv("PAPERLESS_OCR_MAX_IMAGE_DPI", 0))
+
 OCR_CLEAN = os.getenv("PAPERLESS_OCR_CLEAN", "clean")
 
 OCR_DESKEW = __get_boolean("PAPERLESS_OCR_DESKEW", "true")
@@ -495,6 +523,22 @@ OCR_ROTATE_PAGES_THRESHOLD = float(os.getenv("PAPERLESS_OCR_ROTATE_PAGES_THRESHO
 
 OCR_USER_ARGS = os.getenv("PAPERLESS_OCR_USER_ARGS", "{}")
 
+# Documents with more pages are split into parts which are OCR'ed by several
+# task workers at once. 0 disables this.
+OCR_SPLIT_THRESHOLD = int(os.getenv("PAPERLESS_OCR_SPLIT_THRESHOLD", 0))
+
+OCR_SPLIT_PAGES = max(int(os.getenv("PAPERLESS_OCR_SPLIT_PAGES", 50)), 1)
+
+# Size of the OCR result cache in MiB. 0 disables the cache.
+OCR_CACHE_SIZE = int(os.getenv("PAPERLESS_OCR_CACHE_SIZE", 0))
+
+# Number of CPU tokens that the OCR jobs of all task workers share. 0 disables
+# the governor, and every job uses THREADS_PER_WORKER threads.
+OCR_CPU_TOKENS = int(os.getenv("PAPERLESS_OCR_CPU_TOKENS", 0))
+
+# pdfminer, pdftotext
+PDF_TEXT_BACKEND = os.getenv("PAPERLESS_PDF_TEXT_BACKEND", "pdfminer")
+
 # GNUPG needs a home directory for some reason
 GNUPG_HOME = os.getenv("HOME", "/tmp")
 
@@ -507,6 +551,8 @@ GS_BINARY = os.getenv("PAPERLESS_GS_BINARY", "gs")
 
 OPTIPNG_BINARY = os.getenv("PAPERLESS_OPTIPNG_BINARY", "optipng")
 
+PDFTOTEXT_BINARY = os.getenv("PAPERLESS_PDFTOTEXT_BINARY", "pdftotext")
+
 
 # Pre-2.x versions of Paperless stored your documents locally with GPG
 # encryption, but that is no longer the default.  This behaviour is still
@@ -540,12 +586,19 @@ PAPERLESS_FILENAME_FORMAT = os.getenv("PAPERLESS_FILENAME_FORMAT")
 
 THUMBNAIL_FONT_NAME = os.getenv("PAPERLESS_THUMBNAIL_FONT_NAME", "/usr/share/fonts/liberation/LiberationSerif-Regular.ttf")
 
+# Maximum number of characters stored as the content of plain text files.
+# 0 disables the limit.
+TEXT_MAX_LENGTH = int(os.getenv("PAPERLESS_TEXT_MAX_LENGTH", 10000000))
+
 # Tika settings
 PAPERLESS_TIKA_ENABLED = __get_boolean("PAPERLESS_TIKA_ENABLED", "NO")
 PAPERLESS_TIKA_ENDPOINT = os.getenv("PAPERLESS_TIKA_ENDPOINT", "http://localhost:9998")
 PAPERLESS_TIKA_GOTENBERG_ENDPOINT = os.getenv(
     "PAPERLESS_TIKA_GOTENBERG_ENDPOINT", "http://localhost:3000"
 )
+# Seconds to wait for data from Tika and Gotenberg. 0 waits forever.
+PAPERLESS_TIKA_TIMEOUT = float(os.getenv("PAPERLESS_TIKA_TIMEOUT", 300))
+PAPERLESS_TIKA_RETRIES = int(os.getenv("PAPERLESS_TIKA_RETRIES", 2))
 
 if PAPERLESS_TIKA_ENABLED:
     INSTALLED_APPS.append("paperless_tika.apps.PaperlessTikaConfig")
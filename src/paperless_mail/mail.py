@@ -104,6 +104,59 @@ class MailAccountHandler(LoggingMixin):
 
     logging_name = "paperless_mail"
 
+    def __init__(self):
+        super().__init__()
+        # Attachments waiting to be consumed in a single batch, see
+        # PAPERLESS_CONSUMER_BATCH_SIZE, and the mails they belong to.
+        self.consumption_batch = []
+        self.consumption_batch_messages = set()
+        # Mails with attachments in a batch that could not be queued. Their
+        # post-consume action must not run.
+        self.unqueued_messages = set()
+
+    def _queue_consumption(self, message_uid, task_name, **kwargs):
+        if settings.CONSUMER_BATCH_SIZE <= 1:
+            async_task("documents.tasks.consume_file",
+                       task_name=task_name,
+                       **kwargs)
+            return
+
+        self.consumption_batch.append(kwargs)
+        self.consumption_batch_messages.add(message_uid)
+        if len(self.consumption_batch) >= settings.CONSUMER_BATCH_SIZE:
+            self._flush_consumption_batch()
+
+    def _flush_consumption_batch(self):
+        batch = self.consumption_batch
+        messages = self.consumption_batch_messages
+        self.consumption_batch = []
+        self.consumption_batch_messages = set()
+        if not batch:
+            return
+
+        self.log(
+            'debug',
+            f"Adding a batch of {len(batch)} attachment(s) to the task queue")
+
+        try:
+            async_task(
+                "documents.tasks.consume_files",
+                batch,
+                task_name=f"{len(batch)} mail attachments"
+            )
+        except Exception as e:
+            self.log(
+                "error",
+                f"Error while adding a batch of {len(batch)} attachment(s) "
+                f"to the task queue: {e}",
+                exc_info=True)
+            for kwargs in batch:
+                try:
+                    os.unlink(kwargs['path'])
+                except OSError:
+                    pass
+            self.unqueued_messages |= messages
+
     def _correspondent_from_name(self, name):
         try:
             return Correspondent.objects.get_or_create(name=name)[0]
@@ -209,6 +262,7 @@ class MailAccountHandler(LoggingMixin):
                 f"Rule {rule}: Error while fetching folder {rule.folder}")
 
         post_consume_messages = []
+        self.unqueued_messages = set()
 
         mails_processed = 0
         total_processed_files = 0
@@ -232,6 +286,12 @@ class MailAccountHandler(LoggingMixin):
             'debug',
             f"Rule {rule}: Processed {mails_processed} matching mail(s)")
 
+        # The mails must not be moved or deleted before their attachments
+        # are in the task queue.
+        self._flush_consumption_batch()
+        post_consume_messages = [uid for uid in post_consume_messages
+                                 if uid not in self.unqueued_messages]
+
         self.log(
             'debug',
             f"Rule {rule}: Running mail actions on "
@@ -300,8 +360,8 @@ class MailAccountHandler(LoggingMixin):
                     f"Consuming attachment {att.filename} from mail "
                     f"{message.subject} from {message.from_}")
 
-                async_task(
-                    "documents.tasks.consume_file",
+                self._queue_consumption(
+                    message.uid,
                     path=temp_filename,
                     override_filename=pathvalidate.sanitize_filename(att.filename),  # NOQA: E501
                     override_title=title,
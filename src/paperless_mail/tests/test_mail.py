@@ -6,7 +6,7 @@ from unittest import mock
 
 from django.core.management import call_command
 from django.db import DatabaseError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from imap_tools import MailMessageFlags, MailboxFolderSelectError
 
 from documents.models import Correspondent
@@ -338,6 +338,40 @@ class TestMail(DirectoriesMixin, TestCase):
         self.assertEqual(len(self.bogus_mailbox.fetch("UNSEEN", False)), 0)
         self.assertEqual(len(self.bogus_mailbox.messages), 3)
 
+    @override_settings(CONSUMER_BATCH_SIZE=10)
+    def test_handle_mail_account_batched(self):
+        account = MailAccount.objects.create(name="test", imap_server="", username="admin", password="secret")
+
+        rule = MailRule.objects.create(name="testrule", account=account, action=MailRule.ACTION_MARK_READ)
+
+        self.mail_account_handler.handle_mail_account(account)
+
+        self.async_task.assert_called_once()
+        args, kwargs = self.async_task.call_args
+        self.assertEqual(args[0], "documents.tasks.consume_files")
+        self.assertEqual(len(args[1]), 2)
+        for file in args[1]:
+            self.assertTrue(os.path.isfile(file['path']))
+            self.assertNotIn('task_name', file)
+        self.assertListEqual(self.mail_account_handler.consumption_batch, [])
+
+    @override_settings(CONSUMER_BATCH_SIZE=10)
+    def test_handle_mail_account_batch_failed(self):
+        account = MailAccount.objects.create(name="test", imap_server="", username="admin", password="secret")
+
+        rule = MailRule.objects.create(name="testrule", account=account, action=MailRule.ACTION_MARK_READ)
+
+        self.async_task.side_effect = Exception("redis is gone")
+
+        self.mail_account_handler.handle_mail_account(account)
+
+        self.async_task.assert_called_once()
+        args, kwargs = self.async_task.call_args
+        for file in args[1]:
+            self.assertFalse(os.path.isfile(file['path']))
+        # The mails are left alone so that they are processed again.
+        self.assertEqual(len(self.bogus_mailbox.fetch("UNSEEN", False)), 2)
+
     def test_handle_mail_account_delete(self):
 
         account = MailAccount.objects.create(name="test", imap_server="", username="admin", password="secret")
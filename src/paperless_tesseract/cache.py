@@ -0,0 +1,146 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+
+logger = logging.getLogger("paperless.parsing.tesseract")
+
+# These don't change the result of OCRmyPDF.
+IGNORED_ARGS = (
+    'input_file', 'output_file', 'sidecar', 'jobs', 'use_threads',
+    'progress_bar'
+)
+
+ARCHIVE_FILE = "archive.pdf"
+SIDECAR_FILE = "sidecar.txt"
+
+
+@functools.lru_cache(maxsize=None)
+def tesseract_version():
+    # Different versions of tesseract recognise text differently.
+    try:
+        result = subprocess.run(["tesseract", "--version"],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+    except OSError:
+        return None
+    lines = result.stdout.decode(errors="replace").splitlines()
+    return lines[0].strip() if lines else None
+
+
+class OCRCache:
+    """
+    Archive files and sidecar texts created by OCRmyPDF, keyed by the checksum
+    of the original file, the OCRmyPDF arguments and the versions of OCRmyPDF
+    and tesseract. Each entry is a directory
+    named after its key. Using an entry updates its modification time, and the
+    least recently used entries are removed once the cache grows beyond
+    max_size bytes.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, checksum, ocr_args, preprocessing=None):
+        """
+        checksum is the checksum of the original document. preprocessing
+        describes how the document was changed before it was handed to
+        OCRmyPDF, if at all.
+        """
+        import ocrmypdf
+
+        args = {
+            k: v for k, v in ocr_args.items() if k not in IGNORED_ARGS
+        }
+        args['sidecar'] = 'sidecar' in ocr_args
+
+        return hashlib.sha256(json.dumps(
+            [checksum, ocrmypdf.__version__, tesseract_version(), args,
+             preprocessing],
+            sort_keys=True,
+            default=str
+        ).encode()).hexdigest()
+
+    def get(self, key, archive_path, sidecar_path=None):
+        """
+        Copy the cached files of key to the given paths. Returns False if
+        there is no such entry.
+        """
+        entry = os.path.join(self.directory, key)
+        try:
+            shutil.copyfile(os.path.join(entry, ARCHIVE_FILE), archive_path)
+            if sidecar_path and \
+                    os.path.isfile(os.path.join(entry, SIDECAR_FILE)):
+                shutil.copyfile(
+                    os.path.join(entry, SIDECAR_FILE), sidecar_path)
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"Error while reading from the OCR cache: {e}")
+            return False
+
+        return True
+
+    def put(self, key, archive_path, sidecar_path=None):
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Fill the entry before it becomes visible, since other workers
+            # might use the cache at the same time.
+            tempdir = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+            shutil.copyfile(archive_path, os.path.join(tempdir, ARCHIVE_FILE))
+            if sidecar_path and os.path.isfile(sidecar_path):
+                shutil.copyfile(
+                    sidecar_path, os.path.join(tempdir, SIDECAR_FILE))
+            try:
+                os.rename(tempdir, entry)
+            except OSError:
+                # Another worker stored the same entry in the meantime.
+                shutil.rmtree(tempdir, ignore_errors=True)
+        except OSError as e:
+            logger.warning(f"Error while writing to the OCR cache: {e}")
+            return
+
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_dir() or entry.name.startswith("."):
+                    continue
+                try:
+                    size = sum(
+                        f.stat().st_size for f in os.scandir(entry.path))
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((mtime, size, entry.path))
+                total_size += size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            logger.debug(f"Removing {path} from the OCR cache")
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+
+def get_ocr_cache():
+    if settings.OCR_CACHE_SIZE <= 0:
+        return None
+    return OCRCache(settings.OCR_CACHE_DIR,
+                    settings.OCR_CACHE_SIZE * 1024 * 1024)
@@ -1,8 +1,11 @@
+import shutil
 import subprocess
 
 from django.conf import settings
 from django.core.checks import Error, Warning, register
 
+from paperless_tesseract.extraction import TEXT_EXTRACTION_BACKENDS
+
 
 def get_tesseract_langs():
     with subprocess.Popen(['tesseract', '--list-langs'],
@@ -32,3 +35,22 @@ def check_default_language_available(app_configs, **kwargs):
                 f"without it. Please fix PAPERLESS_OCR_LANGUAGE.")]
 
     return []
+
+
+@register()
+def check_text_extraction_backend(app_configs, **kwargs):
+    if settings.PDF_TEXT_BACKEND not in TEXT_EXTRACTION_BACKENDS:
+        return [Error(
+            f"PAPERLESS_PDF_TEXT_BACKEND is set to "
+            f"{settings.PDF_TEXT_BACKEND}, which is not one of "
+            f"{', '.join(TEXT_EXTRACTION_BACKENDS)}.")]
+
+    if settings.PDF_TEXT_BACKEND == "pdftotext" and \
+            shutil.which(settings.PDFTOTEXT_BINARY) is None:
+        return [Warning(
+            f"Paperless can't find {settings.PDFTOTEXT_BINARY}, so it will "
+            f"use pdfminer.six to extract text from PDF documents instead.",
+            "Either it's not in your ${PATH} or it's not installed."
+        )]
+
+    return []
@@ -0,0 +1,74 @@
+import subprocess
+
+from django.conf import settings
+
+
+class TextExtractionBackend:
+    """
+    Extracts the text layer of PDF files. Backends return the text of every
+    page, each followed by a form feed, so that the joined texts are the text
+    of the entire file.
+    """
+
+    name = None
+
+    def extract_page_texts(self, pdf_file):
+        raise NotImplementedError()
+
+
+class PdfminerBackend(TextExtractionBackend):
+    """
+    Uses pdfminer.six. This is pure Python and therefore slow on large files,
+    but doesn't require any additional software.
+    """
+
+    name = "pdfminer"
+
+    def extract_page_texts(self, pdf_file):
+        from io import StringIO
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+
+        page_texts = []
+        with open(pdf_file, "rb") as f, StringIO() as output:
+            manager = PDFResourceManager()
+            device = TextConverter(manager, output, laparams=LAParams())
+            interpreter = PDFPageInterpreter(manager, device)
+            for page in PDFPage.get_pages(f):
+                interpreter.process_page(page)
+                page_texts.append(output.getvalue())
+                output.seek(0)
+                output.truncate()
+        return page_texts
+
+
+class PdftotextBackend(TextExtractionBackend):
+    """
+    Uses pdftotext from poppler-utils, which is many times faster than
+    pdfminer.six.
+    """
+
+    name = "pdftotext"
+
+    def extract_page_texts(self, pdf_file):
+        result = subprocess.run(
+            [settings.PDFTOTEXT_BINARY, "-q", "-enc", "UTF-8", pdf_file, "-"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        text = result.stdout.decode("utf-8", errors="replace")
+        # pdftotext terminates every page with a form feed as well.
+        return [page + "\f" for page in text.split("\f")[:-1]]
+
+
+TEXT_EXTRACTION_BACKENDS = {
+    backend.name: backend
+    for backend in (PdfminerBackend, PdftotextBackend)
+}
+
+
+def get_text_extraction_backend(name=None):
+    return TEXT_EXTRACTION_BACKENDS[name or settings.PDF_TEXT_BACKEND]()
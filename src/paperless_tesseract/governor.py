@@ -0,0 +1,164 @@
+import json
+import logging
+import multiprocessing
+import os
+import uuid
+
+from django.conf import settings
+from filelock import FileLock
+
+logger = logging.getLogger("paperless.parsing.tesseract")
+
+
+def _start_time(pid):
+    """
+    The time the process started, in clock ticks since boot, or None if
+    unknown.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+        # The process name may contain spaces and parentheses.
+        return int(stat[stat.rindex(")") + 1:].split()[19])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _is_alive(pid, started=None):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Pids are reused, e.g. when the container restarts, so a process with
+    # the same pid that started at another time is not the one we're
+    # looking for.
+    if started is not None and _start_time(pid) != started:
+        return False
+    return True
+
+
+class CPUGovernor:
+    """
+    Hands out CPU tokens to the OCR jobs of all task workers on this host.
+    OCRmyPDF processes one page per thread, so a job asks for a token per
+    page. It receives up to its share of the tokens (total / workers) and
+    may borrow up to another share from the tokens that are free, but never
+    more than half of these, so that jobs starting later get tokens as well.
+    Every job gets at least one token. Small documents therefore don't hold
+    threads they can't use, and large documents can use some of the cores
+    that other workers leave idle.
+
+    The tokens are recorded in a JSON file, since the workers are separate
+    processes. Tokens of processes that died are returned automatically.
+    """
+
+    def __init__(self, path, total, workers=1):
+        self.path = path
+        self.total = total
+        self.share = max(total // max(workers, 1), 1)
+        self._lock = FileLock(path + ".lock")
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {
+            key: entry for key, entry in state.items()
+            if _is_alive(entry['pid'], entry.get('started'))
+        }
+
+    def _write(self, state):
+        temp_path = f"{self.path}.{os.getpid()}"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def _available(self, allocated):
+        available = self.total - allocated
+        try:
+            # Our own OCR jobs are part of the load average as well.
+            external_load = max(os.getloadavg()[0] - allocated, 0)
+            available = min(
+                available, multiprocessing.cpu_count() - external_load)
+        except (AttributeError, OSError):
+            pass
+        return int(available)
+
+    def acquire(self, wanted):
+        """
+        Return a key and the number of tokens granted, which are returned with
+        release(key).
+        """
+        with self._lock:
+            state = self._read()
+            allocated = sum(entry['tokens'] for entry in state.values())
+            available = max(self._available(allocated), 0)
+            share = min(self.share, available)
+            borrowed = min(self.share, (available - share) // 2)
+            granted = max(min(wanted, share + borrowed), 1)
+            key = uuid.uuid4().hex
+            state[key] = {
+                'pid': os.getpid(),
+                'started': _start_time(os.getpid()),
+                'tokens': granted
+            }
+            self._write(state)
+        return key, granted
+
+    def release(self, key):
+        try:
+            with self._lock:
+                state = self._read()
+                state.pop(key, None)
+                self._write(state)
+        except Exception as e:
+            # The tokens are returned anyway once this process exits.
+            logger.warning(f"Error while returning CPU tokens: {e}")
+
+
+def get_cpu_governor():
+    if settings.OCR_CPU_TOKENS <= 0:
+        return None
+    return CPUGovernor(settings.OCR_GOVERNOR_FILE,
+                       settings.OCR_CPU_TOKENS,
+                       settings.TASK_WORKERS)
+
+
+def _count_pages(input_file):
+    import pikepdf
+
+    try:
+        with pikepdf.open(input_file) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        # Images are a single page.
+        return 1
+
+
+def ocr(ocr_args):
+    """
+    Call OCRmyPDF with as many jobs as the CPU governor grants, or with
+    THREADS_PER_WORKER jobs if the governor is disabled.
+    """
+    import ocrmypdf
+
+    governor = get_cpu_governor()
+    if not governor:
+        return ocrmypdf.ocr(**ocr_args)
+
+    wanted = _count_pages(ocr_args['input_file'])
+    try:
+        key, jobs = governor.acquire(wanted)
+    except Exception as e:
+        logger.warning(f"Error while acquiring CPU tokens: {e}")
+        return ocrmypdf.ocr(**ocr_args)
+
+    logger.debug(f"Running OCRmyPDF with {jobs} jobs for {wanted} pages")
+    try:
+        return ocrmypdf.ocr(**dict(ocr_args, jobs=jobs))
+    finally:
+        governor.release(key)
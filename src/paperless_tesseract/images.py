@@ -0,0 +1,125 @@
+import logging
+import os
+
+from PIL import Image, ImageSequence
+
+logger = logging.getLogger("paperless.parsing.tesseract")
+
+# Modes that OCRmyPDF handles without converting the image itself.
+OCR_MODES = ("1", "L", "RGB")
+
+# Quality at which frames that were JPEG compressed to begin with are encoded
+# again after they were converted or downsampled. img2pdf embeds the JPEG
+# files without decoding them once more.
+JPEG_QUALITY = 95
+
+
+def _frame_dpi(frame, default_dpi):
+    try:
+        x, y = frame.info['dpi']
+        if x:
+            return round(x)
+    except (KeyError, TypeError, ValueError):
+        pass
+    if default_dpi:
+        return int(default_dpi)
+    # Assume that the image is as wide as an A4 page (210mm).
+    return int(frame.width / (21 / 2.54))
+
+
+def _is_lossy(image, frame):
+    # Storing frames that are lossy already as PNG would make the PDF file
+    # several times larger without any gain in quality.
+    return image.format in ("JPEG", "MPO") or \
+        frame.info.get("compression") in ("jpeg", "tiff_jpeg")
+
+
+def _to_ocr_mode(frame):
+    if frame.mode in OCR_MODES:
+        return frame
+
+    if frame.mode in ("RGBA", "LA", "PA") or \
+            (frame.mode == "P" and "transparency" in frame.info):
+        # Put transparent images on a white page.
+        frame = frame.convert("RGBA")
+        page = Image.new("RGB", frame.size, "white")
+        page.paste(frame, mask=frame.getchannel("A"))
+        return page
+
+    if frame.mode.startswith("I;16") or frame.mode in ("I", "F"):
+        # 16 bit and floating point images are grayscale.
+        return frame.convert("I").point(lambda i: i * (1 / 256)).convert("L")
+
+    return frame.convert("RGB")
+
+
+def normalise_image(image_path, output_dir, max_dpi, default_dpi=None):
+    """
+    Prepare an image for OCR, one frame at a time: frames are converted to
+    8 bit grayscale or RGB and downsampled to max_dpi if their resolution is
+    higher. JPEG compressed frames stay JPEG, all others become PNG. Returns
+    the path to a PDF file with one page per frame, or None if the image can
+    be used as it is.
+    """
+    import img2pdf
+
+    page_files = []
+
+    with Image.open(image_path) as im:
+        # OCRmyPDF doesn't handle multi page images by itself.
+        changed = getattr(im, "n_frames", 1) > 1
+
+        jpeg_dpi = None
+        if im.format == "JPEG":
+            jpeg_dpi = _frame_dpi(im, default_dpi)
+            if jpeg_dpi > max_dpi:
+                # Let the decoder downsample by a power of 2, so that the
+                # full resolution image is never in memory.
+                width = im.width
+                im.draft(im.mode, (im.width * max_dpi // jpeg_dpi,
+                                   im.height * max_dpi // jpeg_dpi))
+                if im.width < width:
+                    jpeg_dpi = jpeg_dpi * im.width / width
+                    changed = True
+
+        for index, frame in enumerate(ImageSequence.Iterator(im)):
+            dpi = jpeg_dpi or _frame_dpi(frame, default_dpi)
+
+            page = _to_ocr_mode(frame)
+            if page is not frame:
+                changed = True
+
+            if dpi > max_dpi:
+                size = (max(round(page.width * max_dpi / dpi), 1),
+                        max(round(page.height * max_dpi / dpi), 1))
+                logger.debug(
+                    f"Downsampling page {index + 1} of {image_path} from "
+                    f"{round(dpi)} to {max_dpi} dpi")
+                if page.mode == "1":
+                    page = page.convert("L")
+                page = page.resize(size, Image.LANCZOS)
+                dpi = max_dpi
+                changed = True
+
+            if not changed:
+                # A single page image that is fine as it is.
+                return None
+
+            if _is_lossy(im, frame):
+                page_file = os.path.join(
+                    output_dir, f"normalised-{index:04d}.jpg")
+                page.save(page_file, "JPEG", quality=JPEG_QUALITY,
+                          dpi=(round(dpi), round(dpi)))
+            else:
+                page_file = os.path.join(
+                    output_dir, f"normalised-{index:04d}.png")
+                page.save(page_file, "PNG", dpi=(round(dpi), round(dpi)))
+            page_files.append(page_file)
+
+    pdf_file = os.path.join(output_dir, "normalised.pdf")
+    with open(pdf_file, "wb") as f:
+        img2pdf.convert(*page_files, outputstream=f)
+    for page_file in page_files:
+        os.unlink(page_file)
+
+    return pdf_file
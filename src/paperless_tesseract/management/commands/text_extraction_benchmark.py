@@ -0,0 +1,119 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+import documents
+from paperless_tesseract.extraction import TEXT_EXTRACTION_BACKENDS, \
+    get_text_extraction_backend
+from paperless_tesseract.parsers import post_process_text
+
+
+def _find_pdf_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    yield os.path.join(root, name)
+
+
+def _similarity(text_a, text_b):
+    # Compares the words of both texts, regardless of their order, since
+    # backends order text blocks differently.
+    words_a = Counter((post_process_text(text_a) or "").split())
+    words_b = Counter((post_process_text(text_b) or "").split())
+    total = sum(words_a.values()) + sum(words_b.values())
+    if not total:
+        return 1.0
+    return 2 * sum((words_a & words_b).values()) / total
+
+
+class Command(BaseCommand):
+
+    help = """
+        Compares the speed and output of the backends that extract text from
+        PDF files. The output of every backend is compared to the output of
+        the first one.
+    """.replace("    ", "")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            help="PDF files or directories with PDF files. Defaults to the "
+                 "sample documents of the test suite."
+        )
+        parser.add_argument(
+            "--backends",
+            default=",".join(TEXT_EXTRACTION_BACKENDS),
+            help="Comma separated list of backends to compare."
+        )
+        parser.add_argument(
+            "--repeat",
+            default=1,
+            type=int,
+            help="Extract the text of every file this many times."
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [os.path.join(
+            os.path.dirname(documents.__file__), "tests", "samples")]
+        files = list(_find_pdf_files(paths))
+        if not files:
+            raise CommandError("No PDF files found.")
+
+        names = [n.strip() for n in options['backends'].split(",")]
+        for name in names:
+            if name not in TEXT_EXTRACTION_BACKENDS:
+                raise CommandError(f"Unknown backend {name}")
+
+        size = sum(os.stat(f).st_size for f in files)
+        results = {}
+        for name in names:
+            backend = get_text_extraction_backend(name)
+            texts = {}
+            failed = 0
+            pages = 0
+            start = time.perf_counter()
+            for f in files:
+                try:
+                    for i in range(options['repeat']):
+                        page_texts = backend.extract_page_texts(f)
+                except Exception as e:
+                    self.stderr.write(f"{name}: {f}: {e}")
+                    failed += 1
+                    continue
+                texts[f] = "".join(page_texts)
+                pages += len(page_texts) * options['repeat']
+            results[name] = {
+                'texts': texts,
+                'failed': failed,
+                'pages': pages,
+                'time': time.perf_counter() - start
+            }
+
+        reference = results[names[0]]['texts']
+        self.stdout.write(
+            f"{len(files)} files, {size / 1024 / 1024:.1f} MB, "
+            f"repeated {options['repeat']} times")
+        self.stdout.write(
+            f"{'backend':<12}{'failed':>8}{'pages':>8}{'time':>10}"
+            f"{'pages/s':>10}{'MB/s':>8}{'similarity':>12}")
+        for name in names:
+            r = results[name]
+            common = [f for f in r['texts'] if f in reference]
+            similarity = sum(
+                _similarity(r['texts'][f], reference[f]) for f in common
+            ) / len(common) if common else 0.0
+            elapsed = max(r['time'], 0.001)
+            self.stdout.write(
+                f"{name:<12}{r['failed']:>8}{r['pages']:>8}"
+                f"{r['time']:>9.2f}s"
+                f"{r['pages'] / elapsed:>10.1f}"
+                f"{size * options['repeat'] / 1024 / 1024 / elapsed:>8.1f}"
+                f"{similarity:>12.3f}")
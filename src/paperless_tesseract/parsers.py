@@ -4,9 +4,30 @@ import re
 
 from PIL import Image
 from django.conf import settings
+from django_q.tasks import async_task
 
+from documents.file_handling import calculate_checksum
 from documents.parsers import DocumentParser, ParseError, \
-    make_thumbnail_from_pdf
+    make_thumbnail_from_pdf, make_thumbnail_from_first_page, \
+    get_task_time_left
+from paperless_tesseract import governor
+from paperless_tesseract.cache import get_ocr_cache
+from paperless_tesseract.extraction import PdfminerBackend, \
+    get_text_extraction_backend
+from paperless_tesseract.images import normalise_image
+from paperless_tesseract.split import SplitDocument
+
+
+# Pages with less text than this are OCR'ed in skip_noarchive mode.
+PAGE_TEXT_THRESHOLD = 50
+
+# OCR has to find this many times as much text as a page had before for its
+# text to be used instead.
+OCR_TEXT_GAIN = 2
+
+# Share of the remaining time of the task that is kept for processing a
+# document as a whole if the parts of a split document don't finish in time.
+SPLIT_FALLBACK_SHARE = 0.5
 
 
 class NoTextFoundException(Exception):
@@ -57,6 +78,18 @@ class RasterisedDocumentParser(DocumentParser):
             self.tempdir,
             self.logging_group)
 
+    def can_pipeline_thumbnail(self, mime_type):
+        return mime_type == "application/pdf" or self.is_image(mime_type)
+
+    def get_thumbnail_from_original(self,
+                                    document_path,
+                                    mime_type,
+                                    file_name=None):
+        out_path = os.path.join(self.tempdir, "convert-original.png")
+        make_thumbnail_from_first_page(
+            document_path, out_path, self.logging_group)
+        return out_path
+
     def is_image(self, mime_type):
         return mime_type in [
             "image/png",
@@ -113,23 +146,96 @@ class RasterisedDocumentParser(DocumentParser):
         if not os.path.isfile(pdf_file):
             return None
 
-        from pdfminer.high_level import extract_text as pdfminer_extract_text
-        from pdfminer.pdftypes import PDFException
+        page_texts = self.extract_page_texts(pdf_file)
+        if page_texts is None:
+            # probably not a PDF file.
+            return None
+
+        self.log("debug", f"Extracted text from PDF file {pdf_file}")
+        return post_process_text("".join(page_texts))
 
+    def extract_page_texts(self, pdf_file):
+        """
+        Return the text of every page of the PDF file, or None if the text
+        can't be extracted. If the configured backend fails, pdfminer.six is
+        used instead.
+        """
+        backend = get_text_extraction_backend()
         try:
-            stripped = post_process_text(pdfminer_extract_text(pdf_file))
+            return backend.extract_page_texts(pdf_file)
+        except Exception:
+            self.log("warn",
+                     f"Error while getting text from PDF document with "
+                     f"{backend.name}", exc_info=True)
 
-            self.log("debug", f"Extracted text from PDF file {pdf_file}")
-            return stripped
+        if backend.name == PdfminerBackend.name:
+            return None
+
+        try:
+            return PdfminerBackend().extract_page_texts(pdf_file)
         except Exception:
             # TODO catch all for various issues with PDFminer.six.
             #  If PDFminer fails, fall back to OCR.
             self.log("warn",
                      "Error while getting text from PDF document with "
                      "pdfminer.six", exc_info=True)
-            # probably not a PDF file.
             return None
 
+    def ocr_pages_without_text(self, document_path, page_texts):
+        """
+        OCR the pages of the PDF document that don't have any text, and return
+        the text of all pages in page order. Pages with text are not
+        rasterised at all, and pages with a little text keep it unless OCR
+        finds a lot more.
+        """
+        import pikepdf
+
+        pages = [
+            i for i, text in enumerate(page_texts)
+            if len(post_process_text(text) or "") <= PAGE_TEXT_THRESHOLD
+        ]
+        if not pages:
+            return post_process_text("".join(page_texts))
+
+        self.log(
+            "debug",
+            f"Pages without text: {', '.join(str(i + 1) for i in pages)}")
+
+        input_file = os.path.join(self.tempdir, "pages-without-text.pdf")
+        output_file = os.path.join(self.tempdir, "pages-without-text-ocr.pdf")
+        sidecar_file = os.path.join(self.tempdir, "pages-without-text.txt")
+
+        with pikepdf.open(document_path) as pdf:
+            part = pikepdf.new()
+            part.pages.extend(pdf.pages[i] for i in pages)
+            part.save(input_file)
+
+        args = self.construct_ocrmypdf_parameters(
+            input_file, "application/pdf", output_file, sidecar_file)
+        # These pages may have a little text, such as page numbers, which
+        # must not cause OCRmyPDF to skip them.
+        args.pop('skip_text', None)
+        args['force_ocr'] = True
+
+        self.log("debug", f"Calling OCRmyPDF with args: {args}")
+        governor.ocr(args)
+
+        ocr_texts = self.extract_page_texts(output_file)
+        if not ocr_texts or len(ocr_texts) != len(pages):
+            raise ParseError(
+                f"Unable to extract the text of the OCR'ed pages from "
+                f"{output_file}")
+
+        page_texts = list(page_texts)
+        for i, text in zip(pages, ocr_texts):
+            # The text of the original is exact, so it is only replaced if
+            # OCR finds a lot more, e.g. on scans with a text page number.
+            original_length = len(post_process_text(page_texts[i]) or "")
+            if len(post_process_text(text) or "") >= \
+                    original_length * OCR_TEXT_GAIN:
+                page_texts[i] = text
+        return post_process_text("".join(page_texts))
+
     def construct_ocrmypdf_parameters(self,
                                       input_file,
                                       mime_type,
@@ -210,35 +316,154 @@ class RasterisedDocumentParser(DocumentParser):
 
         return ocrmypdf_args
 
+    def normalise_image(self, image_path):
+        """
+        Convert and downsample the image to at most OCR_MAX_IMAGE_DPI, so that
+        the memory OCRmyPDF needs is bounded. Returns the path to a PDF file
+        with the normalised pages, or None if the image is used as it is.
+        """
+        try:
+            pdf_file = normalise_image(
+                image_path,
+                self.tempdir,
+                settings.OCR_MAX_IMAGE_DPI,
+                settings.OCR_IMAGE_DPI
+            )
+        except Exception as e:
+            self.log(
+                "warning",
+                f"Error while normalising image {image_path}, using it as it "
+                f"is: {e}")
+            return None
+
+        if pdf_file:
+            self.log("debug", f"Normalised image {image_path} to {pdf_file}")
+        return pdf_file
+
+    def ocr_split(self, document_path, mime_type, ocr_args):
+        """
+        OCR large PDF documents in parts of OCR_SPLIT_PAGES pages, which are
+        spread across the task workers. Returns False if the document is to
+        be processed as a whole instead.
+        """
+        if not settings.OCR_SPLIT_THRESHOLD or \
+                mime_type != "application/pdf" or \
+                'pages' in ocr_args or \
+                settings.TASK_WORKERS < 2:
+            return False
+
+        page_count = self.get_page_count(document_path, mime_type)
+        if not page_count or page_count <= settings.OCR_SPLIT_THRESHOLD:
+            return False
+
+        split = SplitDocument(os.path.join(self.tempdir, "split"))
+        try:
+            split.split(document_path, settings.OCR_SPLIT_PAGES)
+            self.log(
+                "debug",
+                f"Processing {page_count} pages in {split.part_count} parts "
+                f"with OCRmyPDF args: {ocr_args}"
+            )
+
+            # This task processes parts as well.
+            for i in range(min(split.part_count, settings.TASK_WORKERS) - 1):
+                async_task(
+                    "paperless_tesseract.tasks.ocr_parts",
+                    split.directory,
+                    split.part_count,
+                    ocr_args,
+                    task_name=f"OCR {os.path.basename(document_path)}"[:100]
+                )
+            split.run(ocr_args)
+
+            time_left = get_task_time_left()
+            if time_left is None:
+                time_left = settings.Q_CLUSTER['timeout']
+            split.wait(time_left * (1 - SPLIT_FALLBACK_SHARE), self.progress)
+
+            split.merge(ocr_args['output_file'], ocr_args.get('sidecar'))
+        except Exception as e:
+            split.abandon()
+            self.log(
+                "warning",
+                f"Error while processing the document in parts, processing "
+                f"it as a whole instead: {e}"
+            )
+            return False
+
+        return True
+
     def parse(self, document_path, mime_type, file_name=None):
         # This forces tesseract to use one core per page.
         os.environ['OMP_THREAD_LIMIT'] = "1"
 
         if mime_type == "application/pdf":
-            text_original = self.extract_text(None, document_path)
+            page_texts = self.extract_page_texts(document_path)
+            text_original = post_process_text("".join(page_texts or []))
             original_has_text = text_original and len(text_original) > 50
         else:
+            page_texts = None
             text_original = None
             original_has_text = False
 
         if settings.OCR_MODE == "skip_noarchive" and original_has_text:
+            if settings.OCR_PAGES > 0:
+                self.log("debug",
+                         "Document has text, skipping OCRmyPDF entirely.")
+                self.text = text_original
+                return
+
             self.log("debug",
-                     "Document has text, skipping OCRmyPDF entirely.")
-            self.text = text_original
+                     "Document has text, only OCR'ing pages without text.")
+            try:
+                self.text = self.ocr_pages_without_text(
+                    document_path, page_texts)
+            except Exception as e:
+                self.log("warning",
+                         f"Error while OCR'ing pages without text, using "
+                         f"the text of the original document instead: {e}")
+                self.text = text_original
             return
 
-        import ocrmypdf
         from ocrmypdf import InputFileError, EncryptedPdfError
 
         archive_path = os.path.join(self.tempdir, "archive.pdf")
         sidecar_file = os.path.join(self.tempdir, "sidecar.txt")
 
+        # OCRmyPDF processes this file instead of the original document.
+        ocr_input, ocr_mime_type = document_path, mime_type
+        preprocessing = None
+        if self.is_image(mime_type) and settings.OCR_MAX_IMAGE_DPI > 0:
+            normalised = self.normalise_image(document_path)
+            if normalised:
+                ocr_input, ocr_mime_type = normalised, "application/pdf"
+                # Images without dpi information are assumed to have
+                # OCR_IMAGE_DPI, which changes how they are downsampled.
+                preprocessing = {
+                    'max_image_dpi': settings.OCR_MAX_IMAGE_DPI,
+                    'image_dpi': settings.OCR_IMAGE_DPI
+                }
+
         args = self.construct_ocrmypdf_parameters(
-            document_path, mime_type, archive_path, sidecar_file)
+            ocr_input, ocr_mime_type, archive_path, sidecar_file)
+
+        ocr_cache = get_ocr_cache()
+        cache_key = None
+        if ocr_cache:
+            cache_key = ocr_cache.key(
+                self.checksum or calculate_checksum(document_path),
+                args,
+                preprocessing)
 
         try:
-            self.log("debug", f"Calling OCRmyPDF with args: {args}")
-            ocrmypdf.ocr(**args)
+            cached = cache_key and \
+                ocr_cache.get(cache_key, archive_path, sidecar_file)
+            if cached:
+                self.log("debug", f"Using cached OCR result {cache_key}")
+            else:
+                if not self.ocr_split(ocr_input, ocr_mime_type, args):
+                    self.log("debug", f"Calling OCRmyPDF with args: {args}")
+                    governor.ocr(args)
 
             self.archive_path = archive_path
             self.text = self.extract_text(sidecar_file, archive_path)
@@ -246,6 +471,11 @@ class RasterisedDocumentParser(DocumentParser):
             if not self.text:
                 raise NoTextFoundException(
                     "No text was found in the original document")
+
+            # Results without text are processed again with different
+            # settings below, so there is no point in caching them.
+            if cache_key and not cached:
+                ocr_cache.put(cache_key, archive_path, sidecar_file)
         except EncryptedPdfError:
             self.log("warning",
                      "This file is encrypted, OCR is impossible. Using "
@@ -265,7 +495,7 @@ class RasterisedDocumentParser(DocumentParser):
             # Attempt to run OCR with safe settings.
 
             args = self.construct_ocrmypdf_parameters(
-                document_path, mime_type,
+                ocr_input, ocr_mime_type,
                 archive_path_fallback, sidecar_file_fallback,
                 safe_fallback=True
             )
@@ -273,7 +503,7 @@ class RasterisedDocumentParser(DocumentParser):
             try:
                 self.log("debug",
                          f"Fallback: Calling OCRmyPDF with args: {args}")
-                ocrmypdf.ocr(**args)
+                governor.ocr(args)
 
                 # Don't return the archived file here, since this file
                 # is bigger and blurry due to --force-ocr.
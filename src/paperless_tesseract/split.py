@@ -0,0 +1,166 @@
+import logging
+import os
+import shutil
+import time
+from contextlib import ExitStack
+
+logger = logging.getLogger("paperless.parsing.tesseract")
+
+
+class SplitOCRError(Exception):
+    pass
+
+
+def page_ranges(page_count, pages_per_part):
+    return [
+        (start, min(start + pages_per_part, page_count))
+        for start in range(0, page_count, pages_per_part)
+    ]
+
+
+class SplitDocument:
+    """
+    A PDF document that is split into parts of a few pages each, so that
+    several task workers can OCR it at the same time.
+
+    Every part has its own directory. Workers claim a part by creating a file
+    in that directory, so that no part is processed twice, and mark it as done
+    or failed once OCRmyPDF is finished with it. The task that consumes the
+    document processes parts as well while it waits for the others.
+    """
+
+    def __init__(self, directory, part_count=0):
+        self.directory = directory
+        self.part_count = part_count
+
+    def _part_file(self, index, name):
+        return os.path.join(self.directory, f"part-{index:04d}", name)
+
+    def split(self, document_path, pages_per_part):
+        import pikepdf
+
+        with pikepdf.open(document_path) as pdf:
+            ranges = page_ranges(len(pdf.pages), pages_per_part)
+            for index, (start, end) in enumerate(ranges):
+                part_path = self._part_file(index, "input.pdf")
+                os.makedirs(os.path.dirname(part_path))
+                part = pikepdf.new()
+                part.pages.extend(pdf.pages[start:end])
+                part.save(part_path)
+
+        self.part_count = len(ranges)
+
+    def _claim(self, index):
+        try:
+            fd = os.open(self._part_file(index, "claimed"),
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            # Claimed already, or the document is gone.
+            return False
+        os.close(fd)
+        return True
+
+    def _process(self, index, ocr_args):
+        from paperless_tesseract import governor
+
+        args = dict(
+            ocr_args,
+            input_file=self._part_file(index, "input.pdf"),
+            output_file=self._part_file(index, "archive.pdf")
+        )
+        if 'sidecar' in ocr_args:
+            args['sidecar'] = self._part_file(index, "sidecar.txt")
+
+        try:
+            governor.ocr(args)
+            marker, message = "done", ""
+        except Exception as e:
+            marker, message = "failed", f"{e.__class__.__name__}: {e}"
+
+        try:
+            with open(self._part_file(index, marker), "w") as f:
+                f.write(message)
+        except OSError:
+            # The document was abandoned in the meantime.
+            pass
+
+    def run(self, ocr_args):
+        """
+        OCR parts that nobody claimed yet, until none are left. Returns the
+        number of processed parts.
+        """
+        processed = 0
+        for index in range(self.part_count):
+            if self._claim(index):
+                self._process(index, ocr_args)
+                processed += 1
+        return processed
+
+    def abandon(self):
+        """
+        Claim all remaining parts, so that no worker starts processing them,
+        and remove the parts. Workers that are still processing a part
+        fail to store their results.
+        """
+        for index in range(self.part_count):
+            self._claim(index)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def wait(self, timeout, progress=None):
+        """
+        Wait until all parts are done. Raises SplitOCRError if a part failed
+        or didn't finish within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            done = 0
+            for index in range(self.part_count):
+                failed_file = self._part_file(index, "failed")
+                if os.path.isfile(failed_file):
+                    with open(failed_file) as f:
+                        raise SplitOCRError(
+                            f"Part {index + 1} of {self.part_count} failed: "
+                            f"{f.read()}")
+                if os.path.isfile(self._part_file(index, "done")):
+                    done += 1
+
+            if progress:
+                progress(done, self.part_count)
+
+            if done == self.part_count:
+                return
+
+            if time.monotonic() > deadline:
+                raise SplitOCRError(
+                    f"Only {done} of {self.part_count} parts were done after "
+                    f"{timeout:.0f} seconds")
+
+            time.sleep(1)
+
+    def merge(self, archive_path, sidecar_path=None):
+        """
+        Concatenate the archive files and sidecar texts of all parts, in page
+        order.
+        """
+        import pikepdf
+
+        with ExitStack() as stack:
+            parts = [
+                stack.enter_context(
+                    pikepdf.open(self._part_file(index, "archive.pdf")))
+                for index in range(self.part_count)
+            ]
+            # The first part keeps its document metadata, including the
+            # PDF/A identification.
+            merged = parts[0]
+            for part in parts[1:]:
+                merged.pages.extend(part.pages)
+            merged.save(archive_path)
+
+        if sidecar_path:
+            with open(sidecar_path, "w") as out:
+                for index in range(self.part_count):
+                    sidecar_file = self._part_file(index, "sidecar.txt")
+                    if os.path.isfile(sidecar_file):
+                        with open(sidecar_file) as f:
+                            out.write(f.read())
@@ -0,0 +1,12 @@
+import os
+
+from paperless_tesseract.split import SplitDocument
+
+
+def ocr_parts(directory, part_count, ocr_args):
+    # This forces tesseract to use one core per page.
+    os.environ['OMP_THREAD_LIMIT'] = "1"
+
+    processed = SplitDocument(directory, part_count).run(ocr_args)
+
+    return f"Processed {processed} of {part_count} parts of {directory}"
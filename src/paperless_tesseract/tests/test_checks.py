@@ -1,9 +1,9 @@
 from unittest import mock
 
-from django.core.checks import ERROR
+from django.core.checks import ERROR, WARNING
 from django.test import TestCase, override_settings
 
-from paperless_tesseract import check_default_language_available
+from paperless_tesseract import check_default_language_available, check_text_extraction_backend
 
 
 class TestChecks(TestCase):
@@ -24,3 +24,18 @@ class TestChecks(TestCase):
         msgs = check_default_language_available(None)
         self.assertEqual(len(msgs), 1)
         self.assertEqual(msgs[0].level, ERROR)
+
+    def test_text_extraction_backend(self):
+        self.assertEqual(check_text_extraction_backend(None), [])
+
+    @override_settings(PDF_TEXT_BACKEND="pdfbox")
+    def test_invalid_text_extraction_backend(self):
+        msgs = check_text_extraction_backend(None)
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(msgs[0].level, ERROR)
+
+    @override_settings(PDF_TEXT_BACKEND="pdftotext", PDFTOTEXT_BINARY="no-such-pdftotext")
+    def test_pdftotext_missing(self):
+        msgs = check_text_extraction_backend(None)
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(msgs[0].level, WARNING)
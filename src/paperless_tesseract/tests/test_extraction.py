@@ -0,0 +1,44 @@
+import os
+import subprocess
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from documents.tests.utils import DirectoriesMixin
+from paperless_tesseract.extraction import PdfminerBackend, PdftotextBackend
+from paperless_tesseract.parsers import RasterisedDocumentParser
+
+
+class TestTextExtraction(DirectoriesMixin, TestCase):
+
+    SAMPLE_FILES = os.path.join(os.path.dirname(__file__), "samples")
+
+    def test_pdfminer(self):
+        page_texts = PdfminerBackend().extract_page_texts(os.path.join(self.SAMPLE_FILES, "multi-page-digital.pdf"))
+        self.assertEqual(len(page_texts), 3)
+        for i, text in enumerate(page_texts):
+            self.assertIn(f"page {i + 1}", text.lower())
+            self.assertTrue(text.endswith("\f"))
+
+    @mock.patch("paperless_tesseract.extraction.subprocess.run")
+    def test_pdftotext(self, run):
+        run.return_value = subprocess.CompletedProcess([], 0, stdout="Page 1\n\fPage 2\n\f".encode())
+        page_texts = PdftotextBackend().extract_page_texts("some.pdf")
+        self.assertEqual(page_texts, ["Page 1\n\f", "Page 2\n\f"])
+        self.assertEqual(run.call_args[0][0][-2:], ["some.pdf", "-"])
+
+    @override_settings(PDF_TEXT_BACKEND="pdftotext", PDFTOTEXT_BINARY="no-such-pdftotext")
+    def test_fallback_to_pdfminer(self):
+        parser = RasterisedDocumentParser(None)
+        text = parser.extract_text(None, os.path.join(self.SAMPLE_FILES, "simple-digital.pdf"))
+        self.assertIn("This is a test document.", text)
+
+    def test_benchmark(self):
+        stdout = StringIO()
+        call_command("text_extraction_benchmark", self.SAMPLE_FILES, "--backends", "pdfminer", stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("pdfminer", output)
+        # Compared to itself.
+        self.assertIn("1.000", output)
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from documents.tests.utils import DirectoriesMixin
+from paperless_tesseract import governor
+from paperless_tesseract.governor import CPUGovernor
+
+
+@mock.patch("paperless_tesseract.governor.multiprocessing.cpu_count", return_value=8)
+@mock.patch("paperless_tesseract.governor.os.getloadavg", return_value=(0.0, 0.0, 0.0))
+class TestCPUGovernor(DirectoriesMixin, TestCase):
+
+    SAMPLE_FILES = os.path.join(os.path.dirname(__file__), "samples")
+
+    def setUp(self) -> None:
+        super(TestCPUGovernor, self).setUp()
+        self.path = os.path.join(self.dirs.data_dir, "cpu-governor.json")
+
+    def test_acquire(self, *args):
+        g = CPUGovernor(self.path, 8)
+
+        key1, single_page = g.acquire(1)
+        key2, book = g.acquire(400)
+        key3, starved = g.acquire(5)
+
+        self.assertEqual(single_page, 1)
+        self.assertEqual(book, 7)
+        # Jobs always get at least one token.
+        self.assertEqual(starved, 1)
+
+        g.release(key2)
+        key4, tokens = g.acquire(400)
+        self.assertEqual(tokens, 6)
+
+    def test_acquire_share(self, *args):
+        g = CPUGovernor(self.path, 8, workers=2)
+
+        key1, single_page = g.acquire(1)
+        key2, book = g.acquire(400)
+        key3, other_book = g.acquire(400)
+
+        self.assertEqual(single_page, 1)
+        # A share of 4 tokens, and half of the remaining 3 free tokens.
+        self.assertEqual(book, 5)
+        # The second job still gets the rest.
+        self.assertEqual(other_book, 2)
+
+        g.release(key1)
+        g.release(key3)
+        key4, tokens = g.acquire(400)
+        self.assertEqual(tokens, 3)
+
+    def test_acquire_first_job(self, *args):
+        g = CPUGovernor(self.path, 8, workers=4)
+
+        key, tokens = g.acquire(400)
+
+        # The first job doesn't take all tokens.
+        self.assertEqual(tokens, 4)
+
+    def test_dead_process(self, *args):
+        g = CPUGovernor(self.path, 8)
+        p = subprocess.Popen(["true"])
+        p.wait()
+        with open(self.path, "w") as f:
+            json.dump({"x": {"pid": p.pid, "tokens": 8}}, f)
+
+        key, tokens = g.acquire(8)
+        self.assertEqual(tokens, 8)
+
+    def test_reused_pid(self, *args):
+        g = CPUGovernor(self.path, 8)
+        # This process has the pid of a process that held tokens before a
+        # restart.
+        with open(self.path, "w") as f:
+            json.dump({"x": {"pid": os.getpid(), "started": 1, "tokens": 8}}, f)
+
+        key, tokens = g.acquire(8)
+        self.assertEqual(tokens, 8)
+
+    def test_load(self, getloadavg, cpu_count):
+        getloadavg.return_value = (6.0, 0.0, 0.0)
+        g = CPUGovernor(self.path, 8)
+
+        key, tokens = g.acquire(8)
+        self.assertEqual(tokens, 2)
+
+    @override_settings(OCR_CPU_TOKENS=4, TASK_WORKERS=1)
+    @mock.patch("ocrmypdf.ocr")
+    def test_ocr(self, ocr, *args):
+        governor.ocr({'input_file': os.path.join(self.SAMPLE_FILES, "multi-page-digital.pdf"), 'jobs': 1})
+
+        ocr.assert_called_once()
+        self.assertEqual(ocr.call_args[1]['jobs'], 3)
+        # The tokens were returned.
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {})
+
+    @mock.patch("ocrmypdf.ocr")
+    def test_ocr_disabled(self, ocr, *args):
+        governor.ocr({'input_file': os.path.join(self.SAMPLE_FILES, "simple.png"), 'jobs': 1})
+
+        ocr.assert_called_once()
+        self.assertEqual(ocr.call_args[1]['jobs'], 1)
+        self.assertFalse(os.path.isfile(self.path))
@@ -0,0 +1,67 @@
+import os
+
+import pikepdf
+from PIL import Image
+from django.test import TestCase
+
+from documents.tests.utils import DirectoriesMixin
+from paperless_tesseract.images import normalise_image
+
+
+class TestNormaliseImage(DirectoriesMixin, TestCase):
+
+    def make_image(self, name, mode="RGB", size=(1000, 1400), dpi=(600, 600), frames=1, **kwargs):
+        path = os.path.join(self.dirs.scratch_dir, name)
+        images = [Image.new(mode, size) for i in range(frames)]
+        images[0].save(path, dpi=dpi, save_all=frames > 1, append_images=images[1:], **kwargs)
+        return path
+
+    def assertPages(self, pdf_file, sizes, filter=pikepdf.Name.FlateDecode):
+        with pikepdf.open(pdf_file) as pdf:
+            self.assertEqual(len(pdf.pages), len(sizes))
+            for page, size in zip(pdf.pages, sizes):
+                image = list(page.images.values())[0]
+                self.assertEqual((image.Width, image.Height), size)
+                self.assertEqual(image.Filter, filter)
+
+    def test_unchanged(self):
+        path = self.make_image("image.png", dpi=(300, 300))
+        self.assertIsNone(normalise_image(path, self.dirs.scratch_dir, 300))
+        self.assertEqual(os.listdir(self.dirs.scratch_dir), ["image.png"])
+
+    def test_downsample(self):
+        path = self.make_image("image.png")
+        pdf_file = normalise_image(path, self.dirs.scratch_dir, 300)
+        self.assertPages(pdf_file, [(500, 700)])
+
+    def test_downsample_jpeg(self):
+        # The decoder reduces this image to a quarter of its size already.
+        path = self.make_image("image.jpg", size=(2000, 2800))
+        pdf_file = normalise_image(path, self.dirs.scratch_dir, 150)
+        # The image is not stored losslessly.
+        self.assertPages(pdf_file, [(500, 700)], filter=pikepdf.Name.DCTDecode)
+
+    def test_no_dpi(self):
+        # Without dpi information, the image is assumed to be as wide as an A4
+        # page, which is about 600 dpi for this image.
+        path = os.path.join(self.dirs.scratch_dir, "image.png")
+        Image.new("RGB", (4960, 7016)).save(path)
+        pdf_file = normalise_image(path, self.dirs.scratch_dir, 300)
+        self.assertPages(pdf_file, [(2480, 3508)])
+
+    def test_transparency(self):
+        path = self.make_image("image.png", mode="RGBA", dpi=(300, 300))
+        pdf_file = normalise_image(path, self.dirs.scratch_dir, 300)
+        self.assertPages(pdf_file, [(1000, 1400)])
+
+    def test_16_bit(self):
+        path = self.make_image("image.png", mode="I;16", dpi=(300, 300))
+        pdf_file = normalise_image(path, self.dirs.scratch_dir, 300)
+        self.assertPages(pdf_file, [(1000, 1400)])
+
+    def test_multi_page_tiff(self):
+        path = self.make_image("image.tif", mode="1", dpi=(300, 300), frames=3)
+        pdf_file = normalise_image(path, self.dirs.scratch_dir, 150)
+        self.assertPages(pdf_file, [(500, 700)] * 3)
+        # Only the PDF file is left.
+        self.assertCountEqual(os.listdir(self.dirs.scratch_dir), ["image.tif", "normalised.pdf"])
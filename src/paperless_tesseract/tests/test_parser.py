@@ -3,11 +3,16 @@ import uuid
 from typing import ContextManager
 from unittest import mock
 
+import ocrmypdf
+from django.conf import settings
 from django.test import TestCase, override_settings
 
 from documents.parsers import ParseError, run_convert
 from documents.tests.utils import DirectoriesMixin
+from paperless_tesseract.cache import OCRCache
 from paperless_tesseract.parsers import RasterisedDocumentParser, post_process_text
+from paperless_tesseract.split import page_ranges
+from paperless_tesseract.tasks import ocr_parts
 
 image_to_string_calls = []
 
@@ -97,6 +102,15 @@ class TestParser(DirectoriesMixin, TestCase):
         thumb = parser.get_thumbnail(os.path.join(self.SAMPLE_FILES, 'simple-digital.pdf'), "application/pdf")
         self.assertTrue(os.path.isfile(thumb))
 
+    @override_settings(PIPELINE_THUMBNAILS=True, OPTIMIZE_THUMBNAILS=False)
+    def test_thumbnail_pipelined(self):
+        parser = RasterisedDocumentParser(uuid.uuid4())
+        parser.start_thumbnail(os.path.join(self.SAMPLE_FILES, 'simple-digital.pdf'), "application/pdf")
+        parser.parse(os.path.join(self.SAMPLE_FILES, 'simple-digital.pdf'), "application/pdf")
+        thumb = parser.get_optimised_thumbnail(os.path.join(self.SAMPLE_FILES, 'simple-digital.pdf'), "application/pdf")
+        self.assertTrue(os.path.isfile(thumb))
+        self.assertEqual(os.path.basename(thumb), "convert-original.png")
+
     def test_thumbnail_encrypted(self):
         parser = RasterisedDocumentParser(uuid.uuid4())
         thumb = parser.get_thumbnail(os.path.join(self.SAMPLE_FILES, 'encrypted.pdf'), "application/pdf")
@@ -250,6 +264,178 @@ class TestParser(DirectoriesMixin, TestCase):
         self.assertTrue(os.path.isfile(parser.archive_path))
         self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3"])
 
+    @override_settings(OCR_SPLIT_THRESHOLD=2, OCR_SPLIT_PAGES=2, TASK_WORKERS=2)
+    @mock.patch("paperless_tesseract.parsers.async_task")
+    def test_multi_page_split(self, async_task):
+        progress_callback = mock.Mock()
+        parser = RasterisedDocumentParser(None, progress_callback)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+
+        async_task.assert_called_once()
+        self.assertEqual(async_task.call_args[0][2], 2)
+        self.assertTrue(os.path.isfile(parser.archive_path))
+        self.assertEqual(parser.get_page_count(parser.archive_path, "application/pdf"), 3)
+        self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3"])
+        progress_callback.assert_called_with(2, 2)
+
+    @override_settings(OCR_SPLIT_THRESHOLD=2, OCR_SPLIT_PAGES=1, TASK_WORKERS=4)
+    @mock.patch("paperless_tesseract.parsers.async_task")
+    def test_multi_page_split_sub_tasks(self, async_task):
+        # The first sub task processes all parts before this one gets to it.
+        async_task.side_effect = lambda func, *args, **kwargs: ocr_parts(*args)
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+
+        self.assertEqual(async_task.call_count, 2)
+        self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3"])
+
+    @override_settings(OCR_SPLIT_THRESHOLD=2, OCR_SPLIT_PAGES=2, TASK_WORKERS=2)
+    @mock.patch("paperless_tesseract.parsers.async_task")
+    @mock.patch("paperless_tesseract.split.SplitDocument.merge")
+    def test_multi_page_split_failed(self, merge, async_task):
+        merge.side_effect = Exception("Merge failed")
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+
+        # The document was processed as a whole instead.
+        self.assertTrue(os.path.isfile(parser.archive_path))
+        self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3"])
+
+    @override_settings(OCR_SPLIT_THRESHOLD=2, OCR_SPLIT_PAGES=2, TASK_WORKERS=2)
+    @mock.patch("paperless_tesseract.parsers.async_task")
+    @mock.patch("paperless_tesseract.parsers.get_task_time_left")
+    @mock.patch("paperless_tesseract.split.SplitDocument.run")
+    def test_multi_page_split_timeout(self, run, get_task_time_left, async_task):
+        # Nobody processes the parts, and the task is about to time out.
+        run.return_value = 0
+        get_task_time_left.return_value = 1
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+
+        # The document was processed as a whole instead, and the parts are
+        # gone, so that workers don't pick them up anymore.
+        self.assertFalse(os.path.exists(os.path.join(parser.tempdir, "split")))
+        self.assertTrue(os.path.isfile(parser.archive_path))
+        self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3"])
+
+    @override_settings(OCR_SPLIT_THRESHOLD=3, TASK_WORKERS=2)
+    @mock.patch("paperless_tesseract.parsers.async_task")
+    def test_multi_page_split_below_threshold(self, async_task):
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+
+        async_task.assert_not_called()
+        self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3"])
+
+    @override_settings(OCR_CACHE_SIZE=10)
+    def test_ocr_cache(self):
+        with mock.patch("ocrmypdf.ocr", wraps=ocrmypdf.ocr) as ocr:
+            parser = RasterisedDocumentParser(None)
+            parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+            text = parser.get_text()
+            self.assertEqual(ocr.call_count, 1)
+
+            parser = RasterisedDocumentParser(None)
+            parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+            self.assertEqual(ocr.call_count, 1)
+            self.assertEqual(parser.get_text(), text)
+            self.assertTrue(os.path.isfile(parser.archive_path))
+
+            # Different OCR parameters don't use the cached result.
+            with override_settings(OCR_MODE="force"):
+                parser = RasterisedDocumentParser(None)
+                parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+            self.assertEqual(ocr.call_count, 2)
+
+    @override_settings(OCR_CACHE_SIZE=10)
+    @mock.patch("paperless_tesseract.parsers.RasterisedDocumentParser.extract_text")
+    def test_ocr_cache_no_text(self, extract_text):
+        extract_text.return_value = ""
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), "application/pdf")
+
+        self.assertFalse(os.path.isdir(settings.OCR_CACHE_DIR) and os.listdir(settings.OCR_CACHE_DIR))
+
+    def test_ocr_cache_key(self):
+        cache = OCRCache(self.dirs.scratch_dir + "/cache", 100)
+        args = {'input_file': "a.pdf", 'language': "eng"}
+        key = cache.key("checksum", args)
+
+        self.assertEqual(cache.key("checksum", dict(args, input_file="b.pdf")), key)
+        self.assertNotEqual(cache.key("other checksum", args), key)
+        self.assertNotEqual(cache.key("checksum", dict(args, language="deu")), key)
+        with mock.patch("paperless_tesseract.cache.tesseract_version", return_value="tesseract 9.0.0"):
+            self.assertNotEqual(cache.key("checksum", args), key)
+
+    @override_settings(OCR_MAX_IMAGE_DPI=300, OCR_IMAGE_DPI=150)
+    @mock.patch("paperless_tesseract.parsers.RasterisedDocumentParser.normalise_image")
+    @mock.patch("paperless_tesseract.parsers.get_ocr_cache")
+    def test_ocr_cache_key_normalised_image(self, get_ocr_cache, normalise_image):
+        # The normalised image doesn't carry the assumed resolution in the
+        # OCRmyPDF arguments, so it has to be part of the key.
+        normalise_image.return_value = os.path.join(self.SAMPLE_FILES, "simple-digital.pdf")
+        get_ocr_cache.return_value.get.return_value = False
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "simple-no-dpi.png"), "image/png")
+
+        checksum, args, preprocessing = get_ocr_cache.return_value.key.call_args[0]
+        self.assertEqual(preprocessing, {'max_image_dpi': 300, 'image_dpi': 150})
+
+    def test_ocr_cache_eviction(self):
+        cache = OCRCache(self.dirs.scratch_dir + "/cache", 100)
+
+        archive = os.path.join(self.dirs.scratch_dir, "archive.pdf")
+        with open(archive, "wb") as f:
+            f.write(b"x" * 40)
+        target = os.path.join(self.dirs.scratch_dir, "target.pdf")
+
+        cache.put("a", archive)
+        cache.put("b", archive)
+        os.utime(os.path.join(cache.directory, "a"), (0, 0))
+        os.utime(os.path.join(cache.directory, "b"), (1, 1))
+        # Using "a" makes "b" the least recently used entry.
+        self.assertTrue(cache.get("a", target))
+        cache.put("c", archive)
+
+        self.assertTrue(cache.get("a", target))
+        self.assertFalse(cache.get("b", target))
+        self.assertTrue(cache.get("c", target))
+
+    @override_settings(OCR_MAX_IMAGE_DPI=300)
+    def test_image_normalised(self):
+        parser = RasterisedDocumentParser(None)
+        with mock.patch("ocrmypdf.ocr", wraps=ocrmypdf.ocr) as ocr:
+            parser.parse(os.path.join(self.SAMPLE_FILES, "simple-alpha.png"), "image/png")
+
+        self.assertEqual(ocr.call_args[1]['input_file'], os.path.join(parser.tempdir, "normalised.pdf"))
+        self.assertNotIn('image_dpi', ocr.call_args[1])
+        self.assertTrue(os.path.isfile(parser.archive_path))
+        self.assertContainsStrings(parser.get_text().lower(), ["this is a test document."])
+
+    @override_settings(OCR_MAX_IMAGE_DPI=300)
+    def test_image_not_normalised(self):
+        parser = RasterisedDocumentParser(None)
+        with mock.patch("ocrmypdf.ocr", wraps=ocrmypdf.ocr) as ocr:
+            parser.parse(os.path.join(self.SAMPLE_FILES, "simple.png"), "image/png")
+
+        # 72 dpi RGB images are fine as they are.
+        self.assertEqual(ocr.call_args[1]['input_file'], os.path.join(self.SAMPLE_FILES, "simple.png"))
+        self.assertContainsStrings(parser.get_text().lower(), ["this is a test document."])
+
+    @override_settings(OCR_MAX_IMAGE_DPI=300)
+    @mock.patch("paperless_tesseract.parsers.normalise_image")
+    def test_image_normalise_error(self, normalise_image):
+        normalise_image.side_effect = OSError("Broken image")
+        parser = RasterisedDocumentParser(None)
+        parser.parse(os.path.join(self.SAMPLE_FILES, "simple.png"), "image/png")
+
+        self.assertContainsStrings(parser.get_text().lower(), ["this is a test document."])
+
+    def test_page_ranges(self):
+        self.assertEqual(page_ranges(5, 2), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(page_ranges(4, 2), [(0, 2), (2, 4)])
+        self.assertEqual(page_ranges(1, 50), [(0, 1)])
+
     @override_settings(OCR_PAGES=2, OCR_MODE="redo")
     def test_multi_page_analog_pages_redo(self):
         parser = RasterisedDocumentParser(None)
@@ -295,11 +481,46 @@ class TestParser(DirectoriesMixin, TestCase):
 
     @override_settings(OCR_MODE="skip_noarchive")
     def test_multi_page_mixed_no_archive(self):
+        parser = RasterisedDocumentParser(None)
+        with mock.patch("ocrmypdf.ocr", wraps=ocrmypdf.ocr) as ocr:
+            parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-mixed.pdf"), "application/pdf")
+        self.assertIsNone(parser.archive_path)
+        # Only the pages without text were OCR'ed.
+        ocr.assert_called_once()
+        self.assertEqual(parser.get_page_count(ocr.call_args[1]['input_file'], "application/pdf"), 3)
+        self.assertContainsStrings(parser.get_text().lower(), ["page 1", "page 2", "page 3", "page 4", "page 5", "page 6"])
+
+    @override_settings(OCR_MODE="skip_noarchive")
+    @mock.patch("ocrmypdf.ocr")
+    def test_multi_page_mixed_no_archive_error(self, ocr):
+        ocr.side_effect = Exception("OCR failed")
         parser = RasterisedDocumentParser(None)
         parser.parse(os.path.join(self.SAMPLE_FILES, "multi-page-mixed.pdf"), "application/pdf")
         self.assertIsNone(parser.archive_path)
         self.assertContainsStrings(parser.get_text().lower(), ["page 4", "page 5", "page 6"])
 
+    @mock.patch("paperless_tesseract.parsers.governor.ocr")
+    @mock.patch("paperless_tesseract.parsers.RasterisedDocumentParser.extract_page_texts")
+    def test_ocr_pages_without_text_keeps_text(self, extract_page_texts, ocr):
+        extract_page_texts.return_value = ["Page 1 from OCR\n", "Pag 2\n", "Page 3 and a lot more text from OCR\n"]
+        parser = RasterisedDocumentParser(None)
+
+        text = parser.ocr_pages_without_text(
+            os.path.join(self.SAMPLE_FILES, "multi-page-images.pdf"), ["", "Page 2\n", "Page 3\n"])
+
+        self.assertEqual(text, "Page 1 from OCR\nPage 2\nPage 3 and a lot more text from OCR")
+
+    def test_extract_page_texts(self):
+        from pdfminer.high_level import extract_text
+
+        parser = RasterisedDocumentParser(None)
+        page_texts = parser.extract_page_texts(os.path.join(self.SAMPLE_FILES, "multi-page-mixed.pdf"))
+
+        self.assertEqual(len(page_texts), 6)
+        self.assertFalse(post_process_text(page_texts[0]))
+        self.assertIn("page 4", page_texts[3].lower())
+        self.assertEqual("".join(page_texts), extract_text(os.path.join(self.SAMPLE_FILES, "multi-page-mixed.pdf")))
+
     @override_settings(OCR_MODE="skip", OCR_ROTATE_PAGES=True)
     def test_rotate(self):
         parser = RasterisedDocumentParser(None)
@@ -1,3 +1,4 @@
+import codecs
 import os
 
 from PIL import ImageDraw, ImageFont, Image
@@ -5,6 +6,46 @@ from django.conf import settings
 
 from documents.parsers import DocumentParser
 
+# Byte order marks, longest first, since the UTF-32 LE mark starts with the
+# UTF-16 LE mark.
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Files that aren't UTF-8 are most likely exports of Windows applications.
+FALLBACK_ENCODING = "cp1252"
+
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# Characters read at a time.
+CHUNK_SIZE = 1024 * 1024
+
+THUMBNAIL_LINES = 50
+THUMBNAIL_LINE_LENGTH = 200
+
+
+def detect_encoding(path):
+    """
+    Guess the encoding of a text file from its first few kilobytes.
+    """
+    with open(path, "rb") as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # The sample might end in the middle of a character.
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return FALLBACK_ENCODING
+
 
 class TextDocumentParser(DocumentParser):
     """
@@ -13,13 +54,21 @@ class TextDocumentParser(DocumentParser):
 
     logging_name = "paperless.parsing.text"
 
+    def _open(self, document_path):
+        return open(document_path, "r",
+                    encoding=detect_encoding(document_path),
+                    errors="replace")
+
     def get_thumbnail(self, document_path, mime_type, file_name=None):
 
         def read_text():
-            with open(document_path, 'r') as src:
-                lines = [line.strip() for line in src.readlines()]
-                text = "\n".join(lines[:50])
-                return text
+            # Only read as much as fits on the thumbnail, even if the file
+            # has no line breaks at all.
+            with self._open(document_path) as src:
+                text = src.read(THUMBNAIL_LINES * THUMBNAIL_LINE_LENGTH)
+            lines = [line.strip()[:THUMBNAIL_LINE_LENGTH]
+                     for line in text.splitlines()[:THUMBNAIL_LINES]]
+            return "\n".join(lines)
 
         img = Image.new("RGB", (500, 700), color="white")
         draw = ImageDraw.Draw(img)
@@ -35,5 +84,26 @@ class TextDocumentParser(DocumentParser):
         return out_path
 
     def parse(self, document_path, mime_type, file_name=None):
-        with open(document_path, 'r') as f:
-            self.text = f.read()
+        max_length = settings.TEXT_MAX_LENGTH
+        chunks = []
+        length = 0
+
+        with self._open(document_path) as f:
+            while not max_length or length < max_length:
+                size = CHUNK_SIZE
+                if max_length:
+                    size = min(size, max_length - length)
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                length += len(chunk)
+
+            if max_length and f.read(1):
+                self.log(
+                    "info",
+                    f"Only the first {max_length} characters of "
+                    f"{file_name or document_path} are stored as content."
+                )
+
+        self.text = "".join(chunks)
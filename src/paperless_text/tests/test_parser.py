@@ -1,9 +1,10 @@
 import os
+from unittest import mock
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from documents.tests.utils import DirectoriesMixin
-from paperless_text.parsers import TextDocumentParser
+from paperless_text.parsers import TextDocumentParser, detect_encoding, ENCODING_SAMPLE_SIZE
 
 
 class TestTextParser(DirectoriesMixin, TestCase):
@@ -24,3 +25,49 @@ class TestTextParser(DirectoriesMixin, TestCase):
 
         self.assertEqual(parser.get_text(), "This is a test file.\n")
         self.assertIsNone(parser.get_archive_path())
+
+    def _write_sample(self, content):
+        path = os.path.join(self.dirs.scratch_dir, "sample.txt")
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_parse_encodings(self):
+        parser = TextDocumentParser(None)
+
+        for content in ["Grüße\n".encode("utf-8"),
+                        "Grüße\n".encode("utf-8-sig"),
+                        "Grüße\n".encode("utf-16"),
+                        "Grüße\n".encode("cp1252")]:
+            parser.parse(self._write_sample(content), "text/plain")
+            self.assertEqual(parser.get_text(), "Grüße\n")
+
+    def test_parse_utf8_sample_boundary(self):
+        # The encoding sample ends in the middle of the second "ü".
+        content = b"a" * (ENCODING_SAMPLE_SIZE - 1) + "üü".encode("utf-8")
+        self.assertEqual(detect_encoding(self._write_sample(content)), "utf-8")
+
+    @override_settings(TEXT_MAX_LENGTH=10)
+    @mock.patch("paperless_text.parsers.CHUNK_SIZE", 3)
+    def test_parse_max_length(self):
+        parser = TextDocumentParser(None)
+
+        parser.parse(self._write_sample(b"0123456789abcdef"), "text/plain")
+        self.assertEqual(parser.get_text(), "0123456789")
+
+        parser.parse(self._write_sample(b"0123"), "text/plain")
+        self.assertEqual(parser.get_text(), "0123")
+
+    @override_settings(TEXT_MAX_LENGTH=0)
+    @mock.patch("paperless_text.parsers.CHUNK_SIZE", 3)
+    def test_parse_no_max_length(self):
+        parser = TextDocumentParser(None)
+
+        parser.parse(self._write_sample(b"0123456789abcdef"), "text/plain")
+        self.assertEqual(parser.get_text(), "0123456789abcdef")
+
+    def test_thumbnail_single_line(self):
+        parser = TextDocumentParser(None)
+
+        f = parser.get_thumbnail(self._write_sample(b"x" * 1000000), "text/plain")
+        self.assertTrue(os.path.isfile(f))
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("paperless.parsing.tika")
+
+CONNECT_TIMEOUT = 10
+RETRY_STATUS_CODES = (502, 503, 504)
+RETRY_BACKOFF = 1
+
+CHUNK_SIZE = 1024 * 1024
+
+METADATA_CACHE_TIMEOUT = 24 * 60 * 60
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session():
+    """
+    A session with a pool of connections to Tika and Gotenberg, shared by all
+    parsers of a worker process. Forked processes create their own session,
+    since they can't use the connections of their parent.
+    """
+    pid = os.getpid()
+    with _sessions_lock:
+        if pid not in _sessions:
+            _sessions.clear()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[pid] = session
+        return _sessions[pid]
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _check_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise Cancelled("The request was cancelled")
+
+
+class StreamedFile:
+    """
+    A request body that reads the file in chunks while it is sent, instead of
+    loading all of it into memory. Since its length is known, requests sends
+    it with a Content-Length header rather than chunked. Sending stops with
+    Cancelled once the cancelled event is set.
+    """
+
+    def __init__(self, path, head=b"", tail=b"", cancelled=None):
+        self.path = path
+        self.head = head
+        self.tail = tail
+        self.cancelled = cancelled
+
+    def __len__(self):
+        return len(self.head) + os.path.getsize(self.path) + len(self.tail)
+
+    def __iter__(self):
+        if self.head:
+            yield self.head
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                _check_cancelled(self.cancelled)
+                yield chunk
+        if self.tail:
+            yield self.tail
+
+
+def multipart_file(field, path, file_name, cancelled=None):
+    """
+    Returns a streamed multipart/form-data body with a single file, and its
+    content type.
+    """
+    boundary = uuid.uuid4().hex
+    file_name = file_name.replace('"', "%22").replace("\r", "").replace(
+        "\n", "")
+    head = (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"{field}\"; "
+        f"filename=\"{file_name}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return (StreamedFile(path, head, tail, cancelled),
+            f"multipart/form-data; boundary={boundary}")
+
+
+def request(method, url, body=None, headers=None, stream=False):
+    """
+    Send a request with the configured timeout. Connection errors, timeouts
+    and responses of overloaded servers are retried up to
+    PAPERLESS_TIKA_RETRIES times. Raises requests.RequestException if the
+    request fails in the end.
+    """
+    retries = max(settings.PAPERLESS_TIKA_RETRIES, 0)
+    timeout = (CONNECT_TIMEOUT, settings.PAPERLESS_TIKA_TIMEOUT or None)
+
+    attempt = 0
+    while True:
+        try:
+            response = get_session().request(
+                method, url, data=body, headers=headers, timeout=timeout,
+                stream=stream)
+            if response.status_code not in RETRY_STATUS_CODES or \
+                    attempt >= retries:
+                try:
+                    response.raise_for_status()
+                except requests.HTTPError:
+                    response.close()
+                    raise
+                return response
+            response.close()
+            error = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries:
+                raise
+            error = str(e)
+
+        attempt += 1
+        delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+        logger.debug(f"{method} {url} failed: {error}. Retrying in {delay} "
+                     f"seconds")
+        time.sleep(delay)
+
+
+def parse(path, mime_type=None):
+    """
+    Extract the text and metadata of a document with Tika. Returns a dict with
+    content and metadata, like tika.parser.from_file.
+    """
+    headers = {"Accept": "application/json"}
+    if mime_type:
+        headers["Content-Type"] = mime_type
+
+    response = request(
+        "PUT", settings.PAPERLESS_TIKA_ENDPOINT + "/rmeta/text",
+        StreamedFile(path), headers)
+
+    # The first entry is the document itself, the others are embedded
+    # documents.
+    content = ""
+    metadata = {}
+    for entry in response.json():
+        content += entry.pop("X-TIKA:content", None) or ""
+        for key, value in entry.items():
+            if key not in metadata:
+                metadata[key] = value
+            else:
+                if not isinstance(metadata[key], list):
+                    metadata[key] = [metadata[key]]
+                metadata[key].append(value)
+
+    return {"content": content, "metadata": metadata}
+
+
+def get_metadata(path, mime_type=None):
+    """
+    The metadata of a document, without extracting its text. Results are
+    cached for as long as the file doesn't change.
+    """
+    stat = os.stat(path)
+    key = "paperless-tika-metadata-" + hashlib.sha256(
+        f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+
+    metadata = cache.get(key)
+    if metadata is None:
+        headers = {"Accept": "application/json"}
+        if mime_type:
+            headers["Content-Type"] = mime_type
+        response = request(
+            "PUT", settings.PAPERLESS_TIKA_ENDPOINT + "/meta",
+            StreamedFile(path), headers)
+        metadata = response.json()
+        cache.set(key, metadata, METADATA_CACHE_TIMEOUT)
+
+    return metadata
+
+
+def convert_to_pdf(path, file_name, pdf_path, cancelled=None):
+    """
+    Convert a document to PDF with Gotenberg. The PDF file is written to
+    pdf_path while it is received. If the cancelled event is set, the upload
+    or download stops with Cancelled at the next chunk.
+    """
+    body, content_type = multipart_file("files", path, file_name, cancelled)
+    response = request(
+        "POST", settings.PAPERLESS_TIKA_GOTENBERG_ENDPOINT + "/convert/office",
+        body, {"Content-Type": content_type}, stream=True)
+
+    with response, open(pdf_path, "wb") as f:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            _check_cancelled(cancelled)
+            f.write(chunk)
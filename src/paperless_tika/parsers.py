@@ -1,12 +1,15 @@
 import os
-import requests
-import dateutil.parser
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import dateutil.parser
 from django.conf import settings
 
 from documents.parsers import DocumentParser, ParseError, \
     make_thumbnail_from_pdf
-from tika import parser
+from paperless_tika import client
 
 
 class TikaDocumentParser(DocumentParser):
@@ -24,9 +27,8 @@ class TikaDocumentParser(DocumentParser):
             self.archive_path, self.tempdir, self.logging_group)
 
     def extract_metadata(self, document_path, mime_type):
-        tika_server = settings.PAPERLESS_TIKA_ENDPOINT
         try:
-            parsed = parser.from_file(document_path, tika_server)
+            metadata = client.get_metadata(document_path, mime_type)
         except Exception as e:
             self.log("warning", f"Error while fetching document metadata for "
                                 f"{document_path}: {e}")
@@ -37,53 +39,74 @@ class TikaDocumentParser(DocumentParser):
                 "namespace": "",
                 "prefix": "",
                 "key": key,
-                "value": parsed['metadata'][key]
-            } for key in parsed['metadata']
+                "value": metadata[key]
+            } for key in metadata
         ]
 
     def parse(self, document_path, mime_type, file_name=None):
         self.log("info", f"Sending {document_path} to Tika server")
         tika_server = settings.PAPERLESS_TIKA_ENDPOINT
 
-        try:
-            parsed = parser.from_file(document_path, tika_server)
-        except Exception as err:
-            raise ParseError(
-                f"Could not parse {document_path} with tika server at "
-                f"{tika_server}: {err}"
-            )
-
-        self.text = parsed["content"].strip()
+        # Gotenberg doesn't need anything from Tika, so the document is
+        # converted while Tika extracts the text. The conversion gets its own
+        # directory, since it may still be running when the parser is
+        # cleaned up after Tika failed.
+        conversion_dir = tempfile.mkdtemp(
+            prefix="paperless-tika-", dir=settings.SCRATCH_DIR)
+        cancelled = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        conversion = executor.submit(
+            self.convert_to_pdf, document_path, file_name,
+            os.path.join(conversion_dir, "convert.pdf"), cancelled)
 
         try:
-            self.date = dateutil.parser.isoparse(
-                parsed["metadata"]["Creation-Date"])
-        except Exception as e:
-            self.log("warning", f"Unable to extract date for document "
-                                f"{document_path}: {e}")
-
-        self.archive_path = self.convert_to_pdf(document_path, file_name)
-
-    def convert_to_pdf(self, document_path, file_name):
-        pdf_path = os.path.join(self.tempdir, "convert.pdf")
-        gotenberg_server = settings.PAPERLESS_TIKA_GOTENBERG_ENDPOINT
-        url = gotenberg_server + "/convert/office"
+            try:
+                parsed = client.parse(document_path, mime_type)
+            except Exception as err:
+                raise ParseError(
+                    f"Could not parse {document_path} with tika server at "
+                    f"{tika_server}: {err}"
+                )
+
+            self.text = parsed["content"].strip()
+
+            try:
+                self.date = dateutil.parser.isoparse(
+                    parsed["metadata"]["Creation-Date"])
+            except Exception as e:
+                self.log("warning", f"Unable to extract date for document "
+                                    f"{document_path}: {e}")
+
+            archive_path = os.path.join(self.tempdir, "convert.pdf")
+            shutil.move(conversion.result(), archive_path)
+            self.archive_path = archive_path
+        except Exception:
+            # Stop the conversion, it's of no use anymore.
+            cancelled.set()
+            raise
+        finally:
+            # Runs right away if the conversion is done, otherwise once it
+            # has stopped.
+            conversion.add_done_callback(
+                lambda f: shutil.rmtree(conversion_dir, ignore_errors=True))
+            executor.shutdown(wait=False)
+
+    def convert_to_pdf(self, document_path, file_name, pdf_path=None,
+                       cancelled=None):
+        if not pdf_path:
+            pdf_path = os.path.join(self.tempdir, "convert.pdf")
 
         self.log("info", f"Converting {document_path} to PDF as {pdf_path}")
-        files = {"files": (file_name or os.path.basename(document_path),
-                           open(document_path, "rb"))}
-        headers = {}
 
         try:
-            response = requests.post(url, files=files, headers=headers)
-            response.raise_for_status()  # ensure we notice bad responses
+            client.convert_to_pdf(
+                document_path,
+                file_name or os.path.basename(document_path),
+                pdf_path,
+                cancelled)
         except Exception as err:
             raise ParseError(
                 f"Error while converting document to PDF: {err}"
             )
 
-        file = open(pdf_path, "wb")
-        file.write(response.content)
-        file.close()
-
         return pdf_path
@@ -1,39 +1,98 @@
 import datetime
+import json
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from unittest import mock
 
-from django.test import TestCase
-from requests import Response
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
+from documents.parsers import ParseError
+from paperless_tika import client
 from paperless_tika.parsers import TikaDocumentParser
 
 
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers like Tika and Gotenberg. Responses are taken from
+    server.responses, keyed by path, and every request is recorded in
+    server.requests.
+    """
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((self.command, self.path, self.headers, body))
+
+        responses = self.server.responses.get(self.path, [])
+        status, content = responses.pop(0) if len(responses) > 1 else responses[0]
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_PUT = _handle
+    do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
 class TestTikaParser(TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        super(TestTikaParser, cls).setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(TestTikaParser, cls).tearDownClass()
+
     def setUp(self) -> None:
+        self.server.requests = []
+        self.server.responses = {
+            "/rmeta/text": [(200, json.dumps([{
+                "X-TIKA:content": "the content",
+                "Creation-Date": "2020-11-21"
+            }]).encode())],
+            "/meta": [(200, json.dumps({
+                "Creation-Date": "2020-11-21",
+                "Some-key": "value"
+            }).encode())],
+            "/convert/office": [(200, b"PDF document")],
+        }
+        cache.clear()
+
+        settings = override_settings(
+            PAPERLESS_TIKA_ENDPOINT=self.endpoint,
+            PAPERLESS_TIKA_GOTENBERG_ENDPOINT=self.endpoint,
+            PAPERLESS_TIKA_TIMEOUT=10,
+            PAPERLESS_TIKA_RETRIES=2
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        patcher = mock.patch("paperless_tika.client.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
         self.parser = TikaDocumentParser(logging_group=None)
+        self.file = os.path.join(self.parser.tempdir, "input.odt")
+        Path(self.file).write_bytes(b"ODT document")
 
     def tearDown(self) -> None:
         self.parser.cleanup()
 
-    @mock.patch("paperless_tika.parsers.parser.from_file")
-    @mock.patch("paperless_tika.parsers.requests.post")
-    def test_parse(self, post, from_file):
-        from_file.return_value = {
-            "content": "the content",
-            "metadata": {
-                "Creation-Date": "2020-11-21"
-            }
-        }
-        response = Response()
-        response._content = b"PDF document"
-        response.status_code = 200
-        post.return_value = response
-
-        file = os.path.join(self.parser.tempdir, "input.odt")
-        Path(file).touch()
-        self.parser.parse(file, "application/vnd.oasis.opendocument.text")
+    def test_parse(self):
+        self.parser.parse(self.file, "application/vnd.oasis.opendocument.text", "my document.odt")
 
         self.assertEqual(self.parser.text, "the content")
         self.assertIsNotNone(self.parser.archive_path)
@@ -42,19 +101,133 @@ class TestTikaParser(TestCase):
 
         self.assertEqual(self.parser.date, datetime.datetime(2020, 11, 21))
 
-    @mock.patch("paperless_tika.parsers.parser.from_file")
-    def test_metadata(self, from_file):
-        from_file.return_value = {
-            "metadata": {
-                "Creation-Date": "2020-11-21",
-                "Some-key": "value"
-            }
-        }
+        requests = {path: (headers, body) for method, path, headers, body in self.server.requests}
+
+        headers, body = requests["/rmeta/text"]
+        self.assertEqual(headers["Content-Type"], "application/vnd.oasis.opendocument.text")
+        self.assertEqual(body, b"ODT document")
+
+        headers, body = requests["/convert/office"]
+        self.assertTrue(headers["Content-Type"].startswith("multipart/form-data; boundary="))
+        self.assertIn(b'filename="my document.odt"', body)
+        self.assertIn(b"\r\n\r\nODT document\r\n", body)
+
+    def test_parse_embedded_documents(self):
+        self.server.responses["/rmeta/text"] = [(200, json.dumps([
+            {"X-TIKA:content": "the content", "Content-Type": "application/zip"},
+            {"X-TIKA:content": " of the attachment", "Content-Type": "text/plain"}
+        ]).encode())]
+
+        parsed = client.parse(self.file)
 
-        file = os.path.join(self.parser.tempdir, "input.odt")
-        Path(file).touch()
+        self.assertEqual(parsed["content"], "the content of the attachment")
+        self.assertEqual(parsed["metadata"]["Content-Type"], ["application/zip", "text/plain"])
 
-        metadata = self.parser.extract_metadata(file, "application/vnd.oasis.opendocument.text")
+    def test_parse_tika_error(self):
+        self.server.responses["/rmeta/text"] = [(422, b"")]
+
+        self.assertRaises(ParseError, self.parser.parse, self.file, "application/vnd.oasis.opendocument.text")
+
+    def test_parse_tika_error_slow_conversion(self):
+        self.server.responses["/rmeta/text"] = [(422, b"")]
+        writing = threading.Event()
+        proceed = threading.Event()
+        finished = threading.Event()
+        self.addCleanup(proceed.set)
+        conversions = []
+
+        def convert(path, file_name, pdf_path, cancelled):
+            # A conversion that is busy writing when Tika fails.
+            conversions.append((os.path.dirname(pdf_path), cancelled))
+            try:
+                with open(pdf_path, "wb") as f:
+                    f.write(b"PDF")
+                    writing.set()
+                    proceed.wait(10)
+                    f.write(b" document")
+                raise client.Cancelled("The request was cancelled")
+            finally:
+                finished.set()
+
+        with mock.patch("paperless_tika.client.convert_to_pdf", side_effect=convert):
+            start = time.monotonic()
+            self.assertRaises(ParseError, self.parser.parse, self.file, "application/vnd.oasis.opendocument.text")
+            self.assertTrue(writing.wait(5))
+            conversion_dir, cancelled = conversions[0]
+            self.assertTrue(cancelled.is_set())
+
+            # The parser doesn't wait for the conversion to stop, and can be
+            # cleaned up while the conversion is still writing.
+            self.parser.cleanup()
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertFalse(finished.is_set())
+            self.assertTrue(os.path.isdir(conversion_dir))
+
+            proceed.set()
+            self.assertTrue(finished.wait(5))
+
+        self.parser = TikaDocumentParser(logging_group=None)
+
+        # The conversion cleans up after itself.
+        for i in range(50):
+            if not os.path.isdir(conversion_dir):
+                break
+            time.sleep(0.1)
+        self.assertFalse(os.path.isdir(conversion_dir))
+
+    def test_cancel_upload(self):
+        cancelled = threading.Event()
+        body, content_type = client.multipart_file("files", self.file, "input.odt", cancelled)
+        cancelled.set()
+
+        self.assertRaises(client.Cancelled, list, body)
+
+    def test_parse_gotenberg_error(self):
+        self.server.responses["/convert/office"] = [(500, b"")]
+
+        self.assertRaises(ParseError, self.parser.parse, self.file, "application/vnd.oasis.opendocument.text")
+
+    def test_retry(self):
+        self.server.responses["/convert/office"] = [(503, b""), (503, b""), (200, b"PDF document")]
+
+        path = self.parser.convert_to_pdf(self.file, None)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"PDF document")
+        self.assertEqual(len(self.server.requests), 3)
+        # The file is sent again every time.
+        self.assertIn(b"ODT document", self.server.requests[2][3])
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [1, 2])
+
+    @override_settings(PAPERLESS_TIKA_RETRIES=1)
+    def test_retry_exhausted(self):
+        self.server.responses["/convert/office"] = [(503, b""), (503, b""), (200, b"PDF document")]
+
+        self.assertRaises(ParseError, self.parser.convert_to_pdf, self.file, None)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_metadata(self):
+        metadata = self.parser.extract_metadata(self.file, "application/vnd.oasis.opendocument.text")
 
         self.assertTrue("Creation-Date" in [m['key'] for m in metadata])
         self.assertTrue("Some-key" in [m['key'] for m in metadata])
+
+        # Metadata is cached until the file changes.
+        self.assertEqual(self.parser.extract_metadata(self.file, "application/vnd.oasis.opendocument.text"), metadata)
+        self.assertEqual(len(self.server.requests), 1)
+
+        Path(self.file).write_bytes(b"Changed ODT document")
+        self.parser.extract_metadata(self.file, "application/vnd.oasis.opendocument.text")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_metadata_error(self):
+        self.server.responses["/meta"] = [(500, b"")]
+
+        self.assertEqual(self.parser.extract_metadata(self.file, "application/vnd.oasis.opendocument.text"), [])
+
+    def test_session_per_process(self):
+        session = client.get_session()
+        self.assertIs(client.get_session(), session)
+
+        with mock.patch("paperless_tika.client.os.getpid", return_value=os.getpid() + 1):
+            self.assertIsNot(client.get_session(), session)